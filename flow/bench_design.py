@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+#
+# Generate synthetic but self-consistent VPR artifacts (.eblif, .net, .place, .route) for bitgen benchmarking
+#
+
+import argparse
+import os
+import random
+import re
+import heapq
+from params import Params
+
+# Same enum values as in bitgen.py
+DIR_UP      = 0
+DIR_DOWN    = 1
+DIR_LEFT    = 2
+DIR_RIGHT   = 3
+
+CHANX       = 0
+CHANY       = 1
+
+# Search window margins (in tiles) tried by the maze router, sink is replaced by local connection after the last one
+ROUTE_MARGINS = (2, 8)
+
+# Write params file copy with overridden fabric size, returns its name
+def WriteSizedParams(src_cfg, dst_cfg, size_x, size_y):
+    with open(src_cfg, "r") as f:
+        cfg = f.read()
+    cfg = re.sub(r"^FPGA_FABRIC_SIZE_X\s*=.*$", "FPGA_FABRIC_SIZE_X  = " + str(size_x), cfg, count=1, flags=re.M)
+    cfg = re.sub(r"^FPGA_FABRIC_SIZE_Y\s*=.*$", "FPGA_FABRIC_SIZE_Y  = " + str(size_y), cfg, count=1, flags=re.M)
+    with open(dst_cfg, "w") as f:
+        f.write(cfg)
+    return dst_cfg
+
+
+# "XxY" string to (X, Y)
+def ParseSize(size):
+    s = size.lower().split("x")
+    if len(s) != 2:
+        raise ValueError("Fabric size should be XxY:", size)
+    return int(s[0]), int(s[1])
+
+
+class Bench_design(object):
+    # Attributes:
+    # p
+    # rnd
+    # sx, sy
+    # cells         - {(x, y): [cell or None] * CELLS_PER_BLOCK}
+    # nets          - {net: [driver, [sinks]]}
+    # inpads/outpads/clocks - {name: (x, y, sub)}
+    # used_chans    - set of occupied chan nodes
+
+    def __init__(self, p, util, seed):
+        self.p = p
+        self.rnd = random.Random(seed)
+        self.sx = p.FPGA_FABRIC_SIZE_X
+        self.sy = p.FPGA_FABRIC_SIZE_Y
+        self.util = util
+        self.cells = {}
+        self.nets = {}
+        self.inpads = {}
+        self.outpads = {}
+        self.clock = "clk"
+        self.binputs = {}
+        self.binputs_used = {}
+        self.routes = {}
+        self.used_chans = set()
+        self.rr_pins = None     # pin node id -> (kind, x, y, pin) when rr graph is written
+        self.pad_slots = []
+        for x in range(1, self.sx-1):
+            for y in (0, self.sy-1):
+                self.pad_slots += [(x, y, s) for s in range(p.PINS_PER_PAD)]
+        for y in range(1, self.sy-1):
+            for x in (0, self.sx-1):
+                self.pad_slots += [(x, y, s) for s in range(p.PINS_PER_PAD)]
+        self.rnd.shuffle(self.pad_slots)
+        self.steps = self.StepTable()
+
+    ####################### Netlist generation #######################
+
+    def Generate(self):
+        p = self.p
+        rnd = self.rnd
+        positions = [(x, y) for x in range(1, self.sx-1) for y in range(1, self.sy-1)]
+        rnd.shuffle(positions)
+        nblocks = max(1, int(len(positions) * self.util))
+        blocks = sorted(positions[:nblocks])
+
+        # cells with output nets
+        drivers = []
+        n = 0
+        for b in blocks:
+            lst = [None] * p.CELLS_PER_BLOCK
+            # at least 2 cells, so an unroutable input can always be replaced by a local one
+            ncells = rnd.randint(min(2, p.CELLS_PER_BLOCK), p.CELLS_PER_BLOCK)
+            for c in rnd.sample(range(p.CELLS_PER_BLOCK), ncells):
+                cell = {"lut": "n" + str(n), "reg": rnd.random() < 0.3, "wire": False, "const": None,
+                        "inputs": [None] * p.FPGA_LUT_WIDTH, "rot": [None] * p.FPGA_LUT_WIDTH, "cover": []}
+                if cell["reg"] and rnd.random() < 0.15:
+                    cell["wire"] = True
+                cell["out"] = ("q" + str(n)) if cell["reg"] else cell["lut"]
+                lst[c] = cell
+                drivers.append((b, c))
+                n += 1
+            self.cells[b] = lst
+
+        # a couple of constant generators
+        if len(drivers) > 4:
+            for const in ("$true", "$false"):
+                b, c = drivers[rnd.randrange(len(drivers))]
+                cell = self.cells[b][c]
+                if cell["const"] or cell["wire"]:
+                    continue
+                cell["const"] = const
+                cell["lut"] = const
+                cell["out"] = ("q" + const[1:]) if cell["reg"] else const
+
+        # input pads
+        ninpads = max(1, min(len(self.pad_slots) // 3, len(drivers) // 8 + 1))
+        for i in range(ninpads):
+            self.inpads["in" + str(i)] = self.pad_slots.pop()
+        self.inpads[self.clock] = self.pad_slots.pop()
+        pad_names = [n for n in self.inpads if n != self.clock]
+
+        for name, slot in self.inpads.items():
+            if name != self.clock:
+                self.nets[name] = [("pad", slot), []]
+        for b, c in drivers:
+            self.nets[self.cells[b][c]["out"]] = [("cell", b, c), []]
+
+        # connect cell inputs
+        for b, c in drivers:
+            cell = self.cells[b][c]
+            if cell["const"]:
+                continue
+            k = 1 if cell["wire"] else rnd.randint(1, p.FPGA_LUT_WIDTH)
+            phys = sorted(rnd.sample(range(p.FPGA_LUT_WIDTH), k))
+            rnd.shuffle(phys)
+            for logic, pin in enumerate(phys):
+                cell["rot"][pin] = logic
+                src = self.PickDriver(b, c, drivers, pad_names)
+                cell["inputs"][pin] = src
+                self.nets[src][1].append(("cell", b, c, pin))
+            if not cell["wire"]:
+                cell["cover"] = self.RandomCover(k)
+
+        # output pads
+        noutpads = max(1, min(len(self.pad_slots) // 2, len(drivers) // 8 + 1))
+        for b, c in rnd.sample(drivers, min(noutpads, len(drivers))):
+            net = self.cells[b][c]["out"]
+            name = "out:" + net
+            self.outpads[name] = self.pad_slots.pop()
+            self.nets[net][1].append(("pad", name))
+
+    def PickDriver(self, b, c, drivers, pad_names):
+        rnd = self.rnd
+        r = rnd.random()
+        if r < 0.1:
+            return self.NearPad(b, pad_names)
+        if r < 0.35:
+            local = [i for i in range(self.p.CELLS_PER_BLOCK) if (i != c) and self.cells[b][i]]
+            if local:
+                return self.cells[b][rnd.choice(local)]["out"]
+        # nearby block
+        for attempt in range(20):
+            x = b[0] + rnd.randint(-3, 3)
+            y = b[1] + rnd.randint(-3, 3)
+            if ((x, y) != b) and ((x, y) in self.cells):
+                lst = [i for i in range(self.p.CELLS_PER_BLOCK) if self.cells[(x, y)][i]]
+                return self.cells[(x, y)][rnd.choice(lst)]["out"]
+        ob, oc = drivers[rnd.randrange(len(drivers))]
+        if ob == b and oc == c:
+            return self.NearPad(b, pad_names)
+        return self.cells[ob][oc]["out"]
+
+    # Closest of a few random input pads, keeps pad channels from congesting on big fabrics
+    def NearPad(self, b, pad_names):
+        best = None
+        for i in range(8):
+            name = pad_names[self.rnd.randrange(len(pad_names))]
+            slot = self.inpads[name]
+            dist = abs(slot[0] - b[0]) + abs(slot[1] - b[1])
+            if (best is None) or (dist < best[0]):
+                best = (dist, name)
+        return best[1]
+
+    def RandomCover(self, k):
+        rows = []
+        for i in range(self.rnd.randint(1, min(4, 1 << k))):
+            rows.append("".join(self.rnd.choice("01-") for j in range(k)))
+        return rows
+
+    ########################## Routing ###########################
+
+    # Track on destination wire for Wilton switch (mirrors bitgen CheckSwitch)
+    def TurnTrack(self, sdir, mux, strack):
+        p = self.p
+        T = p.TRACKS_PER_RNODE
+        if mux == p.FORWARD_MUX_START:
+            e = strack
+        elif sdir == DIR_UP:
+            e = strack + 1 if mux == p.LEFT_MUX_START else (T-2) - strack
+        elif sdir == DIR_DOWN:
+            e = strack + 1 if mux == p.LEFT_MUX_START else 0 - strack
+        elif sdir == DIR_RIGHT:
+            e = 0 - strack if mux == p.LEFT_MUX_START else strack - 1
+        else:
+            e = (T-2) - strack if mux == p.LEFT_MUX_START else strack - 1
+        return e % T
+
+    # For every wire direction: list of (chan type, dx, dy, direction, destination track for each source track)
+    def StepTable(self):
+        p = self.p
+        steps = {
+            DIR_RIGHT : [(CHANX, 1, 0, DIR_RIGHT), (CHANY, 0, 1, DIR_UP), (CHANY, 0, 0, DIR_DOWN)],
+            DIR_LEFT  : [(CHANX, -1, 0, DIR_LEFT), (CHANY, -1, 1, DIR_UP), (CHANY, -1, 0, DIR_DOWN)],
+            DIR_UP    : [(CHANY, 0, 1, DIR_UP), (CHANX, 1, 0, DIR_RIGHT), (CHANX, 0, 0, DIR_LEFT)],
+            DIR_DOWN  : [(CHANY, 0, -1, DIR_DOWN), (CHANX, 1, -1, DIR_RIGHT), (CHANX, 0, -1, DIR_LEFT)] }
+        table = dict()
+        for d, lst in steps.items():
+            table[d] = []
+            for nt, dx, dy, nd in lst:
+                if nd == d:
+                    mux = p.FORWARD_MUX_START
+                elif (d, nd) in ((DIR_UP, DIR_RIGHT), (DIR_DOWN, DIR_LEFT), (DIR_LEFT, DIR_UP), (DIR_RIGHT, DIR_DOWN)):
+                    mux = p.RIGHT_MUX_START
+                else:
+                    mux = p.LEFT_MUX_START
+                table[d].append((nt, dx, dy, nd, [self.TurnTrack(d, mux, tr) for tr in range(p.TRACKS_PER_RNODE)]))
+        return table
+
+    # Chans adjacent to a tile side: returns [(chantype, x, y)]
+    def BlockChans(self, b, side=None):
+        x, y = b
+        chans = [(CHANX, x, y), (CHANY, x, y), (CHANX, x, y-1), (CHANY, x-1, y)]
+        if side is not None:
+            return [chans[side]]
+        return chans
+
+    def PadChan(self, slot):
+        x, y, s = slot
+        if x == 0:
+            return (CHANY, 0, y)
+        if x == self.sx-1:
+            return (CHANY, self.sx-2, y)
+        if y == 0:
+            return (CHANX, x, 0)
+        return (CHANX, x, self.sy-2)
+
+    # Nodes pad pin drives (tracks 2s, 2s+1) or its output mux reads (tracks s, s+8), as in IoInFrm & BlkInputReduction of RTL
+    def PadNodes(self, slot, output):
+        p = self.p
+        s = slot[2]
+        if output:
+            return [n for n in self.ChanNodes(self.PadChan(slot)) if n[4] % p.BLOCK_IN_MUXES_COEF == s]
+        return [n for n in self.ChanNodes(self.PadChan(slot)) if n[4] // 2 == s]
+
+    # Nodes logic block input k is connected to (side k % 4, tracks of mux step k // 4, fc_in of arch)
+    def BlockInputNodes(self, b, k):
+        p = self.p
+        step = (k // p.BLOCK_SIDES) // (p.BLOCK_IN_PERSIDE // p.BLOCK_IN_MUXES_COEF)
+        return [n for n in self.ChanNodes(self.BlockChans(b, k % p.BLOCK_SIDES)[0]) if n[4] % p.BLOCK_IN_MUXES_COEF == step]
+
+    def ChanNodes(self, c):
+        t, x, y = c
+        dirs = (DIR_LEFT, DIR_RIGHT) if t == CHANX else (DIR_UP, DIR_DOWN)
+        return [(t, x, y, d, tr) for d in dirs for tr in range(self.p.TRACKS_PER_RNODE)]
+
+    # Greedy best-first maze search towards tile (tx, ty), path quality does not matter for benchmarks
+    def Route(self, starts, targets, tree, bbox, tx, ty):
+        targets = set(n for n in targets if n not in self.used_chans or n in tree)
+        used = self.used_chans
+        prev = {}
+        q = []
+        for i, n in enumerate(starts):
+            if n in prev:
+                continue
+            if (n in used) and (n not in tree):
+                continue
+            prev[n] = None
+            q.append((abs(n[1]-tx) + abs(n[2]-ty), i, n))
+        heapq.heapify(q)
+        order = len(q)
+        x0, y0, x1, y1 = bbox
+        x0 = max(x0, 0)
+        y0 = max(y0, 0)
+        x1 = min(x1, self.sx-2)
+        y1 = min(y1, self.sy-2)
+        steps = self.steps
+        while q:
+            n = heapq.heappop(q)[2]
+            if n in targets:
+                path = []
+                while n is not None:
+                    path.append(n)
+                    n = prev[n]
+                return path[::-1]
+            # window is clipped to fabric, only the low chan end needs a check
+            for nt, dx, dy, nd, tracks in steps[n[3]]:
+                mx = n[1] + dx
+                my = n[2] + dy
+                if (mx < x0) or (mx > x1) or (my < y0) or (my > y1) or ((mx if nt == CHANX else my) < 1):
+                    continue
+                m = (nt, mx, my, nd, tracks[n[4]])
+                if (m in prev) or (m in used) or (m in tree):
+                    continue
+                prev[m] = n
+                order += 1
+                heapq.heappush(q, (abs(mx-tx) + abs(my-ty), order, m))
+        return None
+
+    def RouteNet(self, name):
+        driver, sinks = self.nets[name]
+        if driver[0] == "pad":
+            opin_starts = self.PadNodes(driver[1], False)
+            sx, sy = driver[1][0], driver[1][1]
+        else:
+            b, c = driver[1], driver[2]
+            opin_starts = self.ChanNodes(self.BlockChans(b, c % 4)[0])
+            sx, sy = b
+        self.rnd.shuffle(opin_starts)
+
+        failed = []
+        tree = {}       # chan node -> order
+        branches = []   # list of (branch_point or None, [chan nodes], sink)
+        bbox = [sx, sy, sx, sy]
+        for sink in sinks:
+            inputs = {}     # target node -> block input it reaches
+            if sink[0] == "cell":
+                b = sink[1]
+                if (driver[0] == "cell") and (driver[1] == b):
+                    continue    # local crossbar connection, no routing
+                key = (b, name, sink[3])
+                for k in ([self.binputs[key]] if key in self.binputs else self.FreeBlockInputs(b, sink[3])):
+                    for n in self.BlockInputNodes(b, k):
+                        inputs[n] = k
+                targets = list(inputs)
+                tx, ty = b
+            else:
+                slot = self.outpads[sink[1]]
+                targets = self.PadNodes(slot, True)
+                tx, ty = slot[0], slot[1]
+            tree_starts = list(tree.keys())
+            path = None
+            for margin in ROUTE_MARGINS:
+                box = (min(bbox[0], tx)-margin, min(bbox[1], ty)-margin, max(bbox[2], tx)+margin, max(bbox[3], ty)+margin)
+                path = self.Route(tree_starts + opin_starts, targets, tree, box, tx, ty)
+                if path:
+                    break
+            if not path:
+                failed.append(sink)
+                continue
+            if sink[0] == "cell":
+                self.binputs[key] = inputs[path[-1]]
+                self.binputs_used.setdefault(b, set()).add(inputs[path[-1]])
+            if path[0] in tree:
+                branch = path[0]
+                new = path[1:]
+            else:
+                branch = None
+                new = path
+            for n in new:
+                tree[n] = len(tree)
+                self.used_chans.add(n)
+            bbox = [min(bbox[0], tx), min(bbox[1], ty), max(bbox[2], tx), max(bbox[3], ty)]
+            branches.append((branch, new, sink))
+        self.routes[name] = branches
+        return failed
+
+    # Block inputs in crossbar range of cell input 'pin' not taken by other nets
+    def FreeBlockInputs(self, b, pin):
+        used = self.binputs_used.get(b, ())
+        rng = int(self.p.LBCROSS_INPUTS)
+        return [i for i in range(pin*rng, (pin+1)*rng) if i not in used]
+
+    # Block inputs are allocated by router, each one is reachable from few tracks of one block side only
+    def RouteAll(self):
+        for name in self.nets:
+            if self.nets[name][1]:
+                for sink in self.RouteNet(name):
+                    self.Unroutable(name, sink)
+
+    # Replace connection which failed to route with a local one (or drop the output pad)
+    def Unroutable(self, net, sink):
+        self.nets[net][1].remove(sink)
+        if sink[0] == "pad":
+            del self.outpads[sink[1]]
+            return
+        # failed sink has no block input allocated, as it would be reached by tree of the net otherwise
+        b, c, pin = sink[1], sink[2], sink[3]
+        local = [i for i in range(self.p.CELLS_PER_BLOCK) if (i != c) and self.cells[b][i]]
+        if not local:
+            raise ValueError("Failed to route net", net, "- try lower utilization")
+        src = self.cells[b][self.rnd.choice(local)]["out"]
+        self.cells[b][c]["inputs"][pin] = src
+        self.nets[src][1].append(sink)
+
+    ########################### Output ###########################
+
+    def NodeId(self, n):
+        t, x, y, d, tr = n
+        T = self.p.TRACKS_PER_RNODE
+        dec = 1 if d in (DIR_LEFT, DIR_DOWN) else 0
+        if self.rr_pins is not None:
+            # with rr graph direction is not encoded in node id parity, like in VPR versions numbering nodes differently
+            return (((t*self.sx + x)*self.sy + y)*2 + dec)*T + tr
+        return (((t*self.sx + x)*self.sy + y)*T + tr)*2 + dec
+
+    def PinId(self, x, y, pin, kind):
+        base = 2*2*self.sx*self.sy*self.p.TRACKS_PER_RNODE
+        node = base + ((x*self.sy + y)*64 + pin)*4 + kind
+        if self.rr_pins is not None:
+            self.rr_pins[node] = (kind, x, y, pin)
+        return node
+
+    # Nodes used by routes in VPR --write_rr_graph format (edges are not written), call after WriteRoute
+    def WriteRrGraph(self, fname):
+        kinds = ["SOURCE", "OPIN", "IPIN", "SINK"]
+        with open(fname, "w") as f:
+            f.write('<rr_graph tool_name="vpr" tool_version="bench_design" tool_comment="synthetic">\n  <rr_nodes>\n')
+            for n in sorted(self.used_chans, key=self.NodeId):
+                t, x, y, d, tr = n
+                dec = d in (DIR_LEFT, DIR_DOWN)
+                f.write('    <node id="%d" type="%s" direction="%s" capacity="1">\n' % (self.NodeId(n), "CHANX" if t == CHANX else "CHANY", "DEC_DIR" if dec else "INC_DIR"))
+                f.write('      <loc xlow="%d" ylow="%d" xhigh="%d" yhigh="%d" ptc="%d"/>\n' % (x, y, x, y, 2*tr + dec))
+                f.write('      <timing R="0" C="0"/>\n      <segment segment_id="0"/>\n    </node>\n')
+            for node in sorted(self.rr_pins):
+                kind, x, y, pin = self.rr_pins[node]
+                side = ' side="TOP"' if kinds[kind] in ("IPIN", "OPIN") else ''
+                f.write('    <node id="%d" type="%s" capacity="1">\n' % (node, kinds[kind]))
+                f.write('      <loc xlow="%d" ylow="%d" xhigh="%d" yhigh="%d"%s ptc="%d"/>\n' % (x, y, x, y, side, pin))
+                f.write('      <timing R="0" C="0"/>\n    </node>\n')
+            f.write('  </rr_nodes>\n  <rr_edges>\n  </rr_edges>\n</rr_graph>\n')
+
+    def ChanLine(self, n):
+        t, x, y, d, tr = n
+        ptc = 2*tr + (1 if d in (DIR_LEFT, DIR_DOWN) else 0)
+        return "Node:\t%d\t%6s (%d,%d)  Track: %d  Switch: 0\n" % (self.NodeId(n), "CHANX" if t == CHANX else "CHANY", x, y, ptc)
+
+    def WriteRoute(self, fname, basename):
+        p = self.p
+        with open(fname, "w") as f:
+            f.write("Placement_File: %s.place Placement_ID: SHA256:0\n" % basename)
+            f.write("Array size: %d x %d logic blocks.\n\nRouting:\n" % (self.sx, self.sy))
+            i = 0
+            for name in self.nets:
+                driver, sinks = self.nets[name]
+                branches = self.routes.get(name, [])
+                if not any(br[1] or br[0] for br in branches):
+                    continue
+                f.write("\nNet %d (%s)\n\n" % (i, name))
+                i += 1
+                if driver[0] == "pad":
+                    x, y, s = driver[1]
+                    src = "Node:\t%d\t%6s (%d,%d)  Pad: %d  Switch: 0\n" % (self.PinId(x, y, 3*s+1, 0), "SOURCE", x, y, 3*s+1)
+                    opin = "Node:\t%d\t%6s (%d,%d)  Pad: %d  io.inpad[0] Switch: 0\n" % (self.PinId(x, y, 3*s+1, 1), "OPIN", x, y, 3*s+1)
+                else:
+                    (x, y), c = driver[1], driver[2]
+                    pin = p.BLOCK_INPUTS + c
+                    src = "Node:\t%d\t%6s (%d,%d)  Class: %d  Switch: 0\n" % (self.PinId(x, y, pin, 0), "SOURCE", x, y, pin)
+                    opin = "Node:\t%d\t%6s (%d,%d)  Pin: %d  fpga_logic_block.logic_o[%d] Switch: 0\n" % (self.PinId(x, y, pin, 1), "OPIN", x, y, pin, c)
+                first = True
+                for branch, new, sink in branches:
+                    if first:
+                        f.write(src)
+                        f.write(opin)
+                        first = False
+                    elif branch is None:
+                        f.write(opin)
+                    else:
+                        f.write(self.ChanLine(branch))
+                    for n in new:
+                        f.write(self.ChanLine(n))
+                    if sink[0] == "cell":
+                        (x, y), pin = sink[1], self.binputs[(sink[1], name, sink[3])]
+                        f.write("Node:\t%d\t%6s (%d,%d)  Pin: %d  fpga_logic_block.logic_i[%d] Switch: 1\n" % (self.PinId(x, y, pin, 2), "IPIN", x, y, pin, pin))
+                        f.write("Node:\t%d\t%6s (%d,%d)  Class: %d  Switch: -1\n" % (self.PinId(x, y, pin, 3), "SINK", x, y, pin))
+                    else:
+                        x, y, s = self.outpads[sink[1]]
+                        f.write("Node:\t%d\t%6s (%d,%d)  Pad: %d  io.outpad[0] Switch: 1\n" % (self.PinId(x, y, 3*s, 2), "IPIN", x, y, 3*s))
+                        f.write("Node:\t%d\t%6s (%d,%d)  Pad: %d  Switch: -1\n" % (self.PinId(x, y, 3*s, 3), "SINK", x, y, 3*s))
+            # global clock net
+            f.write("\n\nNet %d (%s): global net connecting:\n\n" % (i, self.clock))
+            x, y, s = self.inpads[self.clock]
+            f.write("Block %s (#%d) at (%d, %d), Pin class %d.\n" % (self.clock, 0, x, y, 1))
+            for n, (b, lst) in enumerate(sorted(self.cells.items())):
+                if any(c and c["reg"] for c in lst):
+                    f.write("Block %s (#%d) at (%d, %d), Pin class %d.\n" % (self.BlockName(b), n+1, b[0], b[1], 16))
+
+    def BlockName(self, b):
+        for c in self.cells[b]:
+            if c:
+                return c["lut"] if not c["wire"] else c["out"]
+
+    def WritePlace(self, fname, basename):
+        with open(fname, "w") as f:
+            f.write("Netlist_File: %s.net Netlist_ID: SHA256:0\n" % basename)
+            f.write("Array size: %d x %d logic blocks\n\n" % (self.sx, self.sy))
+            f.write("#block name\tx\ty\tsubblk\tblock number\n#----------\t--\t--\t------\t------------\n")
+            n = 0
+            for b in sorted(self.cells):
+                f.write("%s\t%d\t%d\t%d\t#%d\n" % (self.BlockName(b), b[0], b[1], 0, n))
+                n += 1
+            for name, slot in list(self.inpads.items()) + list(self.outpads.items()):
+                f.write("%s\t%d\t%d\t%d\t#%d\n" % (name, slot[0], slot[1], slot[2], n))
+                n += 1
+
+    def WriteBlif(self, fname, basename):
+        with open(fname, "w") as f:
+            f.write("# Generated by bench_design.py\n\n.model %s\n" % basename)
+            f.write(".inputs " + " ".join(self.inpads) + "\n")
+            f.write(".outputs " + " ".join(n[4:] for n in self.outpads) + "\n")
+            f.write(".names $false\n.names $true\n1\n.names $undef\n")
+            for b in sorted(self.cells):
+                for cell in self.cells[b]:
+                    if (not cell) or cell["const"]:
+                        continue
+                    ins = [None] * self.p.FPGA_LUT_WIDTH
+                    for pin, logic in enumerate(cell["rot"]):
+                        if logic is not None:
+                            ins[logic] = cell["inputs"][pin]
+                    ins = [i for i in ins if i is not None]
+                    if cell["wire"]:
+                        f.write(".latch %s %s re %s 2\n" % (ins[0], cell["out"], self.clock))
+                        continue
+                    f.write(".names " + " ".join(ins + [cell["lut"]]) + "\n")
+                    for row in cell["cover"]:
+                        f.write(row + " 1\n")
+                    if cell["reg"]:
+                        f.write(".latch %s %s re %s 2\n" % (cell["lut"], cell["out"], self.clock))
+            for b in sorted(self.cells):
+                for cell in self.cells[b]:
+                    if cell and cell["const"] and cell["reg"]:
+                        f.write(".latch %s %s re %s 2\n" % (cell["lut"], cell["out"], self.clock))
+            f.write(".end\n")
+
+    def WriteNet(self, fname, basename):
+        p = self.p
+        with open(fname, "w") as f:
+            f.write('<?xml version="1.0"?>\n')
+            f.write('<block name="%s.net" instance="FPGA_packed_netlist[0]" architecture_id="SHA256:0" atom_netlist_id="SHA256:0">\n' % basename)
+            f.write("\t<inputs>%s</inputs>\n\t<outputs>%s</outputs>\n\t<clocks>%s</clocks>\n" % (" ".join(self.inpads), " ".join(self.outpads), self.clock))
+            block_nets = dict()
+            for (b, net, pin), i in self.binputs.items():
+                block_nets.setdefault(b, []).append((i, net))
+            n = 0
+            for b in sorted(self.cells):
+                binputs = ["open"] * p.BLOCK_INPUTS
+                for i, net in block_nets.get(b, []):
+                    binputs[i] = net
+                outs = ["open"] * p.BLOCK_OUTPUTS
+                for c, cell in enumerate(self.cells[b]):
+                    if cell:
+                        outs[c] = "fpga_logic_cell[%d].out[0]-&gt;clbouts1" % c
+                f.write('\t<block name="%s" instance="fpga_logic_block[%d]" mode="fpga_logic_block">\n' % (self.BlockName(b), n))
+                f.write('\t\t<inputs>\n\t\t\t<port name="logic_i">%s</port>\n\t\t</inputs>\n' % " ".join(binputs))
+                f.write('\t\t<outputs>\n\t\t\t<port name="logic_o">%s</port>\n\t\t</outputs>\n' % " ".join(outs))
+                f.write('\t\t<clocks>\n\t\t\t<port name="clk">%s</port>\n\t\t</clocks>\n' % self.clock)
+                for c, cell in enumerate(self.cells[b]):
+                    if not cell:
+                        f.write('\t\t<block name="open" instance="fpga_logic_cell[%d]"/>\n' % c)
+                        continue
+                    self.WriteCell(f, b, c, cell)
+                f.write("\t</block>\n")
+                n += 1
+            for name, slot in self.inpads.items():
+                f.write('\t<block name="%s" instance="io[%d]" mode="inpad">\n' % (name, n))
+                f.write('\t\t<inputs>\n\t\t\t<port name="outpad">open</port>\n\t\t</inputs>\n')
+                f.write('\t\t<outputs>\n\t\t\t<port name="inpad">inpad[0].inpad[0]-&gt;inpad</port>\n\t\t</outputs>\n')
+                f.write('\t\t<clocks>\n\t\t\t<port name="clock">open</port>\n\t\t</clocks>\n')
+                f.write('\t\t<block name="%s" instance="inpad[0]">\n\t\t\t<attributes/>\n\t\t\t<parameters/>\n\t\t\t<inputs/>\n' % name)
+                f.write('\t\t\t<outputs>\n\t\t\t\t<port name="inpad">%s</port>\n\t\t\t</outputs>\n\t\t\t<clocks/>\n\t\t</block>\n\t</block>\n' % name)
+                n += 1
+            for name, slot in self.outpads.items():
+                f.write('\t<block name="%s" instance="io[%d]" mode="outpad">\n' % (name, n))
+                f.write('\t\t<inputs>\n\t\t\t<port name="outpad">%s</port>\n\t\t</inputs>\n' % name[4:])
+                f.write('\t\t<outputs>\n\t\t\t<port name="inpad">open</port>\n\t\t</outputs>\n')
+                f.write('\t\t<clocks>\n\t\t\t<port name="clock">open</port>\n\t\t</clocks>\n')
+                f.write('\t\t<block name="%s" instance="outpad[0]">\n\t\t\t<attributes/>\n\t\t\t<parameters/>\n' % name)
+                f.write('\t\t\t<inputs>\n\t\t\t\t<port name="outpad">io.outpad[0]-&gt;outpad</port>\n\t\t\t</inputs>\n\t\t\t<outputs/>\n\t\t\t<clocks/>\n\t\t</block>\n\t</block>\n')
+                n += 1
+            f.write("</block>\n")
+
+    def WriteCell(self, f, b, c, cell):
+        p = self.p
+        W = p.FPGA_LUT_WIDTH
+        ins = []
+        for pin in range(W):
+            src = cell["inputs"][pin]
+            if src is None:
+                ins.append("open")
+            elif (self.nets[src][0][0] == "cell") and (self.nets[src][0][1] == b):
+                ins.append("fpga_logic_cell[%d].out[0]-&gt;crossbar_%d" % (self.nets[src][0][2], c*W+pin))
+            else:
+                ins.append("fpga_logic_block.logic_i[%d]-&gt;crossbar_%d" % (self.binputs[(b, src, pin)], c*W+pin))
+        out = "fpga_register[0].Q[0]-&gt;mux1" if cell["reg"] else "fpga_lut[0].out[0]-&gt;mux1"
+        f.write('\t\t<block name="%s" instance="fpga_logic_cell[%d]" mode="n1_lut4">\n' % (cell["out"], c))
+        f.write('\t\t\t<inputs>\n\t\t\t\t<port name="in">%s</port>\n\t\t\t</inputs>\n' % " ".join(ins))
+        f.write('\t\t\t<outputs>\n\t\t\t\t<port name="out">%s</port>\n\t\t\t</outputs>\n' % out)
+        f.write('\t\t\t<clocks>\n\t\t\t\t<port name="clk">%s</port>\n\t\t\t</clocks>\n' % ("fpga_logic_block.clk[0]-&gt;clks" if cell["reg"] else "open"))
+        cin = ["fpga_logic_cell.in[%d]-&gt;direct1" % i if cell["inputs"][i] is not None else "open" for i in range(W)]
+        if cell["wire"]:
+            f.write('\t\t\t<block name="%s" instance="fpga_lut[0]" mode="wire">\n' % cell["inputs"][cell["rot"].index(0)])
+            f.write('\t\t\t\t<inputs>\n\t\t\t\t\t<port name="in">%s</port>\n\t\t\t\t</inputs>\n' % " ".join(cin))
+            f.write('\t\t\t\t<outputs>\n\t\t\t\t\t<port name="out">fpga_lut[0].in[%d]-&gt;wire</port>\n\t\t\t\t</outputs>\n\t\t\t\t<clocks/>\n\t\t\t</block>\n' % cell["rot"].index(0))
+        else:
+            f.write('\t\t\t<block name="%s" instance="fpga_lut[0]" mode="fpga_lut">\n' % cell["lut"])
+            f.write('\t\t\t\t<inputs>\n\t\t\t\t\t<port name="in">%s</port>\n\t\t\t\t</inputs>\n' % " ".join(cin))
+            f.write('\t\t\t\t<outputs>\n\t\t\t\t\t<port name="out">fpga_lut[0].out[0]-&gt;fpga_lut</port>\n\t\t\t\t</outputs>\n\t\t\t\t<clocks/>\n')
+            f.write('\t\t\t\t<block name="%s" instance="fpga_lut[0]">\n\t\t\t\t\t<attributes/>\n\t\t\t\t\t<parameters/>\n' % cell["lut"])
+            lins = [cell["inputs"][i] if cell["inputs"][i] is not None else "open" for i in range(W)]
+            f.write('\t\t\t\t\t<inputs>\n\t\t\t\t\t\t<port name="in">%s</port>\n' % " ".join(lins))
+            if not cell["const"]:
+                rot = [str(r) if r is not None else "open" for r in cell["rot"]]
+                f.write('\t\t\t\t\t\t<port_rotation_map name="in">%s</port_rotation_map>\n' % " ".join(rot))
+            f.write('\t\t\t\t\t</inputs>\n\t\t\t\t\t<outputs>\n\t\t\t\t\t\t<port name="out">%s</port>\n\t\t\t\t\t</outputs>\n\t\t\t\t\t<clocks/>\n\t\t\t\t</block>\n\t\t\t</block>\n' % cell["lut"])
+        if cell["reg"]:
+            f.write('\t\t\t<block name="%s" instance="fpga_register[0]" mode="fpga_register">\n' % cell["out"])
+            f.write('\t\t\t\t<inputs>\n\t\t\t\t\t<port name="D">fpga_lut[0].out[0]-&gt;direct2</port>\n\t\t\t\t</inputs>\n')
+            f.write('\t\t\t\t<outputs>\n\t\t\t\t\t<port name="Q">%s</port>\n\t\t\t\t</outputs>\n' % cell["out"])
+            f.write('\t\t\t\t<clocks>\n\t\t\t\t\t<port name="clk">fpga_logic_cell.clk[0]-&gt;direct3</port>\n\t\t\t\t</clocks>\n\t\t\t</block>\n')
+        f.write('\t\t</block>\n')
+
+    def Write(self, basename, rr_graph = False):
+        name = os.path.basename(basename)
+        if rr_graph:
+            self.rr_pins = dict()
+        self.WriteBlif(basename + ".eblif", name)
+        self.WriteNet(basename + ".net", name)
+        self.WritePlace(basename + ".place", name)
+        self.WriteRoute(basename + ".route", name)
+        if rr_graph:
+            self.WriteRrGraph(basename + "_rr.xml")
+
+
+# Generate design into out_dir unless it is already there, returns (params file, base name)
+def GenerateDesign(params_file, out_dir, size_x, size_y, util, seed = 1, name = "bench", rr_graph = False):
+    os.makedirs(out_dir, exist_ok=True)
+    cfg = WriteSizedParams(params_file, os.path.join(out_dir, "params.cfg"), size_x, size_y)
+    basename = os.path.join(out_dir, name)
+    if not all(os.path.exists(basename + ext) for ext in DesignFiles(rr_graph)):
+        d = Bench_design(Params(cfg), util, seed)
+        d.Generate()
+        d.RouteAll()
+        d.Write(basename, rr_graph)
+    return cfg, basename
+
+
+# Suffixes of generated files
+def DesignFiles(rr_graph = False):
+    return [".eblif", ".net", ".place", ".route"] + (["_rr.xml"] if rr_graph else [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic VPR artifacts for bitgen benchmarking")
+    parser.add_argument("params_file", type=str, help="FPGA params file")
+    parser.add_argument("out_dir", type=str, help="Output directory")
+    parser.add_argument("--size", type=str, default="", help="Fabric size as XxY (default from params file)")
+    parser.add_argument("--util", type=float, default=0.5, help="Logic block utilization (0..1)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--name", type=str, default="bench", help="Design name")
+    parser.add_argument("--rr_graph", action="store_true", help="Also write rr graph of used nodes (<name>_rr.xml), node ids do not follow direction parity then")
+    args = parser.parse_args()
+
+    if args.size:
+        sx, sy = ParseSize(args.size)
+    else:
+        p = Params(args.params_file)
+        sx, sy = p.FPGA_FABRIC_SIZE_X, p.FPGA_FABRIC_SIZE_Y
+    # always regenerate when called directly
+    for ext in DesignFiles(True):
+        if os.path.exists(os.path.join(args.out_dir, args.name + ext)):
+            os.remove(os.path.join(args.out_dir, args.name + ext))
+    cfg, basename = GenerateDesign(args.params_file, args.out_dir, sx, sy, args.util, args.seed, args.name, args.rr_graph)
+    print("Generated", basename, "for", cfg)
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
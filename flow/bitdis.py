@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+#
+# Bitstream disassembler: rebuild fabric config from .bit or .ubit image & diff images
+#
+# Inverse of Fpga_fabric.WriteBitstream. Chains are decoded as a whole: bitlines of all
+# chain lines are laid out tile after tile & every bit plane of equal width fields is
+# turned into integer lanes at once.
+#
+# Decoded config holds mux states as written to fabric, so for all-ones fields it is not
+# known if mux was left unused: routing node tracks become -1 if mux has less inputs
+# than all-ones state, IO muxes are taken as outputs unless all-ones.
+#
+
+import argparse
+import array
+import collections
+import sys
+import time
+from params import Params
+from bitfile import Bitfile_parser, IsBitfile, WordBytes, WORD_FMT
+from bitgen import Fabric_config, Fpga_fabric, DirToText, DIR_UP, DIR_DOWN, DIR_LEFT, DIR_RIGHT, CHAIN_NAMES
+
+# One difference of two configs
+Config_diff = collections.namedtuple("Config_diff", "kind x y field a b")
+
+
+# Values of fields of given width packed back to back in bitline string (first bit of a field is LSB)
+def BitFields(bits, width):
+    n = len(bits) // width
+    if (width > 64):
+        return [int(bits[i:i + width][::-1], 2) for i in range(0, n * width, width)]
+    lane = WordBytes(width)
+    zero = bytes(lane)
+    one = b"\x01" + bytes(lane - 1)
+    total = 0
+    for j in range(width):
+        # bit j of every field as little-endian lane, lanes never carry into each other
+        plane = bits[j::width].encode().replace(b"0", zero).replace(b"1", one)
+        total += int.from_bytes(plane, "little") << j
+    data = memoryview(total.to_bytes(n * lane, "little"))
+    if (sys.byteorder == "little"):
+        return data.cast(WORD_FMT[lane]).tolist()
+    return [int.from_bytes(data[i:i + lane], "little") for i in range(0, len(data), lane)]
+
+
+# Per-cycle column strings of every chain (bit of line N is character N) joined, from .bit or .ubit image
+def ImageColumns(fname, p):
+    lines = (p.FPGA_FABRIC_SIZE_X-2, p.FPGA_FABRIC_SIZE_Y-2, p.FPGA_FABRIC_SIZE_X-2)
+    lens = (p.BLOCK_CFGCHAIN_LEN, p.VRNODE_CFGCHAIN_LEN, p.HRNODE_CFGCHAIN_LEN)
+    if IsBitfile(fname):
+        bitfile = Bitfile_parser(fname)
+        bitfile.CheckParams(p)
+        data = []
+        for chain in range(bitfile.Chains()):
+            n = bitfile.chains[chain][0]
+            fmt = "0" + str(n) + "b"
+            data.append("".join(format(w, fmt)[::-1] for w in bitfile.Words(chain)) if n else "")
+    else:
+        columns = ([], [], [])
+        with open(fname) as f:
+            for line in f:
+                for c, col in zip(columns, line.rstrip("\n").split(" ")):
+                    if col:
+                        c.append(col)
+        data = ["".join(c) for c in columns]
+
+    for name, d, n, length in zip(CHAIN_NAMES, data, lines, lens):
+        if (len(d) != n * length):
+            raise ValueError("Wrong size of", name, "chain in", fname, ":", len(d), "bits, expected", n * length)
+    return data, lines
+
+
+# Bitlines of all chain lines one after another from joined columns
+def ChainBitlines(data, lines):
+    return "".join(data[l::lines] for l in range(lines))
+
+
+# Slices [start:start+size] of every record of string, joined
+def Gather(bits, start, size, stride):
+    return "".join(bits[i:i + size] for i in range(start, len(bits), stride))
+
+
+class Bitstream_decoder(object):
+    # Attributes:
+    #
+    # p
+    # size_x
+    # size_y
+    # config (Fabric_config being rebuilt)
+
+    def __init__(self, p):
+        self.p = p
+        self.size_x = p.FPGA_FABRIC_SIZE_X
+        self.size_y = p.FPGA_FABRIC_SIZE_Y
+
+    # Decode image file & return fabric model
+    def Decode(self, fname):
+        data, lines = ImageColumns(fname, self.p)
+        self.config = Fabric_config(self.p, self.size_x, self.size_y)
+        self.DecodeBlocks(ChainBitlines(data[0], lines[0]))
+        self.DecodeNodes(ChainBitlines(data[1], lines[1]), (DIR_UP, DIR_DOWN))
+        self.DecodeNodes(ChainBitlines(data[2], lines[2]), (DIR_LEFT, DIR_RIGHT))
+        return Fpga_fabric(self.p, self.size_x, self.size_y, self.config)
+
+    # lblock chain: line per column of logic blocks, blocks from bottom up
+    def DecodeBlocks(self, bits):
+        p = self.p
+        cfg = self.config
+        blocks_y = self.size_y-2
+        binputs_w = p.BINPUT_MUX_STATE_WDT * p.BLOCK_INPUTS
+        cross_w = p.LBCROSS_MUX_STATE_WDT * p.CELL_INPUTS * p.CELLS_PER_BLOCK
+        cell_w = p.FPGA_LUT_SIZE + 1
+        tile_w = binputs_w + cross_w + cell_w * p.CELLS_PER_BLOCK
+        if (tile_w * blocks_y != p.BLOCK_CFGCHAIN_LEN):
+            raise ValueError("Logic block config size", tile_w, "does not match chain length", p.BLOCK_CFGCHAIN_LEN)
+
+        binputs = BitFields(Gather(bits, 0, binputs_w, tile_w), p.BINPUT_MUX_STATE_WDT)
+        binputs = array.array('h', [v * p.BLOCK_IN_MUXES_COEF for v in binputs])
+        cross = array.array('b', BitFields(Gather(bits, binputs_w, cross_w, tile_w), p.LBCROSS_MUX_STATE_WDT))
+        cells = Gather(bits, binputs_w + cross_w, cell_w * p.CELLS_PER_BLOCK, tile_w)
+        luts = BitFields(Gather(cells, 0, p.FPGA_LUT_SIZE, cell_w), p.FPGA_LUT_SIZE)
+        luts = list(luts) if isinstance(cfg.cell_lut, list) else array.array(cfg.cell_lut.typecode, luts)
+        muxes = array.array('b', BitFields(cells[p.FPGA_LUT_SIZE::cell_w], 1))
+
+        # blocks of a column are consecutive tiles in config too
+        column_tiles = blocks_y
+        column_cells = column_tiles * p.CELLS_PER_BLOCK
+        for i in range(self.size_x-2):
+            tile = cfg.Tile(i+1, 1)
+            cell = tile * p.CELLS_PER_BLOCK
+            cfg.block_inputs[tile * p.BLOCK_INPUTS:(tile + column_tiles) * p.BLOCK_INPUTS] = binputs[i * column_tiles * p.BLOCK_INPUTS:(i+1) * column_tiles * p.BLOCK_INPUTS]
+            cfg.cell_inputs[cell * p.CELL_INPUTS:(cell + column_cells) * p.CELL_INPUTS] = cross[i * column_cells * p.CELL_INPUTS:(i+1) * column_cells * p.CELL_INPUTS]
+            cfg.cell_lut[cell:cell + column_cells] = luts[i * column_cells:(i+1) * column_cells]
+            cfg.cell_mux[cell:cell + column_cells] = muxes[i * column_cells:(i+1) * column_cells]
+
+    # vnode / hnode chain: line per row / column of routing nodes between IO blocks of both ends
+    def DecodeNodes(self, bits, directions):
+        p = self.p
+        cfg = self.config
+        io_w = p.BINPUT_MUX_STATE_WDT * p.PINS_PER_PAD
+        node_w = p.RNODE_MUX_STATE_WDT * p.TRACKS_PER_RNODE
+        vertical = (directions[0] == DIR_UP)
+        if vertical:
+            nlines, nodes = self.size_y-2, self.size_x-1
+        else:
+            nlines, nodes = self.size_x-2, self.size_y-1
+        line_w = 2 * io_w + 2 * nodes * node_w
+        if (line_w * nlines != len(bits)):
+            raise ValueError("Routing node line size", line_w, "does not match chain length", len(bits) // max(nlines, 1))
+
+        tracks = BitFields(Gather(bits, io_w, line_w - 2 * io_w, line_w), p.RNODE_MUX_STATE_WDT)
+        ones = (1 << p.RNODE_MUX_STATE_WDT) - 1
+        if (p.RNODE_INPUTS <= ones):
+            tracks = [-1 if t == ones else t for t in tracks]
+        tracks = array.array('h', tracks)
+        n = p.TRACKS_PER_RNODE
+        for l in range(nlines):
+            for i in range(nodes):
+                for k, direction in enumerate(directions):
+                    # nodes grid is [x][y] for both chains
+                    x, y = (i, l) if vertical else (l, i)
+                    dst = (x * cfg.rnode_size_y[direction] + y) * n
+                    src = ((l * nodes + i) * 2 + k) * n
+                    cfg.rnode_tracks[direction][dst:dst + n] = tracks[src:src + n]
+
+        ios = BitFields(Gather(bits, 0, io_w, line_w) + Gather(bits, line_w - io_w, io_w, line_w), p.BINPUT_MUX_STATE_WDT)
+        ones = (1 << p.BINPUT_MUX_STATE_WDT) - 1
+        for l in range(nlines):
+            if vertical:
+                ends = ((0, l+1), (self.size_x-1, l+1))
+            else:
+                ends = ((l+1, 0), (l+1, self.size_y-1))
+            for end, (x, y) in enumerate(ends):
+                tile = cfg.Tile(x, y)
+                states = ios[(end * nlines + l) * p.PINS_PER_PAD:(end * nlines + l + 1) * p.PINS_PER_PAD]
+                # muxes are written in reversed pin order
+                for pin, state in enumerate(reversed(states)):
+                    if (state != ones):
+                        cfg.io_tracks[tile * p.PINS_PER_PAD + pin] = state * p.BLOCK_IN_MUXES_COEF
+                        cfg.SetLabel(("io_mode", tile, pin), "outpad")
+
+
+# Decode .bit or .ubit image into fabric model
+def Disassemble(p, fname):
+    return Bitstream_decoder(p).Decode(fname)
+
+
+# Field value as written to bitstream (negative ones are all-ones)
+def Written(values, width):
+    mask = (1 << width) - 1
+    return [v & mask for v in values]
+
+
+# Differences of fabric settings as written to bitstream, list of Config_diff
+def DiffFabrics(a, b):
+    p = a.p
+    bw, rw = p.BINPUT_MUX_STATE_WDT, p.RNODE_MUX_STATE_WDT
+    ca, cb = a.config, b.config
+    r = []
+    for x in range(1, a.SizeX()-1):
+        for y in range(1, a.SizeY()-1):
+            tile = ca.Tile(x, y)
+            cells = slice(tile * p.CELLS_PER_BLOCK, (tile+1) * p.CELLS_PER_BLOCK)
+            cross = slice(cells.start * p.CELL_INPUTS, cells.stop * p.CELL_INPUTS)
+            # raw arrays are compared first, only differing blocks are looked at
+            if (ca.block_inputs[tile * p.BLOCK_INPUTS:(tile+1) * p.BLOCK_INPUTS] == cb.block_inputs[tile * p.BLOCK_INPUTS:(tile+1) * p.BLOCK_INPUTS]) and \
+                (ca.cell_inputs[cross] == cb.cell_inputs[cross]) and (ca.cell_lut[cells] == cb.cell_lut[cells]) and (ca.cell_mux[cells] == cb.cell_mux[cells]):
+                continue
+            ba, bb = a.fabric[x][y], b.fabric[x][y]
+            for i, (u, v) in enumerate(zip(Written(ba.GetBInputs(), bw), Written(bb.GetBInputs(), bw))):
+                if (u != v):
+                    r.append(Config_diff("lblock", x, y, "binput " + str(i), u, v))
+            for cell_a, cell_b in zip(ba.cells, bb.cells):
+                c = "cell " + str(cell_a.cell_num)
+                for i, (u, v) in enumerate(zip(cell_a.GetInputs(), cell_b.GetInputs())):
+                    if (u != v):
+                        r.append(Config_diff("lblock", x, y, c + " input " + str(i), u, v))
+                if (cell_a.lut != cell_b.lut):
+                    r.append(Config_diff("lblock", x, y, c + " lut", cell_a.lut, cell_b.lut))
+                if (cell_a.mux != cell_b.mux):
+                    r.append(Config_diff("lblock", x, y, c + " mux", cell_a.mux, cell_b.mux))
+
+    for x in range(a.SizeX()):
+        for y in range(a.SizeY()):
+            if a.IsIoBlock(x, y):
+                # muxes depend on pad modes too
+                ma = Written(reversed(list(a.fabric[x][y].GetIOMuxes())), bw)
+                mb = Written(reversed(list(b.fabric[x][y].GetIOMuxes())), bw)
+                for pin, (u, v) in enumerate(zip(ma, mb)):
+                    if (u != v):
+                        r.append(Config_diff("io", x, y, "pin " + str(pin), u, v))
+
+    n = p.TRACKS_PER_RNODE
+    for direction, grid_a, grid_b in ((DIR_UP, a.routing_u, b.routing_u), (DIR_DOWN, a.routing_d, b.routing_d),
+            (DIR_LEFT, a.routing_l, b.routing_l), (DIR_RIGHT, a.routing_r, b.routing_r)):
+        ta, tb = ca.rnode_tracks[direction], cb.rnode_tracks[direction]
+        size_y = ca.rnode_size_y[direction]
+        for i in range(0, len(ta), n):
+            if (ta[i:i + n] == tb[i:i + n]):
+                continue
+            node = grid_a[i // n // size_y][i // n % size_y]
+            for t, (u, v) in enumerate(zip(Written(ta[i:i + n], rw), Written(tb[i:i + n], rw))):
+                if (u != v):
+                    r.append(Config_diff("rnode " + DirToText(direction), node.coord.x, node.coord.y, "track " + str(t), u, v))
+    return r
+
+
+def PrintDiff(diffs, f = sys.stdout):
+    for d in diffs:
+        if d.field.endswith("lut"):
+            print("{} [{},{}] {}: 0x{:X} -> 0x{:X}".format(d.kind, d.x, d.y, d.field, d.a, d.b), file = f)
+        else:
+            print("{} [{},{}] {}: {} -> {}".format(d.kind, d.x, d.y, d.field, d.a, d.b), file = f)
+
+
+################################# MAIN #################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild FPGA config from bitstream & compare bitstreams")
+    parser.add_argument("arch_params_file", type=str, help="FPGA parameters cfg file")
+    parser.add_argument("image", type=str, help="Bitstream, .bit or .ubit")
+    parser.add_argument("--txt", type=str, default="", help="Print rebuilt config to this file (same format as bitgen output, without names)")
+    parser.add_argument("--diff", type=str, default="", help="Print differences from this bitstream, exit code is 1 if there are any")
+    args = parser.parse_args()
+
+    p = Params(args.arch_params_file)
+    start = time.perf_counter()
+    fabric = Disassemble(p, args.image)
+    print("Decoded", args.image, "in {:.3f} s".format(time.perf_counter() - start), file = sys.stderr)
+    if args.txt:
+        with open(args.txt, "w") as f:
+            fabric.Print(f)
+    if args.diff:
+        diffs = DiffFabrics(Disassemble(p, args.diff), fabric)
+        PrintDiff(diffs)
+        print(len(diffs), "differences", file = sys.stderr)
+        if diffs:
+            sys.exit(1)
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
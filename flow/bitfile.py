@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+#
+# Packed binary bitstream container (.ubit)
+#
+# Layout (little-endian):
+#   header: magic, version, chain count, fabric size X & Y, params hash
+#   chain table: parallel lines, length (shift cycles), word bytes, encoding, data offset for every chain
+#   data: per-cycle words of every chain (bit N of a word is line N), 8 byte aligned
+#   trailer: CRC32 of everything before it
+#
+# Packed chain (encoding 1, container version 2) is a stream of units of max(word bytes, 2) bytes:
+#   period P of default words, line mask, P bits of default words (0 or mask) in ceil(P / unit bits) units,
+#   then tokens until chain length is reached, token is op in bits 15:14 & count in bits 13:0:
+#     0 - count default words (default of cycle i is bit i % P), 1 - next unit repeated count times, 2 - count literal units
+#
+# Delta against a base container (.udelta), same layout rules:
+#   header: magic, version, chain count, changed chain count, fabric size X & Y, params hash, CRC32 of base & of target container
+#   chain table: chain index, word bytes, parallel lines, length, range count, offset of range table, CRC32 of target words
+#     for every chain which differs from base
+#   range table: first cycle, cycle count, data offset of every run of differing cycles
+#   data: target words of ranges
+#   trailer: CRC32 of everything before it
+#
+
+import hashlib
+import mmap
+import struct
+import sys
+import zlib
+
+BITFILE_MAGIC   = b"UFPGABIT"
+BITFILE_VERSION = 1
+# version of containers with packed chains, so older loaders reject them
+BITFILE_VERSION_PACKED = 2
+
+ENCODING_RAW    = 0
+ENCODING_PACKED = 1
+
+PACK_DEFAULT    = 0
+PACK_REPEAT     = 1
+PACK_LITERAL    = 2
+PACK_MAX_COUNT  = 0x3FFF
+
+HEADER_FMT  = "<8sHHHH32s"
+CHAIN_FMT   = "<IIHHI"
+CRC_FMT     = "<I"
+
+DELTA_MAGIC     = b"UFPGADLT"
+DELTA_VERSION   = 1
+
+DELTA_HEADER_FMT    = "<8sHHHHH32sII"
+DELTA_CHAIN_FMT     = "<HHIIIII"
+DELTA_RANGE_FMT     = "<III"
+
+# memoryview cast formats for word sizes
+WORD_FMT = {1 : 'B', 2 : 'H', 4 : 'I', 8 : 'Q'}
+
+
+# Hash of FPGA parameters bitstream was generated for
+def ParamsHash(p):
+    h = hashlib.sha256()
+    for key in sorted(p.fpga_config_calc):
+        h.update((key + "=" + str(p.fpga_config_calc[key]) + "\n").encode())
+    return h.digest()
+
+
+# Smallest power of 2 bytes word holding all parallel lines of chain
+def WordBytes(lines):
+    n = 1
+    while (n * 8) < lines:
+        n *= 2
+    return n
+
+
+def Align(n, a = 8):
+    return (n + a - 1) // a * a
+
+
+# Smallest period of sequence (prefix function)
+def Period(seq):
+    pi = [0] * len(seq)
+    for i in range(1, len(seq)):
+        k = pi[i-1]
+        while k and (seq[i] != seq[k]):
+            k = pi[k-1]
+        if (seq[i] == seq[k]):
+            k += 1
+        pi[i] = k
+    return len(seq) - pi[-1] if seq else 0
+
+
+# Pack chain words against default words (words of unconfigured fabric).
+# Returns list of units or None if defaults are not 0 or all lines set.
+def PackWords(words, defaults, lines, wbytes):
+    mask = (1 << lines) - 1
+    if any((d != 0) and (d != mask) for d in defaults):
+        return None
+    unit_bits = max(wbytes, 2) * 8
+    bits = [1 if d else 0 for d in defaults]
+    period = Period(bits)
+    units = [period, mask]
+    for i in range(0, period, unit_bits):
+        units.append(sum(b << j for j, b in enumerate(bits[i:i + unit_bits])))
+
+    n = len(words)
+    literals = []
+
+    def FlushLiterals():
+        for i in range(0, len(literals), PACK_MAX_COUNT):
+            chunk = literals[i:i + PACK_MAX_COUNT]
+            units.append((PACK_LITERAL << 14) | len(chunk))
+            units.extend(chunk)
+        del literals[:]
+
+    i = 0
+    while i < n:
+        j = i
+        while (j < n) and (words[j] == defaults[j]):
+            j += 1
+        if (j > i):
+            FlushLiterals()
+            for k in range(i, j, PACK_MAX_COUNT):
+                units.append((PACK_DEFAULT << 14) | min(PACK_MAX_COUNT, j - k))
+            i = j
+            continue
+        while (j < n) and (words[j] == words[i]):
+            j += 1
+        # repeat token costs 2 units
+        if (j - i >= 3):
+            FlushLiterals()
+            for k in range(i, j, PACK_MAX_COUNT):
+                units.append((PACK_REPEAT << 14) | min(PACK_MAX_COUNT, j - k))
+                units.append(words[i])
+            i = j
+        else:
+            literals.append(words[i])
+            i += 1
+    FlushLiterals()
+    return units
+
+
+# Unpack length words of chain from units (reference decoder, same as one in C headers)
+def UnpackWords(units, length, wbytes):
+    unit_bits = max(wbytes, 2) * 8
+    period, mask = units[0], units[1]
+    dict_units = units[2:2 + (period + unit_bits - 1) // unit_bits]
+    defaults = [mask if (dict_units[i // unit_bits] >> (i % unit_bits)) & 1 else 0 for i in range(period)]
+    pos = 2 + len(dict_units)
+    words = []
+    while (len(words) < length):
+        op, count = units[pos] >> 14, units[pos] & PACK_MAX_COUNT
+        pos += 1
+        if (op == PACK_DEFAULT):
+            phase = len(words) % period
+            while (count > 0):
+                n = min(count, period - phase)
+                words.extend(defaults[phase:phase + n])
+                count -= n
+                phase = 0
+        elif (op == PACK_REPEAT):
+            words.extend([units[pos]] * count)
+            pos += 1
+        elif (op == PACK_LITERAL):
+            words.extend(units[pos:pos + count])
+            pos += count
+        else:
+            raise ValueError("Unknown packed chain token", hex(units[pos-1]))
+    if (len(words) != length):
+        raise ValueError("Packed chain has", len(words), "words, expected", length)
+    return words
+
+
+# Write container, chains is a list of (lines, words) with one integer word per shift cycle.
+# Chains are packed against defaults (list of default words of every chain) when given & it makes them shorter.
+def WriteBitfile(fname, p, size_x, size_y, chains, defaults = None):
+    table = b""
+    data = []
+    packed = False
+    offset = Align(struct.calcsize(HEADER_FMT) + struct.calcsize(CHAIN_FMT) * len(chains))
+    for i, (lines, words) in enumerate(chains):
+        wbytes = WordBytes(lines)
+        encoding = ENCODING_RAW
+        if defaults is not None:
+            units = PackWords(words, defaults[i], lines, wbytes)
+            if (units is not None) and (len(units) * max(wbytes, 2) < len(words) * wbytes):
+                encoding = ENCODING_PACKED
+                packed = True
+                chunk = b"".join(u.to_bytes(max(wbytes, 2), "little") for u in units)
+        if (encoding == ENCODING_RAW):
+            chunk = b"".join(w.to_bytes(wbytes, "little") for w in words)
+        table += struct.pack(CHAIN_FMT, lines, len(words), wbytes, encoding, offset)
+        chunk += bytes(Align(len(chunk)) - len(chunk))
+        data.append(chunk)
+        offset += len(chunk)
+
+    header = struct.pack(HEADER_FMT, BITFILE_MAGIC, BITFILE_VERSION_PACKED if packed else BITFILE_VERSION, len(chains), size_x, size_y, ParamsHash(p))
+    body = header + table
+    body += bytes(Align(len(body)) - len(body))
+    body += b"".join(data)
+    with open(fname, "wb") as f:
+        f.write(body)
+        f.write(struct.pack(CRC_FMT, zlib.crc32(body)))
+
+
+# Check file starts with container magic
+def IsBitfile(fname):
+    with open(fname, "rb") as f:
+        return f.read(len(BITFILE_MAGIC)) == BITFILE_MAGIC
+
+
+class Bitfile_parser(object):
+    # Container is mapped into memory & raw chain words are returned as zero-copy views
+    # Attributes:
+    # size_x
+    # size_y
+    # params_hash
+    # chains (list of (lines, length, word bytes, offset, encoding))
+    # buf
+    # unpacked (words of packed chains by index, unpacked on first use)
+
+    def __init__(self, fname, use_mmap = True):
+        with open(fname, "rb") as f:
+            if use_mmap:
+                self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buf = f.read()
+
+        hsize = struct.calcsize(HEADER_FMT)
+        csize = struct.calcsize(CRC_FMT)
+        if (len(self.buf) < hsize + csize):
+            raise ValueError("Bitfile", fname, "is too short!")
+        magic, version, nchains, self.size_x, self.size_y, self.params_hash = struct.unpack_from(HEADER_FMT, self.buf, 0)
+        if (magic != BITFILE_MAGIC):
+            raise ValueError("Not a bitfile:", fname)
+        if (version not in (BITFILE_VERSION, BITFILE_VERSION_PACKED)):
+            raise ValueError("Unsupported bitfile version", version, "in", fname)
+
+        # integrity check
+        crc, = struct.unpack_from(CRC_FMT, self.buf, len(self.buf) - csize)
+        if (zlib.crc32(memoryview(self.buf)[:len(self.buf) - csize]) != crc):
+            raise ValueError("CRC error in bitfile", fname)
+
+        self.chains = []
+        self.unpacked = dict()
+        for i in range(nchains):
+            lines, length, wbytes, encoding, offset = struct.unpack_from(CHAIN_FMT, self.buf, hsize + i * struct.calcsize(CHAIN_FMT))
+            if (encoding not in (ENCODING_RAW, ENCODING_PACKED)) or ((encoding == ENCODING_PACKED) and (version != BITFILE_VERSION_PACKED)):
+                raise ValueError("Unsupported encoding", encoding, "of chain", i, "in", fname)
+            if (offset + (length * wbytes if encoding == ENCODING_RAW else 0) > len(self.buf) - csize):
+                raise ValueError("Chain", i, "is out of bitfile", fname)
+            self.chains.append((lines, length, wbytes, offset, encoding))
+
+    # Raise if bitfile was generated for other FPGA parameters
+    def CheckParams(self, p):
+        if (self.params_hash != ParamsHash(p)):
+            raise ValueError("Bitfile was generated for different FPGA parameters!")
+
+    def Chains(self):
+        return len(self.chains)
+
+    # Per-cycle words of chain
+    def Words(self, chain):
+        lines, length, wbytes, offset, encoding = self.chains[chain]
+        if (encoding == ENCODING_PACKED):
+            if chain not in self.unpacked:
+                self.unpacked[chain] = UnpackWords(self.Units(chain), length, wbytes)
+            return self.unpacked[chain]
+        data = memoryview(self.buf)[offset:offset + length * wbytes]
+        if (sys.byteorder == "little") and (wbytes in WORD_FMT):
+            return data.cast(WORD_FMT[wbytes])
+        return [int.from_bytes(data[i:i + wbytes], "little") for i in range(0, len(data), wbytes)]
+
+    # Units of packed chain, they run until data of next chain or trailer
+    def Units(self, chain):
+        lines, length, wbytes, offset, encoding = self.chains[chain]
+        end = min([c[3] for c in self.chains if c[3] > offset] + [len(self.buf) - struct.calcsize(CRC_FMT)])
+        usize = max(wbytes, 2)
+        data = memoryview(self.buf)[offset:end]
+        return [int.from_bytes(data[i:i + usize], "little") for i in range(0, len(data) - usize + 1, usize)]
+
+    # Little-endian bytes of chain words, as in raw chain
+    def ChainBytes(self, chain):
+        lines, length, wbytes, offset, encoding = self.chains[chain]
+        if (encoding == ENCODING_PACKED):
+            return b"".join(w.to_bytes(wbytes, "little") for w in self.Words(chain))
+        return memoryview(self.buf)[offset:offset + length * wbytes]
+
+    # Text bitline of chain for shift cycle (same as in .bit file)
+    def Bitline(self, chain, cycle):
+        lines = self.chains[chain][0]
+        return format(self.Words(chain)[cycle], "0" + str(lines) + "b")[::-1] if lines else ""
+
+    # CRC32 stored in trailer (identifies whole container)
+    def Crc(self):
+        return struct.unpack_from(CRC_FMT, self.buf, len(self.buf) - struct.calcsize(CRC_FMT))[0]
+
+
+# Runs of differing cycles as (first, count), runs closer than a range table entry are merged
+def DiffRanges(base, target, wbytes):
+    gap = max(1, struct.calcsize(DELTA_RANGE_FMT) // wbytes)
+    ranges = []
+    for i in range(len(target)):
+        if (base[i] == target[i]):
+            continue
+        if ranges and (i - (ranges[-1][0] + ranges[-1][1]) <= gap):
+            ranges[-1][1] = i - ranges[-1][0] + 1
+        else:
+            ranges.append([i, 1])
+    return [tuple(r) for r in ranges]
+
+
+# Compare target container with base one & write delta of chains which differ.
+# Returns list of (chain, length, ranges) of changed chains, it is the reload sequence.
+def WriteDelta(fname, base, target):
+    if (base.params_hash != target.params_hash) or ((base.size_x, base.size_y) != (target.size_x, target.size_y)):
+        raise ValueError("Base bitfile was generated for different FPGA!")
+    if (base.Chains() != target.Chains()):
+        raise ValueError("Base bitfile has", base.Chains(), "chains, expected", target.Chains())
+
+    changed = []
+    for chain in range(target.Chains()):
+        lines, length, wbytes = target.chains[chain][:3]
+        if (base.chains[chain][:3] != (lines, length, wbytes)):
+            raise ValueError("Chain", chain, "of base bitfile has different size!")
+        ranges = DiffRanges(base.Words(chain), target.Words(chain), wbytes)
+        if ranges:
+            changed.append((chain, length, ranges))
+
+    header = struct.pack(DELTA_HEADER_FMT, DELTA_MAGIC, DELTA_VERSION, target.Chains(), len(changed), target.size_x, target.size_y,
+        target.params_hash, base.Crc(), target.Crc())
+    range_offset = len(header) + struct.calcsize(DELTA_CHAIN_FMT) * len(changed)
+    data_offset = Align(range_offset + struct.calcsize(DELTA_RANGE_FMT) * sum(len(ranges) for chain, length, ranges in changed))
+
+    table = b""
+    range_table = b""
+    data = []
+    for chain, length, ranges in changed:
+        lines, length, wbytes = target.chains[chain][:3]
+        words = target.ChainBytes(chain)
+        table += struct.pack(DELTA_CHAIN_FMT, chain, wbytes, lines, length, len(ranges), range_offset, zlib.crc32(words))
+        range_offset += struct.calcsize(DELTA_RANGE_FMT) * len(ranges)
+        for first, count in ranges:
+            range_table += struct.pack(DELTA_RANGE_FMT, first, count, data_offset)
+            chunk = bytes(words[first * wbytes:(first + count) * wbytes])
+            chunk += bytes(Align(len(chunk)) - len(chunk))
+            data.append(chunk)
+            data_offset += len(chunk)
+
+    body = header + table + range_table
+    body += bytes(Align(len(body)) - len(body))
+    body += b"".join(data)
+    with open(fname, "wb") as f:
+        f.write(body)
+        f.write(struct.pack(CRC_FMT, zlib.crc32(body)))
+    return changed
+
+
+# Check file starts with delta magic
+def IsDelta(fname):
+    with open(fname, "rb") as f:
+        return f.read(len(DELTA_MAGIC)) == DELTA_MAGIC
+
+
+class Delta_parser(object):
+    # Delta is applied to base container, only changed chains need to be shifted in again
+    # Attributes:
+    # size_x
+    # size_y
+    # params_hash
+    # base_crc
+    # target_crc
+    # nchains (chain count of base & target)
+    # chains (list of (chain, lines, length, word bytes, ranges, words CRC32) of changed chains,
+    #   ranges are (first cycle, count, data offset))
+    # buf
+
+    def __init__(self, fname):
+        with open(fname, "rb") as f:
+            self.buf = f.read()
+
+        hsize = struct.calcsize(DELTA_HEADER_FMT)
+        csize = struct.calcsize(CRC_FMT)
+        if (len(self.buf) < hsize + csize):
+            raise ValueError("Delta", fname, "is too short!")
+        magic, version, self.nchains, nchanged, self.size_x, self.size_y, self.params_hash, self.base_crc, self.target_crc = \
+            struct.unpack_from(DELTA_HEADER_FMT, self.buf, 0)
+        if (magic != DELTA_MAGIC):
+            raise ValueError("Not a bitstream delta:", fname)
+        if (version != DELTA_VERSION):
+            raise ValueError("Unsupported delta version", version, "in", fname)
+
+        crc, = struct.unpack_from(CRC_FMT, self.buf, len(self.buf) - csize)
+        if (zlib.crc32(memoryview(self.buf)[:len(self.buf) - csize]) != crc):
+            raise ValueError("CRC error in delta", fname)
+
+        self.chains = []
+        for i in range(nchanged):
+            chain, wbytes, lines, length, nranges, range_offset, words_crc = struct.unpack_from(DELTA_CHAIN_FMT, self.buf, hsize + i * struct.calcsize(DELTA_CHAIN_FMT))
+            ranges = [struct.unpack_from(DELTA_RANGE_FMT, self.buf, range_offset + j * struct.calcsize(DELTA_RANGE_FMT)) for j in range(nranges)]
+            for first, count, offset in ranges:
+                if (first + count > length) or (offset + count * wbytes > len(self.buf) - csize):
+                    raise ValueError("Range of chain", chain, "is out of delta", fname)
+            self.chains.append((chain, lines, length, wbytes, ranges, words_crc))
+
+    # Raise if delta was generated for other FPGA parameters
+    def CheckParams(self, p):
+        if (self.params_hash != ParamsHash(p)):
+            raise ValueError("Delta was generated for different FPGA parameters!")
+
+    # Raise if delta does not apply to base container
+    def CheckBase(self, base):
+        if (base.Crc() != self.base_crc):
+            raise ValueError("Delta was generated against a different base bitfile!")
+
+    # Changed chain indexes, in reload order
+    def Changed(self):
+        return [c[0] for c in self.chains]
+
+    # Per-cycle words of changed chain: base words with differing ranges replaced
+    def Words(self, base, chain):
+        self.CheckBase(base)
+        for index, lines, length, wbytes, ranges, words_crc in self.chains:
+            if (index == chain):
+                break
+        else:
+            return None
+        if (base.chains[chain][:3] != (lines, length, wbytes)):
+            raise ValueError("Chain", chain, "of base bitfile has different size!")
+        data = bytearray(base.ChainBytes(chain))
+        for first, count, offset in ranges:
+            data[first * wbytes:(first + count) * wbytes] = self.buf[offset:offset + count * wbytes]
+        if (zlib.crc32(data) != words_crc):
+            raise ValueError("Chain", chain, "words do not match delta CRC!")
+        if (sys.byteorder == "little") and (wbytes in WORD_FMT):
+            return memoryview(data).cast(WORD_FMT[wbytes])
+        return [int.from_bytes(data[i:i + wbytes], "little") for i in range(0, len(data), wbytes)]
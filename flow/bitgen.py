@@ -11,11 +11,19 @@
 ##################################################
 
 import xml.etree.ElementTree
-import sys
+import os
+import mmap
 import array
-import types
-from copy import deepcopy
+import collections
+import copy
+import argparse
+import multiprocessing
+import hashlib
+import pickle
 from params import Params
+from bitfile import WriteBitfile, ParamsHash, Bitfile_parser, WriteDelta, PackWords
+from profiler import Phase_profiler
+from result_cache import Result_cache
 
 ###################### Global constants & functions ####################
 
@@ -41,6 +49,7 @@ LB_O_STR = LB_STR + ".logic_o["
 LB_I_STR = LB_STR + ".logic_i["
 
 
+
 ##################### Small helper classes & funcs #####################
 
 class Coord(object):
@@ -92,84 +101,246 @@ def DirToText(direction):
 
 ########################## Config file parsers #########################
 
+# Incremental packed netlist (.net) reader
+class Net_parser(object):
+    # Top level blocks are streamed with iterparse & freed after use, so whole tree is never kept in memory
+    # Attributes:
+    # fname
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    # Generator of top level <block> elements, each one is cleared when consumer asks for the next.
+    # With digests (element, digest of its subtree) pairs are generated instead.
+    def Blocks(self, digests = False):
+        depth = 0
+        root = None
+        path = []       # tag, instance & mode of elements from the root to the current one
+        h = hashlib.sha1()
+        for event, elem in xml.etree.ElementTree.iterparse(self.fname, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                if digests:
+                    path.append(elem.tag + ":" + elem.get("instance", elem.get("name", "")) + ":" + elem.get("mode", ""))
+                continue
+            depth -= 1
+            if digests:
+                if depth >= 1:
+                    # hashed while parsing, serializing subtree back is much slower. Full path of element is
+                    # part of it, so cells moved to another parent or mode change the digest.
+                    h.update("\0".join(["/".join(path), elem.text or ""] + [k + "=" + v for k, v in elem.items()]).encode())
+                    h.update(b"\1")
+                path.pop()
+            if depth == 1:
+                # direct child of the netlist root - complete subtree is available now
+                if elem.tag == "block":
+                    yield (elem, h.digest()) if digests else elem
+                elem.clear()
+                root.remove(elem)
+                h = hashlib.sha1()
+
+
 class Place_parser(object):
+    # VtR .place file parser - file is read once into name & coordinate indexes
     # Attributes:
-    # f
+    # coords (name -> (x, y, subblock))
+    # names ((x, y) -> [names])
 
     def __init__(self, fname):
-        self.f = open(fname, "r")
+        self.coords = dict()
+        self.names = dict()
+        with open(fname, "r") as f:
+            for l in f:
+                s = l.split()
+                # skip header & comment lines
+                if (len(s) < 4) or not (s[1].isdigit() and s[2].isdigit() and s[3].isdigit()):
+                    continue
+                # first entry wins if name is duplicated
+                if s[0] in self.coords:
+                    continue
+                x, y, sub = int(s[1]), int(s[2]), int(s[3])
+                self.coords[s[0]] = (x, y, sub)
+                self.names.setdefault((x, y), []).append(s[0])
 
     # Returns Coord
     def CoordByName(self, name):
-        self.f.seek(0, 0) # rewind file to the beginning
-        for l in self.f:
-            s = l.split()
-            if (len(s) > 1) and (name == s[0]):
-                return Coord(int(s[1]), int(s[2]), int(s[3]))
-        return Coord()
+        c = self.coords.get(name)
+        if c is None:
+            return Coord()
+        return Coord(c[0], c[1], c[2])
+
+    # Returns list of block names placed at (x, y) in file order
+    def NamesByCoord(self, x, y):
+        return self.names.get((x, y), [])
+
+    def __len__(self):
+        return len(self.coords)
+
+
+# VPR routing resource graph node types & pin sides as written by --write_rr_graph
+RR_TYPES = ["CHANX", "CHANY", "IPIN", "OPIN", "SOURCE", "SINK"]
+RR_SIDES = ["TOP", "RIGHT", "BOTTOM", "LEFT"]
+RR_CHANX = 0
+RR_CHANY = 1
+RR_ARRAYS = ("types", "xlow", "ylow", "ptc", "direction", "side")
+RR_INDEX_VERSION = 1
+
+
+class Rr_graph(object):
+    # Nodes of VPR routing resource graph (XML written by --write_rr_graph) in compact arrays indexed by node id.
+    # Edges are not needed & not parsed. Arrays are saved to index file next to the graph & reused while it is up to date.
+    # Attributes:
+    # fname
+    # types (RR_TYPES index, -1 for ids without node)
+    # xlow
+    # ylow
+    # ptc (pin or track number)
+    # direction (DIR_* of unidirectional wires, DIR_NONE for other nodes)
+    # side (RR_SIDES index of pins, -1 for other nodes)
+
+    def __init__(self, fname, use_index = True):
+        self.fname = fname
+        index = fname + ".idx"
+        stamp = (os.path.getsize(fname), os.path.getmtime(fname))
+        if use_index and os.path.exists(index):
+            with open(index, "rb") as f:
+                saved = pickle.load(f)
+            if (saved.get("version") == RR_INDEX_VERSION) and (tuple(saved["stamp"]) == stamp):
+                for name in RR_ARRAYS:
+                    setattr(self, name, saved[name])
+                return
+        self.Parse()
+        if use_index:
+            saved = {name : getattr(self, name) for name in RR_ARRAYS}
+            saved.update({"version" : RR_INDEX_VERSION, "stamp" : stamp})
+            with open(index + ".tmp", "wb") as f:
+                pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(index + ".tmp", index)
+
+    def Parse(self):
+        types = {t : i for i, t in enumerate(RR_TYPES)}
+        sides = {t : i for i, t in enumerate(RR_SIDES)}
+        chandirs = {("CHANX", "INC_DIR") : DIR_RIGHT, ("CHANX", "DEC_DIR") : DIR_LEFT, ("CHANY", "INC_DIR") : DIR_UP, ("CHANY", "DEC_DIR") : DIR_DOWN}
+        for name in RR_ARRAYS:
+            setattr(self, name, array.array('b' if name in ("types", "direction", "side") else 'i'))
+
+        nodes = None
+        for event, elem in xml.etree.ElementTree.iterparse(self.fname, events=("start", "end")):
+            if event == "start":
+                if elem.tag == "rr_nodes":
+                    nodes = elem
+                continue
+            if elem.tag == "node":
+                node = int(elem.get("id"))
+                t = elem.get("type")
+                loc = elem.find("loc")
+                if (t not in types) or (loc is None):
+                    raise ValueError("Unexpected rr graph node", node, t, "in", self.fname)
+                # ids are dense in VPR output, but do not rely on their order
+                if node >= len(self.types):
+                    grow = node + 1 - len(self.types)
+                    for name in RR_ARRAYS:
+                        getattr(self, name).extend([-1] * grow)
+                self.types[node] = types[t]
+                self.xlow[node] = int(loc.get("xlow"))
+                self.ylow[node] = int(loc.get("ylow"))
+                self.ptc[node] = int(loc.get("ptc"))
+                self.direction[node] = chandirs.get((t, elem.get("direction")), DIR_NONE)
+                self.side[node] = sides.get(loc.get("side"), -1)
+                # parsed nodes are dropped, so the graph is never kept in memory
+                if nodes is not None:
+                    nodes.remove(elem)
+            elif elem.tag == "rr_nodes":
+                # edges & the rest are not needed
+                break
+
+    def __len__(self):
+        return len(self.types)
+
+    # Coordinates, direction & track of wire node, raises if there is no such wire
+    def Chan(self, node, objtype):
+        if (node < 0) or (node >= len(self.types)) or (self.types[node] != objtype):
+            raise ValueError("Node", node, "of route file is not", RR_TYPES[objtype], "in rr graph", self.fname)
+        if self.direction[node] == DIR_NONE:
+            raise ValueError("Bidirectional wire", node, "is not supported")
+        return self.xlow[node], self.ylow[node], self.direction[node], self.ptc[node] >> 1
+
+
+# Records produced by Route_parser.Hops()
+Route_net       = collections.namedtuple("Route_net", "num name is_global")         # net header
+Route_source    = collections.namedtuple("Route_source", "objtype x y pin")         # block or pad output
+Route_chan      = collections.namedtuple("Route_chan", "x y chandir track smux")    # routing node track & its mux state
+Route_sink      = collections.namedtuple("Route_sink", "objtype x y pin mux")       # block input or output pad fed from a track
 
 
 class Route_parser(object):
-    # VtR .route file parser - VERY ugly & slow
+    # VtR .route file parser - single forward pass over the file, no rewinds
     # Attributes:
-    # f
-    # fp
-    # prev_s
-    # prev_coord
-    # prev_chandir
+    # p
+    # fname
+    # use_mmap
+    # blk_mux_start (chandir -> first block/pad input mux value for this direction)
+    # turn_mux ((prev_chandir, chandir) -> routing mux state)
+    # switch_tracks (SwitchTracks() result)
+    # rr_graph (Rr_graph wires are looked up in or None to decode them from route file strings)
 
     # Constructor
-    def __init__(self, fname):
-        self.f = open(fname, "r")
-        self.fp = 0
-        self.prev_s = ''
-        self.prev_coord = Coord()
-        self.prev_chandir = DIR_NONE
-
-    # Parse splited route file string to know if the net terminates at output pad
-    # returns [coord, mux_val] or [] if not io input
+    def __init__(self, p, fname, use_mmap = False, rr_graph = None):
+        self.p = p
+        self.fname = fname
+        self.use_mmap = use_mmap
+        self.rr_graph = rr_graph
+        self.switch_tracks = None
+        self.blk_mux_start = {DIR_UP : self.p.BLK_MUX_UP_START, DIR_DOWN : self.p.BLK_MUX_DOWN_START, DIR_LEFT : self.p.BLK_MUX_LEFT_START, DIR_RIGHT : self.p.BLK_MUX_RIGHT_START}
+        self.turn_mux = {
+            (DIR_UP, DIR_UP) : self.p.FORWARD_MUX_START, (DIR_UP, DIR_RIGHT) : self.p.RIGHT_MUX_START, (DIR_UP, DIR_LEFT) : self.p.LEFT_MUX_START,
+            (DIR_DOWN, DIR_DOWN) : self.p.FORWARD_MUX_START, (DIR_DOWN, DIR_LEFT) : self.p.RIGHT_MUX_START, (DIR_DOWN, DIR_RIGHT) : self.p.LEFT_MUX_START,
+            (DIR_LEFT, DIR_LEFT) : self.p.FORWARD_MUX_START, (DIR_LEFT, DIR_UP) : self.p.RIGHT_MUX_START, (DIR_LEFT, DIR_DOWN) : self.p.LEFT_MUX_START,
+            (DIR_RIGHT, DIR_RIGHT) : self.p.FORWARD_MUX_START, (DIR_RIGHT, DIR_DOWN) : self.p.RIGHT_MUX_START, (DIR_RIGHT, DIR_UP) : self.p.LEFT_MUX_START }
+
+    # Line source: plain buffered reads or mmap
+    def Lines(self):
+        if self.use_mmap and os.path.getsize(self.fname) > 0:
+            return self.MmapLines()
+        return open(self.fname, "r")
+
+    def MmapLines(self):
+        with open(self.fname, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for l in iter(mm.readline, b""):
+                    yield l.decode()
+
+    # Parse splited route file string of output pad following a track
     def ParseIoIn(self, s, chandir, track):
-        if (len(s) < 5) or not ('Pad' in s[4]):
-            return []
-
-        # return io coord & track number to set mux
         coord = CoordFromBraces(s[3])
-        coord.s = int(s[5]) // 3    # 3 is input/output/clock
-        mux_val = ({DIR_UP : p.BLK_MUX_UP_START, DIR_DOWN : p.BLK_MUX_DOWN_START, DIR_LEFT : p.BLK_MUX_LEFT_START, DIR_RIGHT : p.BLK_MUX_RIGHT_START}).get(chandir) + track
-        return [coord, mux_val]
+        pin = int(s[5]) // 3    # 3 is input/output/clock
+        return Route_sink(OBJTYPE_PAD, coord.x, coord.y, pin, self.blk_mux_start[chandir] + track)
 
-
-    # Parse splited route file string to get if the net terminates at block input
-    # returns [coord, input_num, mux_val] or [] if not block input
+    # Parse splited route file string of block input following a track
     def ParseBlockIn(self, s, chandir, track):
-        if (not self.StrIsBlock(s)):
-            return []
-
-        # get coords & input num from string
         coord = CoordFromBraces(s[3])
         input_num = int(s[6][len(LB_I_STR):len(s[6])-1])
-
         # we name directions here from source wire perspective, for logic block they'll be inversed ??? correct ???
-        mux_val = ({DIR_UP : p.BLK_MUX_UP_START, DIR_DOWN : p.BLK_MUX_DOWN_START, DIR_LEFT : p.BLK_MUX_LEFT_START, DIR_RIGHT : p.BLK_MUX_RIGHT_START}).get(chandir) + track
-
-        return [coord, input_num, mux_val]
+        return Route_sink(OBJTYPE_BLOCK, coord.x, coord.y, input_num, self.blk_mux_start[chandir] + track)
 
 
     # Small helpers to determine object type by route string
     def StrIsChanX(self, s):
-        return ('CHANX' in s[2])
+        return (s[2] == 'CHANX')
 
     def StrIsChanY(self, s):
-        return ('CHANY' in s[2])
+        return (s[2] == 'CHANY')
 
     def StrIsChan(self, s):
-        return ('CHAN' in s[2])
+        return (s[2] == 'CHANX') or (s[2] == 'CHANY')
 
     def StrIsPad(self, s):
         return ('Pad' in s[4])
 
     def StrIsBlock(self, s):
-        return (LB_STR in s[6]) or (MB_STR in s[6])
+        return (len(s) > 6) and ((LB_STR in s[6]) or (MB_STR in s[6]))
 
     def GetObjectType(self, s):
         if self.StrIsBlock(s):
@@ -190,95 +361,91 @@ class Route_parser(object):
             return OBJTYPE_CHANX
 
     def GetTrack(self, s):
-        track = int(s[5])
-        # VTR counts tracks in both directions, we in each direction separately
-        track = int(track / 2)# + (track % 1)
-        if (track < 0) or (track >= p.TRACKS_PER_RNODE):
-            raise ValueError("Wrong track number ", track, " out of ", p.TRACKS_PER_RNODE)
+        if self.rr_graph is not None:
+            track = self.rr_graph.Chan(int(s[1]), RR_CHANX if s[2] == 'CHANX' else RR_CHANY)[3]
+        else:
+            track = int(s[5])
+            # VTR counts tracks in both directions, we in each direction separately
+            track = track // 2
+        if (track < 0) or (track >= self.p.TRACKS_PER_RNODE):
+            raise ValueError("Wrong track number ", track, " out of ", self.p.TRACKS_PER_RNODE)
         return track
 
     # Determine channel direction from splitted string (! use the fact that right and up have even node numbers !)
     def GetChandir(self, s):
-        objtype = self.GetObjectType(s)
-        nodenum = int(s[1])
-        if (objtype == OBJTYPE_CHANX):
-            if (nodenum % 2) == 0:
-                return DIR_RIGHT
-            else:
-                return DIR_LEFT
-        elif (objtype == OBJTYPE_CHANY):
-            if (nodenum % 2) == 0:
-                return DIR_UP
-            else:
-                return DIR_DOWN
+        if self.rr_graph is not None:
+            return self.rr_graph.Chan(int(s[1]), RR_CHANX if s[2] == 'CHANX' else RR_CHANY)[2]
+        odd = int(s[1]) & 1
+        if (s[2] == 'CHANX'):
+            return DIR_LEFT if odd else DIR_RIGHT
+        elif (s[2] == 'CHANY'):
+            return DIR_DOWN if odd else DIR_UP
         else:
             raise ValueError("Incorrect objtype!")
 
     # Direction helper
-    def GetDirection(self, stype, _scoord, dtype, _dcoord):
-        # ! ugly to get rid of mutability
-        scoord = deepcopy(_scoord)
-        dcoord = deepcopy(_dcoord)
+    def GetDirection(self, stype, scoord, dtype, dcoord):
+        sx, sy, dx, dy = scoord.x, scoord.y, dcoord.x, dcoord.y
 
         # offset channel coords by 0.5
         if (stype == OBJTYPE_CHANX):
-            scoord.y += 0.5
+            sy += 0.5
         if (dtype == OBJTYPE_CHANX):
-            dcoord.y += 0.5
+            dy += 0.5
         if (stype == OBJTYPE_CHANY):
-            scoord.x += 0.5
+            sx += 0.5
         if (dtype == OBJTYPE_CHANY):
-            dcoord.x += 0.5
+            dx += 0.5
 
         # use simple direction for everything but the case of two different channels
         if (stype == OBJTYPE_CHANX) and (dtype == OBJTYPE_CHANY):
-            if (dcoord.y > scoord.y) and (abs(dcoord.x - scoord.x) <= 1):
+            if (dy > sy) and (abs(dx - sx) <= 1):
                 return DIR_UP
-            elif (dcoord.y <= scoord.y) and (abs(dcoord.x - scoord.x) <= 1):
+            elif (dy <= sy) and (abs(dx - sx) <= 1):
                 return DIR_DOWN
             else:
                 raise ValueError("Error in determining channel direction: ", scoord, "->", dcoord)
 
         if (stype == OBJTYPE_CHANY) and (dtype == OBJTYPE_CHANX):
-            if (dcoord.x > scoord.x) and (abs(dcoord.y - scoord.y) <= 1):
+            if (dx > sx) and (abs(dy - sy) <= 1):
                 return DIR_RIGHT
-            elif (dcoord.x <= scoord.x) and (abs(dcoord.y - scoord.y) <= 1):
+            elif (dx <= sx) and (abs(dy - sy) <= 1):
                 return DIR_LEFT
             else:
                 raise ValueError("Error in determining channel direction: ", scoord, "->", dcoord)
 
-        return scoord.Direction(dcoord)
+        return Coord(sx, sy).Direction(Coord(dx, dy))
 
-    # Check that mux is Wilton-type (seems to be correct for any p.TRACKS_PER_RNODE value)
+    # Check that mux is Wilton-type (seems to be correct for any self.p.TRACKS_PER_RNODE value)
     def CheckSwitch(self, chandir, mux_state, strack, dtrack, coord, s):
         expected = -1
-        if (mux_state == p.FORWARD_MUX_START):
+        if (mux_state == self.p.FORWARD_MUX_START):
             expected = strack
         elif (chandir == DIR_UP):
-            if (mux_state == p.LEFT_MUX_START):
+            if (mux_state == self.p.LEFT_MUX_START):
                 expected = strack + 1
-            elif (mux_state == p.RIGHT_MUX_START):
-                expected = (p.TRACKS_PER_RNODE-2) - strack
+            elif (mux_state == self.p.RIGHT_MUX_START):
+                expected = (self.p.TRACKS_PER_RNODE-2) - strack
             else:
                 raise ValueError("Incorrect mux state", mux_state)
         elif (chandir == DIR_DOWN):
-            if (mux_state == p.LEFT_MUX_START):
+            if (mux_state == self.p.LEFT_MUX_START):
                 expected = strack + 1
-            elif (mux_state == p.RIGHT_MUX_START):
+            elif (mux_state == self.p.RIGHT_MUX_START):
                 expected = 0 - strack
             else:
                 raise ValueError("Incorrect mux state", mux_state)
         elif (chandir == DIR_RIGHT):
-            if (mux_state == p.LEFT_MUX_START):
+            if (mux_state == self.p.LEFT_MUX_START):
                 expected = 0 - strack
-            elif (mux_state == p.RIGHT_MUX_START):
+            elif (mux_state == self.p.RIGHT_MUX_START):
                 expected = strack - 1
             else:
                 raise ValueError("Incorrect mux state", mux_state)
         elif (chandir == DIR_LEFT):
-            if (mux_state == p.LEFT_MUX_START):
-                expected = (p.TRACKS_PER_RNODE-2) - strack
-            elif (mux_state == p.RIGHT_MUX_START):
+            if (mux_state == self.p.LEFT_MUX_START):
+                expected = (self.p.TRACKS_PER_RNODE-2) - strack
+            elif (mux_state == self.p.RIGHT_MUX_START):
                 expected = strack - 1
             else:
                 raise ValueError("Incorrect mux state", mux_state)
@@ -286,13 +453,13 @@ class Route_parser(object):
             raise ValueError("Incorrect direction", chandir)
 
         # patch overflow
-        if (expected >= p.TRACKS_PER_RNODE):
-            expected -= p.TRACKS_PER_RNODE
+        if (expected >= self.p.TRACKS_PER_RNODE):
+            expected -= self.p.TRACKS_PER_RNODE
         elif (expected < 0):
-            expected += p.TRACKS_PER_RNODE
+            expected += self.p.TRACKS_PER_RNODE
 
         # sanity check
-        if (expected < 0) or (expected >= p.TRACKS_PER_RNODE):
+        if (expected < 0) or (expected >= self.p.TRACKS_PER_RNODE):
             raise ValueError("Wrong expected track ", expected)
 
         if (dtrack != expected):
@@ -302,30 +469,30 @@ class Route_parser(object):
     # Get mux state for block->chan based on relative position
     def ChanFromBlockMux(self, objtype, bcoord, ccoord, chandir, pin):
         loc = self.GetDirection(objtype, bcoord, self.ChanDirToType(chandir), ccoord)
-        if (objtype == OBJTYPE_PAD) and ((pin < 0) or (pin >= p.PINS_PER_PAD)):
+        if (objtype == OBJTYPE_PAD) and ((pin < 0) or (pin >= self.p.PINS_PER_PAD)):
             raise ValueError("Wrong IO pin number", pin)
-            
+
         if (objtype == OBJTYPE_BLOCK):
-            off = (pin // p.BLOCK_SIDES)
+            off = (pin // self.p.BLOCK_SIDES)
         else:
             off = 0
 
         if (loc == DIR_UP):
-            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= p.BLOCK_OUTPUTS) or (pin % p.BLOCK_SIDES != 0)):
+            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= self.p.BLOCK_OUTPUTS) or (pin % self.p.BLOCK_SIDES != 0)):
                 raise ValueError("Wrong block pin number: ", bcoord, DirToText(loc), pin)
-            return p.BLOCK_R_MUX_START + off
+            return self.p.BLOCK_R_MUX_START + off
         elif (loc == DIR_RIGHT):
-            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= p.BLOCK_OUTPUTS) or (pin % p.BLOCK_SIDES != 1)):
+            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= self.p.BLOCK_OUTPUTS) or (pin % self.p.BLOCK_SIDES != 1)):
                 raise ValueError("Wrong block pin number: ", bcoord, DirToText(loc), pin)
-            return p.BLOCK_L_MUX_START + off
+            return self.p.BLOCK_L_MUX_START + off
         elif (loc == DIR_DOWN):
-            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= p.BLOCK_OUTPUTS) or (pin % p.BLOCK_SIDES != 2)):
+            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= self.p.BLOCK_OUTPUTS) or (pin % self.p.BLOCK_SIDES != 2)):
                 raise ValueError("Wrong block pin number: ", bcoord, DirToText(loc), pin)
-            return p.BLOCK_L_MUX_START + off
+            return self.p.BLOCK_L_MUX_START + off
         elif (loc == DIR_LEFT):
-            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= p.BLOCK_OUTPUTS) or (pin % p.BLOCK_SIDES != 3)):
+            if (objtype == OBJTYPE_BLOCK) and ((pin < 0) or (pin >= self.p.BLOCK_OUTPUTS) or (pin % self.p.BLOCK_SIDES != 3)):
                 raise ValueError("Wrong block pin number: ", bcoord, DirToText(loc), pin)
-            return p.BLOCK_R_MUX_START + off
+            return self.p.BLOCK_R_MUX_START + off
         else:
             raise ValueError("WTF?")
 
@@ -338,302 +505,597 @@ class Route_parser(object):
     # MUX_PER_CLASS     : forward
     # MUX_PER_CLASS     : left
     # MUX_PER_CLASS     : right
-    def ParseSrcMux(self, s, c, prev_c, chandir, prev_chandir):
-        if self.StrIsPad(s):
-            # parse IO block - just return the pin number
-            io_pin = (int(s[5]) - 1) // 3    # cause there are in/out/clock pins in VtR
-            #io_pin = int(s[5] - p.IN_PINS_PER_PAD
-            return self.ChanFromBlockMux(OBJTYPE_PAD, prev_c, c, chandir, io_pin)
-        elif self.StrIsBlock(s):
-            # parse logic block - set to output number
-            block_pin = int(s[6][len(LB_O_STR):len(s[6])-1])
-            return self.ChanFromBlockMux(OBJTYPE_BLOCK, prev_c, c, chandir, block_pin)
-        elif self.StrIsChan(s):
+    def ParseSrcMux(self, s, coord, track, prev_coord, chandir, prev_chandir):
+        if self.StrIsChan(s):
             # parse channels
-            track = self.GetTrack(s)
-
-            if (prev_chandir == chandir):
-                mux_state = p.FORWARD_MUX_START
-            elif (prev_chandir == DIR_UP):
-                if (chandir == DIR_RIGHT):
-                    mux_state = p.RIGHT_MUX_START
-                elif (chandir == DIR_LEFT):
-                    mux_state = p.LEFT_MUX_START
-                else:
-                    raise ValueError("Direction error!")
-            elif (prev_chandir == DIR_DOWN):
-                if (chandir == DIR_LEFT):
-                    mux_state = p.RIGHT_MUX_START
-                elif (chandir == DIR_RIGHT):
-                    mux_state = p.LEFT_MUX_START
-                else:
-                    raise ValueError("Direction error!")
-            elif (prev_chandir == DIR_LEFT):
-                if (chandir == DIR_UP):
-                    mux_state = p.RIGHT_MUX_START
-                elif (chandir == DIR_DOWN):
-                    mux_state = p.LEFT_MUX_START
-                else:
-                    raise ValueError("Direction error!")
-            elif (prev_chandir == DIR_RIGHT):
-                if (chandir == DIR_DOWN):
-                    mux_state = p.RIGHT_MUX_START
-                elif (chandir == DIR_UP):
-                    mux_state = p.LEFT_MUX_START
-                else:
-                    raise ValueError("Direction error!")
-            else:
+            mux_state = self.turn_mux.get((prev_chandir, chandir))
+            if mux_state is None:
                 raise ValueError("Direction error!")
 
             # mux sanity check
-            self.CheckSwitch(prev_chandir, mux_state, track, c.t, c, s)
+            self.CheckSwitch(prev_chandir, mux_state, self.GetTrack(s), track, coord, s)
             return mux_state
+        elif self.StrIsPad(s):
+            # parse IO block - just return the pin number
+            io_pin = (int(s[5]) - 1) // 3    # cause there are in/out/clock pins in VtR
+            return self.ChanFromBlockMux(OBJTYPE_PAD, prev_coord, coord, chandir, io_pin)
+        elif self.StrIsBlock(s):
+            # parse logic block - set to output number
+            block_pin = int(s[6][len(LB_O_STR):len(s[6])-1])
+            return self.ChanFromBlockMux(OBJTYPE_BLOCK, prev_coord, coord, chandir, block_pin)
         else:
             raise ValueError('Error in route file, unexpected net source: ', s)
 
 
-    # Returns (x, y, chandir, track, smux, [block_in], [io_in])
-    def GetNextChan(self):
-        res = types.SimpleNamespace(x=-1, y=-1, chandir=-1, smux=-1, track = -1, block_in = [], io_in = [])
-        coord = Coord()
-        for l in self.f:
+    # For each turn (prev_chandir, chandir) returns mux state & expected destination track for every source track
+    def SwitchTracks(self):
+        tracks = dict()
+        for turn, mux_state in self.turn_mux.items():
+            expected = []
+            for strack in range(self.p.TRACKS_PER_RNODE):
+                for dtrack in range(self.p.TRACKS_PER_RNODE):
+                    try:
+                        self.CheckSwitch(turn[0], mux_state, strack, dtrack, None, None)
+                        expected.append(dtrack)
+                        break
+                    except ValueError:
+                        pass
+            tracks[turn] = (mux_state, expected)
+        return tracks
+
+
+    # Generator of (net name, net lines) for every net in file order, lines before the first net are skipped
+    def Nets(self):
+        name = None
+        lines = []
+        f = self.Lines()
+        for l in f:
+            s = l.split(None, 3)
+            if (len(s) > 2) and (s[0] == "Net"):
+                if name is not None:
+                    yield name, lines
+                name = s[2].strip("():")
+                lines = []
+            if name is not None:
+                lines.append(l)
+        f.close()
+        if name is not None:
+            yield name, lines
+
+    # Generator of route records (Route_net, Route_source, Route_chan & Route_sink) in file order,
+    # lines of a single net from Nets() may be given instead of the whole file
+    def Hops(self, net_lines = None):
+        chandirs = {('CHANX', 0) : DIR_RIGHT, ('CHANX', 1) : DIR_LEFT, ('CHANY', 0) : DIR_UP, ('CHANY', 1) : DIR_DOWN}
+        # computed once, Hops may be called for every net separately
+        if self.switch_tracks is None:
+            self.switch_tracks = self.SwitchTracks()
+        switch_tracks = self.switch_tracks
+        tracks = self.p.TRACKS_PER_RNODE
+        rr = self.rr_graph
+
+        prev_s = []             # last node which could drive a track
+        prev_coord = Coord()
+        prev_chandir = DIR_NONE
+        prev_track = -1         # track number if the last driving node is a track
+        last_chan = None        # (chandir, track) if previous line was a track
+        branch = False          # line after SINK is a branch point of the net already reported
+
+        lines = self.Lines() if net_lines is None else net_lines
+        for l in lines:
             s = l.split()
-            # track the file pointer
-            self.fp += len(l)
-
-            # every node has coords (needed for next)
-            if (len(s) > 0) and ('Node' in s[0]):
-                # get coords
-                coord = CoordFromBraces(s[3])
-
-            # search for CHAN directives
-            if (len(s) > 2) and ('CHAN' in s[2]):
-                res.x = coord.x
-                res.y = coord.y
-
-                res.chandir = self.GetChandir(s)
-
-                # sanity check
-                if (((res.chandir == DIR_UP) or (res.chandir == DIR_DOWN)) and self.StrIsChanY(s)):
-                    pass
-                elif (((res.chandir == DIR_LEFT) or (res.chandir == DIR_RIGHT)) and self.StrIsChanX(s)):
-                    pass
+            if (len(s) > 2) and (s[0] == "Net"):
+                # global net header ("Net 5 (clk): global net connecting:") is followed by its pins, not by hops
+                yield Route_net(int(s[1]), s[2].strip("():"), "global" in s[3:])
+                last_chan = None
+                branch = False
+                continue
+            if (len(s) < 5):
+                last_chan = None
+                branch = False
+                continue
+
+            t = s[2]
+            if branch:
+                # remember branch point as a new source
+                branch = False
+                last_chan = None
+                prev_s = s
+                prev_track = -1
+                if (t == 'CHANX') or (t == 'CHANY'):
+                    prev_coord = CoordFromBraces(s[3]) if rr is None else Coord(*rr.Chan(int(s[1]), RR_CHANX if t == 'CHANX' else RR_CHANY)[:2])
+                    prev_chandir = self.GetChandir(s)
+                    prev_track = self.GetTrack(s)
+                    last_chan = (prev_chandir, prev_track)
+                elif self.StrIsPad(s) or self.StrIsBlock(s):
+                    prev_coord = CoordFromBraces(s[3])
+
+            elif (t == 'CHANX') or (t == 'CHANY'):
+                # hot path - inlined GetChandir, GetTrack & ParseSrcMux for track to track hops
+                if rr is not None:
+                    x, y, chandir, track = rr.Chan(int(s[1]), RR_CHANX if t == 'CHANX' else RR_CHANY)
                 else:
-                    raise ValueError('Unsupported CHAN or wrong direction in route file: ', s[2], res.chandir)
-
-                coord.t = self.GetTrack(s)
-                res.track = coord.t
-
-                # look in previous string to get source mux state
-                res.smux = self.ParseSrcMux(self.prev_s, coord, self.prev_coord, res.chandir, self.prev_chandir)
-
-                # look in next string and rewind
-                next_s = self.f.readline().split()
-                self.f.seek(self.fp)
-                if not res.block_in:
-                    res.block_in = self.ParseBlockIn(next_s, res.chandir, res.track)
-                if (not res.block_in) and (not res.io_in):
-                    res.io_in = self.ParseIoIn(next_s, res.chandir, res.track)
-
-                # remember previous string
-                self.prev_s = s
-                self.prev_coord = coord
-                self.prev_chandir = res.chandir
-
-                # return result
-                return res #[coord, chandir, track, smux, block_in, io]
-
-            # remember previous string if it is not a SINK
-            if (len(s) > 4) and (s[2] != "SINK") and (s[2] != "IPIN"):
-                self.prev_s = s
-                self.prev_coord = coord
-            elif (len(s) > 2) and (s[2] == "SINK"):
-                # on SINK skip next line
-                l = self.f.readline()
-                self.prev_s = l.split()
-                self.fp += len(l)
-                if len(self.prev_s) > 4 and self.StrIsChan(self.prev_s):
-                    self.prev_coord = CoordFromBraces(self.prev_s[3])
-                    self.prev_chandir = self.GetChandir(self.prev_s)
-                    # ! very ugly hack to support IPIN immediately after SINK - read one more line !
-                    # look in next string and rewind
-                    next_s = self.f.readline().split()
-                    self.f.seek(self.fp)
-                    res.block_in = self.ParseBlockIn(next_s, self.prev_chandir, self.GetTrack(self.prev_s))
-                    if not res.block_in:
-                        res.io_in = self.ParseIoIn(next_s, self.prev_chandir, self.GetTrack(self.prev_s))
-                    if res.block_in or res.io_in:
-                        return res
-                    # ! ugly hack !
-                elif len(self.prev_s) > 4 and (self.StrIsPad(self.prev_s) or self.StrIsBlock(self.prev_s)):
-                    self.prev_coord = CoordFromBraces(self.prev_s[3])
-
-
-        return res
+                    x, y = s[3][1:len(s[3])-1].split(',')
+                    x = int(x)
+                    y = int(y)
+                    chandir = chandirs[t, int(s[1]) & 1]
+                    track = int(s[5]) >> 1
+                if (track < 0) or (track >= tracks):
+                    self.GetTrack(s)
+                smux = None
+                if prev_track >= 0:
+                    switch = switch_tracks.get((prev_chandir, chandir))
+                    if (switch is not None) and (switch[1][prev_track] == track):
+                        smux = switch[0]
+                if smux is None:
+                    smux = self.ParseSrcMux(prev_s, Coord(x, y), track, prev_coord, chandir, prev_chandir)
+                yield Route_chan(x, y, chandir, track, smux)
+                prev_s = s
+                prev_coord = None   # not needed for track to track hops
+                prev_chandir = chandir
+                prev_track = track
+                last_chan = (chandir, track)
+
+            elif (t == 'IPIN'):
+                # input fed directly from the previous track
+                if last_chan is not None:
+                    if self.StrIsBlock(s):
+                        yield self.ParseBlockIn(s, last_chan[0], last_chan[1])
+                    elif self.StrIsPad(s):
+                        yield self.ParseIoIn(s, last_chan[0], last_chan[1])
+                last_chan = None
+
+            elif (t == 'SINK'):
+                branch = True
+                last_chan = None
+
+            else:
+                # SOURCE, OPIN & others
+                prev_s = s
+                prev_track = -1
+                if (s[0] == 'Node:'):
+                    prev_coord = CoordFromBraces(s[3])
+                    if (t == 'OPIN') and self.StrIsBlock(s):
+                        yield Route_source(OBJTYPE_BLOCK, prev_coord.x, prev_coord.y, int(s[6][len(LB_O_STR):len(s[6])-1]))
+                    elif (t == 'OPIN') and self.StrIsPad(s):
+                        yield Route_source(OBJTYPE_PAD, prev_coord.x, prev_coord.y, (int(s[5]) - 1) // 3)
+                last_chan = None
+        if net_lines is None:
+            lines.close()
 
 
 # Very simple, ugly & incomplete blif parser to load LUT contents
 class Blif_parser(object):
+    # File is read once into .names covers index
     # Attributes:
-    # f
+    # covers (output net -> list of splitted cover lines)
+    # lut_width
+    # engine
+    # luts (number of LUTs loaded)
+
+    def __init__(self, fname, lut_width):
+        self.lut_width = lut_width
+        self.covers = dict()
+        cover = None
+        with open(fname, "r") as f:
+            line = ""
+            for l in f:
+                # join continued lines
+                line += l
+                if line.rstrip().endswith("\\"):
+                    line = line.rstrip()[:-1] + " "
+                    continue
+                s = line.split()
+                line = ""
+                if (len(s) == 0) or (s[0][0] == '#'):
+                    continue
+                if (s[0][0] == '.'):
+                    cover = None
+                    if (s[0] == '.end'):
+                        break
+                    # first .names with this output wins
+                    if (s[0] == '.names') and (len(s) >= 2) and not (s[len(s)-1] in self.covers):
+                        cover = []
+                        self.covers[s[len(s)-1]] = cover
+                elif cover is not None:
+                    cover.append(s)
+        self.engine = None
+        self.luts = 0
+
+
+    # Returns splitted cover lines of .names with given output net
+    def Cover(self, name):
+        cover = self.covers.get(name)
+        if cover is None:
+            raise ValueError("LUT with name ", name, " not found")
+        return cover
 
-    def __init__(self, fname):
-        self.f = open(fname, "r")
 
+    def LoadLut(self, name, rotation_map):
+        return self.LoadLuts([(name, rotation_map)])[0]
 
-    def PopulateLutLists(self, l):
-        for j in range(len(l)):
-            for k in range(len(l[j])):
-                if l[j][k] == '-':
-                    tmp = list(l[j])
-                    tmp[k] = '1'
-                    l[j][k] = '0'
-                    l.append(tmp)
-                    return False
-        return True
 
+    # Batch version of LoadLut: takes list of (name, rotation_map), returns list of LUT values
+    def LoadLuts(self, requests):
+        if self.engine is None:
+            self.engine = Lut_engine(self.lut_width)
+        self.luts += len(requests)
+        return [self.engine.CoverToLut(self.Cover(name), rotation_map, name) for (name, rotation_map) in requests]
+
+
+# Truth table engine - computes LUT contents from .names covers with bit mask arithmetic
+class Lut_engine(object):
+    # Attributes:
+    # width
+    # full (LUT with all bits set)
+    # var_masks (for each LUT input - LUT bits where this input is 1)
+    # rotations (rotation map string -> rotation swap)
+    # cache ((cover, rotation swap) -> LUT value)
+
+    def __init__(self, width):
+        self.width = width
+        self.full = (1 << (1 << width)) - 1
+        self.var_masks = []
+        for i in range(width):
+            # repeated pattern of (1 << i) zeros followed by (1 << i) ones
+            run = 1 << i
+            pattern = ((1 << run) - 1) << run
+            mask = 0
+            for j in range(0, 1 << width, 2*run):
+                mask |= pattern << j
+            self.var_masks.append(mask)
+        self.rotations = dict()
+        self.cache = dict()
+
+
+    # Convert VPR port rotation map to list of physical LUT inputs for each logical (blif) input
+    def RotationSwap(self, rotation_map):
+        rotation_swap = self.rotations.get(rotation_map)
+        if rotation_swap is not None:
+            return rotation_swap
 
-    def LoadLut(self, name, rotation_map):
-        # parse rotation map
         s = rotation_map.split()
-        used_list = []
+        if len(s) > self.width:
+            raise ValueError("Incorrect rotation map: ", rotation_map)
+        s += ["open"] * (self.width - len(s))
+        rotation_swap = [-1] * self.width
         open_list = []
-        rotation_swap = list(range(p.FPGA_LUT_WIDTH))
-        for i in range(len(s)):
-            if (s[i] != "open"):
-                used_list.append(int(s[i]))
-            else:
-                open_list.append(i)
-        open_set = set(rotation_swap) - set(used_list)
         for i in range(len(s)):
             if (s[i] != "open"):
                 j = int(s[i])
+                if (j < 0) or (j >= self.width) or (rotation_swap[j] >= 0):
+                    raise ValueError("Incorrect rotation map: ", rotation_map)
                 rotation_swap[j] = i
+            else:
+                open_list.append(i)
 
-        # fix open positions (ugly)
-        cnt = 0
-        for i in open_set:
-            rotation_swap[i] = open_list[cnt]
-            cnt+=1
-
-        # sanity check rotation map
-        for i in range(len(rotation_swap)):
-            for j in range(len(rotation_swap)):
-                if (i != j) and (rotation_swap[i] == rotation_swap[j]):
-                    raise ValueError("Incorrect rotation map: ", rotation_swap, rotation_map)
-
-        lut = 0
-        self.f.seek(0, 0) # rewind blif file to the beginning
-        line = self.f.readline()
-        lut_bits_list = []
-        found = False
-        while not ('.end' in line):
-            sline = line.split()
-            if (len(sline) >= 2) and ('.names' == sline[0]) and (name == sline[len(sline)-1]):
-                logic_line = self.f.readline()
-                logic_line_part = logic_line.split()
-                i = 0
-                found = True
-
-                # $true & $false are special cases :(
-                if (len(logic_line_part) == 1) and (logic_line_part[0] == "1"):
-                    names_type = 1
-                    lut_bits_list.append((1 << p.FPGA_LUT_SIZE)-1)
-                    break   # $true
-                elif (logic_line_part[0] == ".names"):
-                    names_type = 1
-                    break   # $false
-
-                if (len(logic_line_part) != 2):
+        # unused logical inputs take free physical positions in order
+        for j in range(self.width):
+            if rotation_swap[j] < 0:
+                rotation_swap[j] = open_list.pop(0)
+
+        rotation_swap = tuple(rotation_swap)
+        self.rotations[rotation_map] = rotation_swap
+        return rotation_swap
+
+
+    # Mask of LUT bits covered by one cube, e.g. "1-0"
+    def CubeMask(self, cube, rotation_swap):
+        if len(cube) > self.width:
+            raise ValueError(".names larger than LUT!")
+        mask = self.full
+        for j in range(len(cube)):
+            if cube[j] == '1':
+                mask &= self.var_masks[rotation_swap[j]]
+            elif cube[j] == '0':
+                mask &= ~self.var_masks[rotation_swap[j]]
+            elif cube[j] != '-':
+                raise ValueError(".names format error in blif!")
+        return mask
+
+
+    # Compute LUT value from splitted cover lines
+    def CoverToLut(self, cover, rotation_map, name = ""):
+        rotation_swap = self.RotationSwap(rotation_map)
+        key = (tuple(tuple(l) for l in cover), rotation_swap)
+        lut = self.cache.get(key)
+        if lut is not None:
+            return lut
+
+        if (len(cover) == 0):
+            lut = 0         # $false
+        elif (len(cover[0]) == 1):
+            # constant .names
+            if (cover[0][0] == "1"):
+                lut = self.full
+            elif (cover[0][0] == "0"):
+                lut = 0
+            else:
+                raise ValueError(".names format error in blif!")
+        else:
+            names_type = cover[0][1]
+            lut = 0
+            for l in cover:
+                if (len(l) != 2) or (l[1] != names_type):
                     raise ValueError(".names format error in blif!")
+                lut |= self.CubeMask(l[0], rotation_swap)
+            if names_type == "0":
+                # cover lists zeroes of the function
+                lut = self.full & ~lut
+            elif names_type != "1":
+                raise ValueError(".names format error in blif!")
 
-                names_type = int(logic_line_part[1])   # all 0s or all 1s LUT
-                if names_type == 0:
-                    # inverse names LUT
-                    lut = (1 << p.FPGA_LUT_WIDTH)-1
-                elif names_type == 1:
-                    pass
-                else:
-                    raise ValueError(".names format error in blif!")
+        # sanity check & return
+        if (lut < 0) or (lut > self.full):
+            raise ValueError("Incorrect LUT ", name, " val: ", lut)
+        self.cache[key] = lut
+        return lut
 
-                while not ('.' == logic_line[0]):
-                    if i >= p.FPGA_LUT_SIZE:
-                        raise ValueError(".names larger than LUT!")
-                    i = i + 1
 
-                    # apply rotation map by swapping characters (ugly)
-                    lut_list = list((logic_line_part[0].ljust(p.FPGA_LUT_WIDTH, '-'))) # fill_char
-                    lut_list_rot = [0] * p.FPGA_LUT_WIDTH
-                    for j in range(len(rotation_swap)):
-                        lut_list_rot[rotation_swap[j]] = lut_list[j]
+########################## Fabric config storage #######################
 
-                    # replicate strings with '-' character replacing them with 0 & 1
-                    lut_lists = [lut_list_rot]
-                    while (not self.PopulateLutLists(lut_lists)):
-                        pass
+# Dense storage of all fabric configuration, block & node classes below are thin views over it
+class Fabric_config(object):
+    # Attributes:
+    #
+    # p
+    # size_x
+    # size_y
+    # block_inputs (block input muxes, [x][y][input])
+    # cell_inputs (cell crossbar muxes, [x][y][cell][input])
+    # cell_lut ([x][y][cell])
+    # cell_mux ([x][y][cell])
+    # io_tracks (IO pad muxes, [x][y][pin])
+    # rnode_tracks (direction -> routing node track muxes, [x][y][track])
+    # rnode_size_y (direction -> routing node grid Y size)
+    # labels (sparse names, instances & modes of used objects)
+
+    def __init__(self, p, size_x, size_y):
+        self.p = p
+        self.size_x = size_x
+        self.size_y = size_y
+        tiles = size_x * size_y
+        cells = tiles * self.p.CELLS_PER_BLOCK
+        self.block_inputs = array.array('h', [-1]) * (tiles * self.p.BLOCK_INPUTS)
+        self.cell_inputs = array.array('b', [-1]) * (cells * self.p.CELL_INPUTS)
+        if self.p.FPGA_LUT_SIZE <= 64:
+            self.cell_lut = array.array('Q', [0]) * cells
+        else:
+            self.cell_lut = [0] * cells
+        self.cell_mux = array.array('b', [0]) * cells
+        self.io_tracks = array.array('h', [-2]) * (tiles * self.p.PINS_PER_PAD)
+
+        self.rnode_tracks = dict()
+        self.rnode_size_y = dict()
+        for direction in (DIR_UP, DIR_DOWN):
+            self.rnode_size_y[direction] = size_y-2
+            self.rnode_tracks[direction] = array.array('h', [-1]) * ((size_x-1) * (size_y-2) * self.p.TRACKS_PER_RNODE)
+        for direction in (DIR_LEFT, DIR_RIGHT):
+            self.rnode_size_y[direction] = size_y-1
+            self.rnode_tracks[direction] = array.array('h', [-1]) * ((size_x-2) * (size_y-1) * self.p.TRACKS_PER_RNODE)
+
+        self.labels = dict()
+
+    # Independent copy, used to build fabrics from prepared empty template
+    def Copy(self):
+        c = copy.copy(self)
+        for attr in ("block_inputs", "cell_inputs", "cell_lut", "cell_mux", "io_tracks"):
+            setattr(c, attr, getattr(self, attr)[:])
+        c.rnode_tracks = {d : t[:] for d, t in self.rnode_tracks.items()}
+        c.rnode_size_y = dict(self.rnode_size_y)
+        c.labels = dict(self.labels)
+        return c
+
+    # Plain data (arrays & labels) for saving config between runs
+    def GetState(self):
+        state = {attr : getattr(self, attr) for attr in ("block_inputs", "cell_inputs", "cell_lut", "cell_mux", "io_tracks", "rnode_tracks", "labels")}
+        state["size"] = (self.size_x, self.size_y)
+        return state
+
+    def SetState(self, state):
+        if tuple(state["size"]) != (self.size_x, self.size_y):
+            raise ValueError("Fabric config size mismatch:", state["size"])
+        for attr in ("block_inputs", "cell_inputs", "cell_lut", "cell_mux", "io_tracks", "rnode_tracks", "labels"):
+            setattr(self, attr, state[attr])
+
+    def Tile(self, x, y):
+        return x * self.size_y + y
+
+    def GetLabel(self, key, default):
+        return self.labels.get(key, default)
+
+    def SetLabel(self, key, val):
+        self.labels[key] = val
+
+    def DelLabel(self, key):
+        self.labels.pop(key, None)
+
+
+# Indexable [x][y] grid of views created on access
+class View_grid(object):
+    # Attributes:
+    #
+    # size_x
+    # size_y
+    # view (function creating view for x, y)
 
-                    # calculate lut bits
-                    for lut_list_str in lut_lists:
-                        lut_sel = 1 << int("".join(reversed(lut_list_str)), 2)
-                        lut_bits_list.append(lut_sel)
-                    logic_line = self.f.readline()
-                    logic_line_part = logic_line.split()
-                # line = logic_line
-                break
-            else:
-                line = self.f.readline()
+    def __init__(self, size_x, size_y, view):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.view = view
 
-        if not found:
-            raise ValueError("LUT with name ", name, " not found")
-        # remove duplicate bits & sum final lut content
-        lut_bit_set = set(lut_bits_list)
-        for lut_sel in lut_bit_set:
-            if names_type == 0:
-                lut -= lut_sel
-            else:
-                lut += lut_sel
+    def __len__(self):
+        return self.size_x
 
-        # sanity check & return
-        if (lut < 0) or (lut >= (1 << p.FPGA_LUT_SIZE)):
-            raise ValueError("Incorrect LUT ", name, " val: ", lut)
-        return lut
+    def __getitem__(self, x):
+        return View_column(self, range(self.size_x)[x])
+
+
+class View_column(object):
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.size_y
+
+    def __getitem__(self, y):
+        return self.grid.view(self.x, range(self.grid.size_y)[y])
 
 
 ############################## Logic cell ##############################
 
+# Decoded logic cell config, independent of fabric storage
+Cell_config = collections.namedtuple("Cell_config", "cell_num name instance inputs mux lut")
+
+
+# Cell crossbar mux states from cell inputs string of .net file
+def CellInputs(p, inputs_str, instance):
+    inputs = [-1] * p.CELL_INPUTS
+    inputs_list = inputs_str.split()
+    for i in range(len(inputs_list)):
+        if (LB_I_STR in inputs_list[i]):
+            # block input
+            num = InstNum(inputs_list[i])
+            if (num < i*p.LBCROSS_INPUTS) or (num >= ((i+1)*p.LBCROSS_INPUTS)):
+                raise ValueError("Wrong block input number for cell input", i, "mux connection: ", inputs_list[i])
+            num -= i*p.LBCROSS_INPUTS
+            inputs[i] = p.CELL_IN_MUX_START + num
+        elif (LC_STR in inputs_list[i]):
+            # cell N output
+            num = InstNum(inputs_list[i])
+            if (num == InstNum(instance)):
+                raise ValueError("Cell input taken from same cell output is not allowed")
+            inputs[i] = p.CELL_LUT_MUX_START + num
+        elif (inputs_list[i] != 'open'):
+            raise ValueError("Unexpected cell input in net-file: ", inputs_list[i])
+    return inputs
+
+
+# Decode logic block element of .net file to list of Cell_config
+def DecodeLogicBlock(p, block, blif):
+    # LUT cells are collected to compute their contents in one batch
+    cells = []
+    lut_cells = []
+    lut_requests = []
+    for cell_block in block.findall("block"):
+        if cell_block.get("mode") == "n1_lut4":
+            inst = cell_block.get("instance")
+            cell_num = InstNum(inst)
+            inputs_str = cell_block.find("inputs").find("port").text
+            # ? we assume here that LUT block will always be first ?
+            lut_block = cell_block.find("block")
+            lut_mode = lut_block.get("mode")
+
+            # check if register is used
+            if ("fpga_register" in cell_block.find("outputs").find("port").text):
+                mux = 1
+            else:
+                mux = 0
+
+            cell = Cell_config(cell_num, lut_block.get("name"), inst, CellInputs(p, inputs_str, inst), mux, 0)
+
+            # check LUT mode
+            if (lut_mode == "fpga_lut"):
+                rotation_map = lut_block.find("block").find("inputs").find("port_rotation_map")
+                if rotation_map == None:
+                    # gen 0 1 2 3 rotation map
+                    rotation_map_text = ""
+                    for i in range(p.FPGA_LUT_WIDTH):
+                        if i != 0:
+                            rotation_map_text += " "
+                        rotation_map_text += str(i)
+                else:
+                    rotation_map_text = rotation_map.text
+                lut_cells.append(cell)
+                lut_requests.append((cell.name, rotation_map_text))
+            elif (lut_mode == "wire"):
+                # print("Wire mode lut ", block.get("instance"), ":", inst)
+                # find which input should be connected in LUT
+                lut_input_str = lut_block.find("inputs").find("port").text.split()
+                lut_val = -1
+                for i in range(len(lut_input_str)):
+                    if (lut_input_str[i] != "open"):
+                        if (lut_val >= 0):
+                            raise ValueError("Several input ports \"" + lut_input_str + "\" in wire LUT for", block.get("instance"), ":", inst)
+                        lut_val = 1 << (1 <<  i)
+                cells.append(cell._replace(lut = lut_val))
+            else:
+                raise ValueError("Unsupported LUT mode", lut_mode, "in", block.get("instance"), ":", inst)
+
+    for cell, lut_val in zip(lut_cells, blif.LoadLuts(lut_requests)):
+        cells.append(cell._replace(lut = lut_val))
+    return cells
+
+
+# Process pool job - decode every shards-th logic block of .net file starting from shard,
+# returns list of (block number, cells) & number of LUTs loaded
+def DecodeNetShard(p, blif, net_fname, shard, shards):
+    # each worker parses the whole file itself, so blocks are never serialized between processes
+    r = []
+    i = 0
+    for block in Net_parser(net_fname).Blocks():
+        if 'fpga_logic_block' in block.get('instance'):
+            if (i % shards == shard):
+                r.append((i, DecodeLogicBlock(p, block, blif)))
+            i += 1
+    return r, blif.luts
+
+
 class Logic_cell(object):
     # Attributes:
     #
+    # config
+    # p
+    # index (in cell arrays of config)
+    # cell_num
     # name
     # instance
     # lut
     # inputs
     # mux
 
-    def __init__(self, cell_num, name = 'open', instance = '-', inputs_str = '', mux = 0):
+    def __init__(self, config, index, cell_num):
+        self.config = config
+        self.p = config.p
+        self.index = index
         self.cell_num = cell_num
-        self.name = name
-        self.instance = instance
-        self.lut = 0
-        self.inputs = array.array('b', [-1] * p.CELL_INPUTS)    # crossbar
-        self.mux = mux
-        inputs_list = inputs_str.split()
-        for i in range(len(inputs_list)):
-            if (LB_I_STR in inputs_list[i]):
-                # block input
-                num = InstNum(inputs_list[i])
-                if (num < i*p.LBCROSS_INPUTS) or (num >= ((i+1)*p.LBCROSS_INPUTS)):
-                    raise ValueError("Wrong block input number for cell input", i, "mux connection: ", inputs_list[i])
-                num -= i*p.LBCROSS_INPUTS
-                self.inputs[i] = p.CELL_IN_MUX_START + num
-            elif (LC_STR in inputs_list[i]):
-                # cell N output
-                num = InstNum(inputs_list[i])
-                if (num == InstNum(instance)):
-                    raise ValueError("Cell input taken from same cell output is not allowed")
-                self.inputs[i] = p.CELL_LUT_MUX_START + num
-            elif (inputs_list[i] != 'open'):
-                raise ValueError("Unexpected cell input in net-file: ", inputs_list[i])
+        self.inputs = memoryview(config.cell_inputs)[index*self.p.CELL_INPUTS:(index+1)*self.p.CELL_INPUTS]    # crossbar
+
+    def SetConfig(self, cfg):
+        self.name = cfg.name
+        self.instance = cfg.instance
+        self.inputs[:] = array.array('b', cfg.inputs)
+        self.mux = cfg.mux
+        self.SetLut(cfg.lut)
+
+    @property
+    def name(self):
+        return self.config.GetLabel(("cell_name", self.index), 'open')
+
+    @name.setter
+    def name(self, name):
+        self.config.SetLabel(("cell_name", self.index), name)
+
+    @property
+    def instance(self):
+        return self.config.GetLabel(("cell_instance", self.index), '-')
+
+    @instance.setter
+    def instance(self, instance):
+        self.config.SetLabel(("cell_instance", self.index), instance)
+
+    @property
+    def lut(self):
+        return self.config.cell_lut[self.index]
+
+    @property
+    def mux(self):
+        return self.config.cell_mux[self.index]
+
+    @mux.setter
+    def mux(self, mux):
+        self.config.cell_mux[self.index] = mux
 
     def SetName(self, name):
         self.name = name
@@ -657,19 +1119,27 @@ class Logic_cell(object):
 
     def SetLut(self, lut):
         # sanity check
-        if (lut < 0) or (lut >= (1 << p.FPGA_LUT_SIZE)):
+        if (lut < 0) or (lut >= (1 << self.p.FPGA_LUT_SIZE)):
             raise ValueError("Incorrect LUT ", self.name, " val: ", lut)
-        self.lut = lut
+        self.config.cell_lut[self.index] = lut
 
     def LoadFromBlif(self, blif, rotation_map):
         self.SetLut(blif.LoadLut(self.name, rotation_map))
 
+    # Back to unused state
+    def Clear(self):
+        self.inputs[:] = array.array('b', [-1]) * len(self.inputs)
+        self.mux = 0
+        self.config.cell_lut[self.index] = 0
+        self.config.DelLabel(("cell_name", self.index))
+        self.config.DelLabel(("cell_instance", self.index))
+
     def PrintInputs(self, f):
         for i in self.GetInputs():
             print(i, end=' ', file=f)
 
     def PrintLut(self, f):
-        print("0x{:04X}".format(self.lut), end=' ', file=f)
+        print("0x{:0{w}X}".format(self.lut, w=(self.p.FPGA_LUT_SIZE+3)//4), end=' ', file=f)
 
     def PrintMux(self, f):
         print(self.mux, end=' ', file=f)
@@ -690,6 +1160,9 @@ class Logic_cell(object):
 class Logic_block(object):
     # Attributes:
     #
+    # config
+    # p
+    # tile (index in tile arrays of config)
     # name
     # instance
     # cells
@@ -697,92 +1170,77 @@ class Logic_block(object):
     # inputs
 
 
-    def __init__(self, coord):
-        self.name = ''
-        self.instance = ''
-        self.cells = []
-        for i in range(p.CELLS_PER_BLOCK):
-            self.cells.append(Logic_cell(i))
+    def __init__(self, config, coord):
+        self.config = config
+        self.p = config.p
+        self.tile = config.Tile(coord.x, coord.y)
         self.coord = coord
-        self.inputs = array.array('h', [-1] * p.BLOCK_INPUTS) # block input muxes
+        self.inputs = memoryview(config.block_inputs)[self.tile*self.p.BLOCK_INPUTS:(self.tile+1)*self.p.BLOCK_INPUTS] # block input muxes
+
+    @property
+    def cells(self):
+        return [self.Cell(i) for i in range(self.p.CELLS_PER_BLOCK)]
+
+    def Cell(self, i):
+        if (i < 0) or (i >= self.p.CELLS_PER_BLOCK):
+            raise ValueError("Wrong cell number", i, "in logic block", self.coord)
+        return Logic_cell(self.config, self.tile*self.p.CELLS_PER_BLOCK + i, i)
 
+    @property
+    def name(self):
+        return self.config.GetLabel(("block_name", self.tile), '')
+
+    @property
+    def instance(self):
+        return self.config.GetLabel(("block_instance", self.tile), '')
 
     def SetName(self, name):
-        self.name = name
+        self.config.SetLabel(("block_name", self.tile), name)
 
 
     def SetInstance(self, instance):
-        self.instance = instance
+        self.config.SetLabel(("block_instance", self.tile), instance)
 
 
     def SetCellFromBlif(self, i, cell, blif, rotation_map = ""):
-        if (i != cell.cell_num):
+        if (i != cell.cell_num) or (cell.config is not self.config) or (cell.index != self.tile*self.p.CELLS_PER_BLOCK + i):
             raise ValueError("Cell number mismatch!")
-        self.cells[i] = cell
-        self.cells[i].LoadFromBlif(blif, rotation_map)
+        cell.LoadFromBlif(blif, rotation_map)
 
 
     def SetCellFromVal(self, i, cell, lut_val):
-        if (i != cell.cell_num):
+        if (i != cell.cell_num) or (cell.config is not self.config) or (cell.index != self.tile*self.p.CELLS_PER_BLOCK + i):
             raise ValueError("Cell number mismatch!")
-        self.cells[i] = cell
-        self.cells[i].SetLut(lut_val)
+        cell.SetLut(lut_val)
 
 
     def SetInput(self, i, val):
         self.inputs[i] = val
 
 
+    # Returns number of cells loaded
     def LoadFromXml(self, block, blif):
-        for cell_block in block.findall("block"):
-            if cell_block.get("mode") == "n1_lut4":
-                inst = cell_block.get("instance")
-                cell_num = InstNum(inst)
-                inputs_str = cell_block.find("inputs").find("port").text
-                # ? we assume here that LUT block will always be first ?
-                lut_block = cell_block.find("block")
-                lut_mode = lut_block.get("mode")
-
-                # check if register is used
-                if ("fpga_register" in cell_block.find("outputs").find("port").text):
-                    mux = 1
-                else:
-                    mux = 0
-
-                cell = Logic_cell(cell_num, lut_block.get("name"), inst, inputs_str, mux)
-
-                # check LUT mode
-                if (lut_mode == "fpga_lut"):
-                    rotation_map = lut_block.find("block").find("inputs").find("port_rotation_map")
-                    if rotation_map == None:
-                        # gen 0 1 2 3 rotation map
-                        rotation_map_text = ""
-                        for i in range(p.FPGA_LUT_WIDTH):
-                            if i != 0:
-                                rotation_map_text += " "
-                            rotation_map_text += str(i)
-                    else:
-                        rotation_map_text = rotation_map.text
-                    self.SetCellFromBlif(cell_num, cell, blif, rotation_map_text)
-                elif (lut_mode == "wire"):
-                    # print("Wire mode lut ", block.get("instance"), ":", inst)
-                    # find which input should be connected in LUT
-                    lut_input_str = lut_block.find("inputs").find("port").text.split()
-                    lut_val = -1
-                    for i in range(len(lut_input_str)):
-                        if (lut_input_str[i] != "open"):
-                            if (lut_val >= 0):
-                                raise ValueError("Several input ports \"" + lut_input_str + "\" in wire LUT for", block.get("instance"), ":", inst)
-                            lut_val = 1 << (1 <<  i)
-                    self.SetCellFromVal(cell_num, cell, lut_val)
-                else:
-                    raise ValueError("Unsupported LUT mode", lut_mode, "in", block.get("instance"), ":", inst)
+        cells = DecodeLogicBlock(self.p, block, blif)
+        self.SetCells(cells)
+        return len(cells)
+
+
+    # Store decoded cells config
+    def SetCells(self, cells):
+        for cfg in cells:
+            self.Cell(cfg.cell_num).SetConfig(cfg)
+
+
+    # Unload cells config, block input muxes are set by routing & kept
+    def ClearCells(self):
+        for c in self.cells:
+            c.Clear()
 
 
     def GetBInputs(self):
         r = []
         for l in self.inputs:
-            r.append(l//p.BLOCK_IN_MUXES_COEF)
+            r.append(l//self.p.BLOCK_IN_MUXES_COEF)
         return r
 
     def PrintBInputs(self, f):
@@ -819,14 +1277,20 @@ class Logic_block(object):
 class Routing_node(object):
     # Attributes:
     #
+    # p
     # tracks
-    # x
-    # y
+    # coord
     # direction
 
-    def __init__(self, x = -1, y = -1, direction = DIR_NONE):
-        self.tracks = [-1] * p.TRACKS_PER_RNODE
-        self.coord = Coord(x, y)
+    def __init__(self, config, x, y, direction):
+        self.p = config.p
+        i = (x * config.rnode_size_y[direction] + y) * self.p.TRACKS_PER_RNODE
+        self.tracks = memoryview(config.rnode_tracks[direction])[i:i+self.p.TRACKS_PER_RNODE]
+        # node grid coords are shifted from fabric coords
+        if (direction == DIR_UP) or (direction == DIR_DOWN):
+            self.coord = Coord(x, y+1)
+        else:
+            self.coord = Coord(x+1, y)
         self.direction = direction
 
     def SetTrack(self, t, smux):
@@ -851,23 +1315,47 @@ class Routing_node(object):
 class IO_block(object):
     # Attributes:
     #
+    # config
+    # p
+    # tile (index in tile arrays of config)
     # name
     # instance
     # mode
     # tracks
     # coord
 
-    def __init__(self, coord):
-        self.mode = ['none'] * p.PINS_PER_PAD
-        self.instance = [''] * p.PINS_PER_PAD
-        self.name = [''] * p.PINS_PER_PAD
-        self.tracks = [-2] * p.PINS_PER_PAD
+    def __init__(self, config, coord):
+        self.config = config
+        self.p = config.p
+        self.tile = config.Tile(coord.x, coord.y)
+        self.tracks = memoryview(config.io_tracks)[self.tile*self.p.PINS_PER_PAD:(self.tile+1)*self.p.PINS_PER_PAD]
         self.coord = coord
 
+    def Labels(self, field, default):
+        return [self.config.GetLabel((field, self.tile, i), default) for i in range(self.p.PINS_PER_PAD)]
+
+    @property
+    def mode(self):
+        return self.Labels("io_mode", 'none')
+
+    @property
+    def name(self):
+        return self.Labels("io_name", '')
+
+    @property
+    def instance(self):
+        return self.Labels("io_instance", '')
+
     def LoadFromXml(self, pin, block):
-        self.mode[pin] = block.get('mode')
-        self.name[pin] = block.get('name')
-        self.instance[pin] = block.get('instance')
+        if (pin < 0) or (pin >= self.p.PINS_PER_PAD):
+            raise ValueError("Wrong pin number", pin, "in IO block", self.coord)
+        self.config.SetLabel(("io_mode", self.tile, pin), block.get('mode'))
+        self.config.SetLabel(("io_name", self.tile, pin), block.get('name'))
+        self.config.SetLabel(("io_instance", self.tile, pin), block.get('instance'))
+
+    def Clear(self, pin):
+        for field in ("io_mode", "io_name", "io_instance"):
+            self.config.DelLabel((field, self.tile, pin))
 
     def SetTrack(self, track, pin):
         self.tracks[pin] = track
@@ -875,9 +1363,10 @@ class IO_block(object):
 
     def GetIOMuxes(self):
         out = []
-        for i in range(p.PINS_PER_PAD):
-            if self.mode[i] == 'outpad':
-                out.append(self.tracks[i]//p.BLOCK_IN_MUXES_COEF)
+        mode = self.mode
+        for i in range(self.p.PINS_PER_PAD):
+            if mode[i] == 'outpad':
+                out.append(self.tracks[i]//self.p.BLOCK_IN_MUXES_COEF)
             else:
                 out.append(-1)
         return reversed(out)
@@ -909,87 +1398,160 @@ class Empty_block(object):
 class Fpga_fabric:
     # Attributes:
     #
+    # p
+    # config
     # fabric
-    # routing_v
-    # routing_h
+    # routing_u
+    # routing_d
+    # routing_l
+    # routing_r
     # size_x
     # size_y
 
-    def __init__(self, size_x, size_y):
+    def __init__(self, p, size_x, size_y, config = None):
+        self.p = p
         self.size_x = size_x
         self.size_y = size_y
-        self.fabric = [[Empty_block(Coord())] * self.SizeY() for i in range(self.SizeX())]
-        self.routing_u = [[Routing_node(x,y+1,DIR_UP) for y in range(self.RoutingVSizeY())] for x in range(self.RoutingVSizeX())]
-        self.routing_d = [[Routing_node(x,y+1,DIR_DOWN) for y in range(self.RoutingVSizeY())] for x in range(self.RoutingVSizeX())]
-        self.routing_l = [[Routing_node(x+1,y,DIR_LEFT) for y in range(self.RoutingHSizeY())] for x in range(self.RoutingHSizeX())]
-        self.routing_r = [[Routing_node(x+1,y,DIR_RIGHT) for y in range(self.RoutingHSizeY())] for x in range(self.RoutingHSizeX())]
-
-        # Construct FPGA fabric array
-        for x in range(self.SizeX()):
-            for y in range(self.SizeY()):
-                if self.IsEmpty(x, y):
-                    # corners are empty
-                    self.fabric[x][y] = Empty_block(Coord(x,y))
-                elif self.IsIoBlock(x, y):
-                    # put io blocks on edges
-                    self.fabric[x][y] = IO_block(Coord(x,y))
-                else:
-                    # put logic blocks everywhere else
-                    self.fabric[x][y] = Logic_block(Coord(x, y))
-
-
-    # Load from VTR files
-    def Load(self, net_file, place_file, blif_file, route_file):
+        # all config is kept in dense arrays, blocks & nodes are views created on access
+        if config is None:
+            config = Fabric_config(p, size_x, size_y)
+        elif (config.size_x != size_x) or (config.size_y != size_y):
+            raise ValueError("Fabric config size mismatch:", config.size_x, config.size_y)
+        self.config = config
+        self.fabric = View_grid(self.SizeX(), self.SizeY(), self.Block)
+        self.routing_u = View_grid(self.RoutingVSizeX(), self.RoutingVSizeY(), lambda x, y: Routing_node(self.config, x, y, DIR_UP))
+        self.routing_d = View_grid(self.RoutingVSizeX(), self.RoutingVSizeY(), lambda x, y: Routing_node(self.config, x, y, DIR_DOWN))
+        self.routing_l = View_grid(self.RoutingHSizeX(), self.RoutingHSizeY(), lambda x, y: Routing_node(self.config, x, y, DIR_LEFT))
+        self.routing_r = View_grid(self.RoutingHSizeX(), self.RoutingHSizeY(), lambda x, y: Routing_node(self.config, x, y, DIR_RIGHT))
+
+
+    # View of FPGA fabric block at x, y
+    def Block(self, x, y):
+        if self.IsEmpty(x, y):
+            # corners are empty
+            return Empty_block(Coord(x, y))
+        elif self.IsIoBlock(x, y):
+            # io blocks on edges
+            return IO_block(self.config, Coord(x, y))
+        else:
+            # logic blocks everywhere else
+            return Logic_block(self.config, Coord(x, y))
+
+
+    # Load from VTR files, logic blocks are decoded by process pool if jobs > 1
+    def Load(self, net_file, place_file, blif_file, route_file, jobs = 1):
+        counters = self.LoadNet(net_file, place_file, blif_file, jobs)
+        counters.update(self.LoadRoute(route_file))
+        return counters
+
+
+    # Load blocks from .net file, returns counters
+    def LoadNet(self, net_file, place_file, blif_file, jobs = 1):
+        pool = None
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
+            shards = pool.starmap_async(DecodeNetShard, [(self.p, blif_file, net_file.fname, i, jobs) for i in range(jobs)])
+
+        counters = {"logic_blocks" : 0, "io_blocks" : 0, "cells" : 0, "luts" : 0}
+        logic_coords = []   # logic blocks coords in .net file order
+        try:
+            self.LoadBlocks(net_file, place_file, blif_file, pool, logic_coords, counters)
+            if pool is not None:
+                # merge in .net file order so result does not depend on workers timing
+                decoded = []
+                for shard, luts in shards.get():
+                    decoded += shard
+                    counters["luts"] += luts
+                for i, cells in sorted(decoded):
+                    coord = logic_coords[i]
+                    self.fabric[coord.x][coord.y].SetCells(cells)
+                    counters["cells"] += len(cells)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        counters["luts"] += blif_file.luts
+        return counters
+
+
+    # Load IO blocks & logic blocks (unless they are decoded by pool) from .net file
+    def LoadBlocks(self, net_file, place_file, blif_file, pool, logic_coords, counters):
         # parse .net file
         print('Processing logic blocks...')
-        for block in net_file.findall('block'):
-            inst_str = block.get('instance')
-            name = block.get('name')
-            # num = InstNum(inst_str)
-            coord = place_file.CoordByName(name)
-            if 'fpga_logic_block' in inst_str:
-                # logic block
-                if not self.IsLogicBlock(coord.x, coord.y):
-                    raise ValueError('Failed to find logic block with name', name, 'in placer file!', coord)
-                self.fabric[coord.x][coord.y].LoadFromXml(block, blif_file)
-
-            elif 'io' in inst_str:
-                # IO block
-                if (coord.x < 0) or (coord.y < 0):
-                    raise ValueError('Failed to find IO block with name', name, 'in placer file!')
-                if not self.IsIoBlock(coord.x, coord.y):
-                    raise ValueError('Unexpected position for IO block', name, 'in placer file:', coord)
+        for block in net_file.Blocks():
+            coord = place_file.CoordByName(block.get('name'))
+            objtype = self.BlockType(block, coord)
+            if objtype == OBJTYPE_BLOCK:
+                counters["logic_blocks"] += 1
+                if pool is None:
+                    counters["cells"] += self.fabric[coord.x][coord.y].LoadFromXml(block, blif_file)
+                else:
+                    logic_coords.append(coord)
+
+            elif objtype == OBJTYPE_PAD:
+                counters["io_blocks"] += 1
                 self.fabric[coord.x][coord.y].LoadFromXml(coord.s, block)
 
-        # Parse .route file
-        print('Processing nets...')
 
-        while True:
-            chan = route_file.GetNextChan()
-            if (chan.x < 0) and (not chan.block_in) and (not chan.io_in):
-                # no more nets in route file
-                break
+    # Type of top level .net block (OBJTYPE_BLOCK, OBJTYPE_PAD or OBJTYPE_NONE for unsupported ones), checks its placement
+    def BlockType(self, block, coord):
+        inst_str = block.get('instance')
+        name = block.get('name')
+        if 'fpga_logic_block' in inst_str:
+            # logic block
+            if not self.IsLogicBlock(coord.x, coord.y):
+                raise ValueError('Failed to find logic block with name', name, 'in placer file!', coord)
+            return OBJTYPE_BLOCK
 
-            if chan.block_in:
-                # if this net terminates to logic block - set input mux
-                self.fabric[chan.block_in[0].x][chan.block_in[0].y].SetInput(chan.block_in[1], chan.block_in[2])
+        elif 'io' in inst_str:
+            # IO block
+            if (coord.x < 0) or (coord.y < 0):
+                raise ValueError('Failed to find IO block with name', name, 'in placer file!')
+            if not self.IsIoBlock(coord.x, coord.y):
+                raise ValueError('Unexpected position for IO block', name, 'in placer file:', coord)
+            return OBJTYPE_PAD
+        return OBJTYPE_NONE
 
-            if chan.io_in:
-                # if this net terminates to io pad - set input mux
-                self.fabric[chan.io_in[0].x][chan.io_in[0].y].SetTrack(chan.io_in[1], chan.io_in[0].s)
 
+    # Set routing muxes from .route file, returns counters
+    def LoadRoute(self, route_file):
+        print('Processing nets...')
+        nets = 0
+        chan_hops = 0
+        sinks = 0
+        for hop in route_file.Hops():
+            if type(hop) == Route_chan:
+                chan_hops += 1
+                self.SetHop(hop)
+            elif type(hop) == Route_sink:
+                sinks += 1
+                self.SetHop(hop)
+            elif type(hop) == Route_net:
+                nets += 1
+        return {"nets" : nets, "chan_hops" : chan_hops, "sinks" : sinks}
+
+
+    # Set muxes for Route_chan or Route_sink record (or reset them to unused state)
+    def SetHop(self, hop, clear = False):
+        if type(hop) == Route_chan:
             # set appropriate routing muxes
-            if (chan.x >= 0):
-                if (chan.chandir == DIR_UP) and (chan.y >= 1):
-                    self.routing_u[chan.x][chan.y-1].SetTrack(chan.track, chan.smux)
-                elif (chan.chandir == DIR_DOWN) and (chan.y >= 1):
-                    self.routing_d[chan.x][chan.y-1].SetTrack(chan.track, chan.smux)
-                elif (chan.chandir == DIR_LEFT) and (chan.x >= 1):
-                    self.routing_l[chan.x-1][chan.y].SetTrack(chan.track, chan.smux)
-                elif (chan.chandir == DIR_RIGHT) and (chan.x >= 1):
-                    self.routing_r[chan.x-1][chan.y].SetTrack(chan.track, chan.smux)
-                else:
-                    raise ValueError('Invalid chan from route parser:', chan)
+            smux = -1 if clear else hop.smux
+            if (hop.chandir == DIR_UP) and (hop.y >= 1):
+                self.routing_u[hop.x][hop.y-1].SetTrack(hop.track, smux)
+            elif (hop.chandir == DIR_DOWN) and (hop.y >= 1):
+                self.routing_d[hop.x][hop.y-1].SetTrack(hop.track, smux)
+            elif (hop.chandir == DIR_LEFT) and (hop.x >= 1):
+                self.routing_l[hop.x-1][hop.y].SetTrack(hop.track, smux)
+            elif (hop.chandir == DIR_RIGHT) and (hop.x >= 1):
+                self.routing_r[hop.x-1][hop.y].SetTrack(hop.track, smux)
+            else:
+                raise ValueError('Invalid chan from route parser:', hop)
+
+        elif hop.objtype == OBJTYPE_BLOCK:
+            # net terminates to logic block - set input mux
+            self.fabric[hop.x][hop.y].SetInput(hop.pin, -1 if clear else hop.mux)
+        else:
+            # net terminates to io pad - set input mux
+            self.fabric[hop.x][hop.y].SetTrack(-2 if clear else hop.mux, hop.pin)
 
 
     # Positional stuff
@@ -1072,147 +1634,578 @@ class Fpga_fabric:
             for r in l:
                 r.Print(f)
 
-    # Bitstream for loader
-    def WriteBitstream(self, fname):
-        
-        out_bit_file = open(fname + ".bit", 'w')
-        out_c_file_lb = open(fname + "_lb_bit.h", 'w')
-        out_c_file_vn = open(fname + "_vn_bit.h", 'w')
-        out_c_file_hn = open(fname + "_hn_bit.h", 'w')
-
-        block_bitlines  = ["" for x in range(1, self.SizeX()-1)]
-        vrnode_bitlines = ["" for y in range(0, self.RoutingVSizeY())]
-        hrnode_bitlines = ["" for x in range(0, self.RoutingHSizeX())]
+    # Config chains as bitline strings (one char per bit, first shifted bit first)
+    def ConfigChains(self):
+        return ([self.BlockBitline(x) for x in range(1, self.SizeX()-1)],
+                [self.VrnodeBitline(y) for y in range(0, self.RoutingVSizeY())],
+                [self.HrnodeBitline(x) for x in range(0, self.RoutingHSizeX())])
 
-        # Construct data for config_block chain
+    # config_block chain of logic blocks column x
+    def BlockBitline(self, x):
+        bitline = []
         for y in range(1, self.SizeY()-1):
-            for x in range(1, self.SizeX()-1):
-                b = self.fabric[x][y]
-                if type(b) == Logic_block:
-                    # block input muxes
-                    block_bitlines[x-1] += ListToBitline(b.GetBInputs(), p.BINPUT_MUX_STATE_WDT)
-                    for c in b.cells:
-                        # cell input mux (crossbar)
-                        block_bitlines[x-1] += (ListToBitline(c.GetInputs(), p.LBCROSS_MUX_STATE_WDT))
-                    for c in b.cells:
-                        # cell LUT
-                        block_bitlines[x-1] += (ListToBitline([c.lut], p.FPGA_LUT_SIZE))
-                        # cell MUX
-                        block_bitlines[x-1] += (ListToBitline([c.mux], 1))
-                else:
-                    raise ValueError("No logic block at", x, y)
-
-        # Construct data for config_vrnode chain
-        for y in range(0, self.RoutingVSizeY()):
-            # IO muxes left
-            vrnode_bitlines[y] += (ListToBitline(self.fabric[0][y+1].GetIOMuxes(), p.BINPUT_MUX_STATE_WDT))
-            for x in range(0, self.RoutingVSizeX()):
-                un = self.routing_u[x][y]
-                dn = self.routing_d[x][y]
-                if (type(un) == Routing_node) and (type(dn) == Routing_node):
-                    # up node
-                    vrnode_bitlines[y] += (ListToBitline((un.GetTracks()), p.RNODE_MUX_STATE_WDT))
-                    # down node
-                    vrnode_bitlines[y] += (ListToBitline((dn.GetTracks()), p.RNODE_MUX_STATE_WDT))
-                else:
-                    raise ValueError("No routing node at", x, y)
-            # IO muxes right
-            vrnode_bitlines[y] += (ListToBitline(self.fabric[self.SizeX()-1][y+1].GetIOMuxes(), p.BINPUT_MUX_STATE_WDT))
-
-        # Construct data for config_hrnode chain
-        for x in range(0, self.RoutingHSizeX()):
-            # IO muxes down
-            hrnode_bitlines[x] += (ListToBitline(self.fabric[x+1][0].GetIOMuxes(), p.BINPUT_MUX_STATE_WDT))
-            for y in range(0, self.RoutingHSizeY()):
-                ln = self.routing_l[x][y]
-                rn = self.routing_r[x][y]
-                if (type(ln) == Routing_node) and (type(rn) == Routing_node):
-                    # left node
-                    hrnode_bitlines[x] += (ListToBitline((ln.GetTracks()), p.RNODE_MUX_STATE_WDT))
-                    # right node
-                    hrnode_bitlines[x] += (ListToBitline((rn.GetTracks()), p.RNODE_MUX_STATE_WDT))
-                else:
-                    raise ValueError("No routing node at", x, y)
-            # IO muxes up
-            hrnode_bitlines[x] += (ListToBitline(self.fabric[x+1][self.SizeY()-1].GetIOMuxes(), p.BINPUT_MUX_STATE_WDT))
+            if not self.IsLogicBlock(x, y):
+                raise ValueError("No logic block at", x, y)
+            b = self.fabric[x][y]
+            cells = b.cells
+            # block input muxes
+            bitline.append(ListToBitline(b.GetBInputs(), self.p.BINPUT_MUX_STATE_WDT))
+            for c in cells:
+                # cell input mux (crossbar)
+                bitline.append(ListToBitline(c.GetInputs(), self.p.LBCROSS_MUX_STATE_WDT))
+            for c in cells:
+                # cell LUT
+                bitline.append(ListToBitline([c.lut], self.p.FPGA_LUT_SIZE))
+                # cell MUX
+                bitline.append(ListToBitline([c.mux], 1))
+        return ''.join(bitline)
+
+    # config_vrnode chain of vertical routing nodes row y
+    def VrnodeBitline(self, y):
+        bitline = []
+        # IO muxes left
+        bitline.append(ListToBitline(self.fabric[0][y+1].GetIOMuxes(), self.p.BINPUT_MUX_STATE_WDT))
+        for x in range(0, self.RoutingVSizeX()):
+            # up node
+            bitline.append(ListToBitline(self.routing_u[x][y].GetTracks(), self.p.RNODE_MUX_STATE_WDT))
+            # down node
+            bitline.append(ListToBitline(self.routing_d[x][y].GetTracks(), self.p.RNODE_MUX_STATE_WDT))
+        # IO muxes right
+        bitline.append(ListToBitline(self.fabric[self.SizeX()-1][y+1].GetIOMuxes(), self.p.BINPUT_MUX_STATE_WDT))
+        return ''.join(bitline)
+
+    # config_hrnode chain of horizontal routing nodes column x
+    def HrnodeBitline(self, x):
+        bitline = []
+        # IO muxes down
+        bitline.append(ListToBitline(self.fabric[x+1][0].GetIOMuxes(), self.p.BINPUT_MUX_STATE_WDT))
+        for y in range(0, self.RoutingHSizeY()):
+            # left node
+            bitline.append(ListToBitline(self.routing_l[x][y].GetTracks(), self.p.RNODE_MUX_STATE_WDT))
+            # right node
+            bitline.append(ListToBitline(self.routing_r[x][y].GetTracks(), self.p.RNODE_MUX_STATE_WDT))
+        # IO muxes up
+        bitline.append(ListToBitline(self.fabric[x+1][self.SizeY()-1].GetIOMuxes(), self.p.BINPUT_MUX_STATE_WDT))
+        return ''.join(bitline)
+
+    # Shift cycles of config chains
+    def ChainLengths(self):
+        return (self.p.BLOCK_CFGCHAIN_LEN, self.p.VRNODE_CFGCHAIN_LEN, self.p.HRNODE_CFGCHAIN_LEN)
+
+    # Bitstream for loader, chains are built from fabric unless given.
+    # Container & C headers are packed against default words of chains (unconfigured fabric) when given.
+    def WriteBitstream(self, fname, chains = None, defaults = None):
+        if chains is None:
+            chains = self.ConfigChains()
+        lens = self.ChainLengths()
+        columns = [TransposeChains(bitlines, length) for bitlines, length in zip(chains, lens)]
+        cycles = max(lens)
 
         # Write result
-        i = 0
+        with open(fname + ".bit", 'w') as out_bit_file:
+            lines = []
+            for i in range(cycles):
+                lines.append(" ".join(c[i] if i < len(c) else "" for c in columns))
+                lines.append("\n")
+            out_bit_file.write("".join(lines))
+
+        words = [ColumnWords(c, bitlines) for c, bitlines in zip(columns, chains)]
+
         comment = "// Bitstream generated from " + fname
-        print(comment + "\nconst uint16_t lblock_config_data[] = {", file = out_c_file_lb)
-        print(comment + "\nconst uint16_t vnode_config_data[] = {", file = out_c_file_vn)
-        print(comment + "\nconst uint16_t hnode_config_data[] = {", file = out_c_file_hn)
-        while (i < p.BLOCK_CFGCHAIN_LEN) or (i < p.VRNODE_CFGCHAIN_LEN) or (i < p.HRNODE_CFGCHAIN_LEN):
-            lb = ""
-            if (i < p.BLOCK_CFGCHAIN_LEN):
-                # write one bit for each config line for logic blocks
-                for l in block_bitlines:
-                    lb += l[i]
-            vn = ""
-            if (i < p.VRNODE_CFGCHAIN_LEN):
-                # write one bit for each config line for vertical routing nodes blocks
-                for l in vrnode_bitlines:
-                    vn += l[i]
-            hn = ""
-            if (i < p.HRNODE_CFGCHAIN_LEN):
-                # write one bit for each config line for horizontal routing nodes blocks
-                for l in hrnode_bitlines:
-                    hn += l[i]
-
-            print(lb + " " + vn + " " + hn, file=out_bit_file)
-            if lb:
-                if i:
-                    print(",", file=out_c_file_lb)
-                print(hex(int(lb[::-1], 2)), file=out_c_file_lb, end="")
-            if vn:
-                if i:
-                    print(",", file=out_c_file_vn)
-                print(hex(int(vn[::-1], 2)), file=out_c_file_vn, end="")
-            if hn:
-                if i:
-                    print(",", file=out_c_file_hn)
-                print(hex(int(hn[::-1], 2)), file=out_c_file_hn, end="")
-            i += 1
-        print("};\nconst int lblock_config_words = sizeof(lblock_config_data)/sizeof(lblock_config_data[0]);\n", file = out_c_file_lb)
-        print("};\nconst int vnode_config_words = sizeof(vnode_config_data)/sizeof(vnode_config_data[0]);\n", file = out_c_file_vn)
-        print("};\nconst int hnode_config_words = sizeof(hnode_config_data)/sizeof(hnode_config_data[0]);\n", file = out_c_file_hn)
+        for i, (suffix, array_name) in enumerate((("_lb_bit.h", "lblock_config"), ("_vn_bit.h", "vnode_config"), ("_hn_bit.h", "hnode_config"))):
+            w = words[i]
+            units = None
+            # decoder in header works on 16 bit units
+            if (defaults is not None) and (len(chains[i]) <= 16):
+                units = PackWords(w, defaults[i], len(chains[i]), 2)
+            with open(fname + suffix, 'w') as out_c_file:
+                if units is None:
+                    print(comment + "\nconst uint16_t " + array_name + "_data[] = {", file = out_c_file)
+                    print(",\n".join(hex(e) for e in w), file = out_c_file, end="")
+                    print("};\nconst int " + array_name + "_words = sizeof(" + array_name + "_data)/sizeof(" + array_name + "_data[0]);\n", file = out_c_file)
+                else:
+                    print(comment + "\n" + PACKED_DECODER_C, file = out_c_file)
+                    print("const uint16_t " + array_name + "_packed[] = {", file = out_c_file)
+                    print(",\n".join(hex(e) for e in units), file = out_c_file, end="")
+                    print("};\nconst int " + array_name + "_words = " + str(len(w)) + ";\n", file = out_c_file)
+
+        # Packed binary container
+        WriteBitfile(fname + ".ubit", self.p, self.SizeX(), self.SizeY(), [(len(bitlines), w) for bitlines, w in zip(chains, words)], defaults)
+
+
+# Unpacker of packed config arrays in C headers (see bitfile.py for format)
+PACKED_DECODER_C = """#ifndef FPGA_CONFIG_UNPACK
+#define FPGA_CONFIG_UNPACK
+// Calls put() with each of words config words packed in z, in shift order
+static void fpga_config_unpack(const uint16_t *z, int words, void (*put)(uint16_t))
+{
+    int period = z[0], phase = 0;
+    uint16_t mask = z[1];
+    const uint16_t *dict = z + 2;
+    z += 2 + (period + 15) / 16;
+    while (words > 0) {
+        int op = *z >> 14, n = *z++ & 0x3fff;
+        words -= n;
+        while (n--) {
+            if (op == 0)
+                put(((dict[phase >> 4] >> (phase & 15)) & 1) ? mask : 0);
+            else if (op == 1)
+                put(*z);
+            else
+                put(*z++);
+            if (++phase == period)
+                phase = 0;
+        }
+        if (op == 1)
+            z++;
+    }
+}
+#endif
+"""
+
+
+# Transpose config chains to per-cycle columns: column i holds bit i of every chain
+def TransposeChains(bitlines, length):
+    for l in bitlines:
+        if len(l) < length:
+            raise ValueError("Config chain is shorter than expected:", len(l), "<", length)
+    # chains laid out back to back, so each column is a single strided slice
+    data = "".join(l[:length] for l in bitlines)
+    return [data[i::length] for i in range(length)]
+
+# Per-cycle words of chain from its columns, column bit for first chain is LSB of the word
+def ColumnWords(columns, bitlines):
+    return [int(col[::-1], 2) for col in columns] if len(bitlines) else []
+
+# Reversed bit patterns of all values for short fields
+bitline_tables = dict()
 
 def ListToBitline(lst, length):
-    s = ""
+    table = bitline_tables.get(length)
+    if table is None:
+        fmt = "0" + str(length) + "b"
+        table = [format(e, fmt)[::-1] for e in range(1 << min(length, 8))]    # reversed!
+        bitline_tables[length] = table
+    ones = "1" * length
+    fmt = "0" + str(length) + "b"
+    s = []
     for e in lst:
         if e < 0:
-            s += "1" * length
+            s.append(ones)
+        elif e < len(table):
+            s.append(table[e])
         else:
-            s += (("{0:0"+str(length)+"b}").format(e))[::-1]    # reversed!
-    return s
+            s.append(format(e, fmt)[::-1])    # reversed!
+    return "".join(s)
 
 
-################################# MAIN #################################
+################################# ECO ##################################
+
+ECO_STATE_VERSION = 2
 
-# Parse parameters
-if len(sys.argv) < 4:
-    print('Usage: bitgen.py arch_params_file vtr_files_basename output_file')
-    exit(1)
+# Empty state of incremental bitgen for fabric config (plain data only, so it can be loaded from any module)
+def NewEcoState(config):
+    return {"version" : ECO_STATE_VERSION,
+            "params_hash" : ParamsHash(config.p),
+            "config" : config.GetState(),
+            "blocks" : dict(),  # top level .net block name -> (digest, objtype, x, y, subblock)
+            "nets" : dict(),    # .route net name -> (digest, Route_chan tuples, Route_sink tuples)
+            "chains" : None}    # config chains bitlines
 
-p = Params(sys.argv[1])
 
-base_name = sys.argv[2]
-out_name = sys.argv[3]
+# State saved by previous run or None if there is no usable one
+def LoadEcoState(fname, p):
+    if not os.path.exists(fname):
+        return None
+    with open(fname, "rb") as f:
+        state = pickle.load(f)
+    if (state.get("version") != ECO_STATE_VERSION) or (state["params_hash"] != ParamsHash(p)):
+        print("ECO state", fname, "was saved for other FPGA parameters or bitgen version, ignored")
+        return None
+    return state
 
-# Open files
-blif_file = Blif_parser(base_name + '.eblif')
-net_file = xml.etree.ElementTree.parse(base_name + '.net').getroot()
-place_file = Place_parser(base_name + '.place')
-route_file = Route_parser(base_name + '.route')
-out_file = open(out_name, 'w')
 
-# Create fabric
-fpga_fabric = Fpga_fabric(p.FPGA_FABRIC_SIZE_X, p.FPGA_FABRIC_SIZE_Y)
-fpga_fabric.Load(net_file, place_file, blif_file, route_file)
+def SaveEcoState(fname, state):
+    # replaced at once, so interrupted run leaves the old state
+    with open(fname + ".tmp", "wb") as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(fname + ".tmp", fname)
+
+
+# Updates fabric loaded from ECO state with changed blocks & nets, tracks config chain lines they touch
+class Eco_update(object):
+    # Attributes:
+    #
+    # fabric
+    # state
+    # dirty (sets of touched chain lines: logic block columns, vertical node rows, horizontal node columns)
+
+    def __init__(self, fabric, state):
+        self.fabric = fabric
+        self.state = state
+        self.dirty = (set(), set(), set())
+
+    # Mark chain lines holding config of fabric tile
+    def TouchTile(self, x, y):
+        f = self.fabric
+        if f.IsLogicBlock(x, y):
+            self.dirty[0].add(x-1)
+        elif (x == 0) or (x == f.SizeX()-1):
+            self.dirty[1].add(y-1)
+        elif (y == 0) or (y == f.SizeY()-1):
+            self.dirty[2].add(x-1)
+
+    def TouchHop(self, hop):
+        if type(hop) == Route_sink:
+            self.TouchTile(hop.x, hop.y)
+        elif (hop.chandir == DIR_UP) or (hop.chandir == DIR_DOWN):
+            self.dirty[1].add(hop.y-1)
+        else:
+            self.dirty[2].add(hop.x-1)
 
-# Write fabric bitstream
-print('Writing config to output files...')
-fpga_fabric.Print(out_file)
-fpga_fabric.WriteBitstream(out_name)
+    # Block placement slot: logic tile or IO pad pin
+    def Slot(self, key):
+        digest, objtype, x, y, s = key
+        return (x, y) if objtype == OBJTYPE_BLOCK else (x, y, s)
 
-print('Bitgen completed!')
+    def ClearSlot(self, slot):
+        if len(slot) == 2:
+            self.fabric.fabric[slot[0]][slot[1]].ClearCells()
+        else:
+            self.fabric.fabric[slot[0]][slot[1]].Clear(slot[2])
+        self.TouchTile(slot[0], slot[1])
+
+    # Reload blocks whose .net subtree, LUT covers or placement changed, returns counters
+    def UpdateBlocks(self, net_file, place_file, blif_file):
+        print('Processing changed logic blocks...')
+        old = self.state["blocks"]
+        old_slots = set(self.Slot(key) for key in old.values())
+        blocks = dict()
+        cleared = set()
+        changed = 0
+        for block, digest in net_file.Blocks(digests = True):
+            name = block.get('name')
+            coord = place_file.CoordByName(name)
+            objtype = self.fabric.BlockType(block, coord)
+            if objtype == OBJTYPE_NONE:
+                continue
+            h = hashlib.sha1(digest)
+            for b in block.iter("block"):
+                cover = blif_file.covers.get(b.get("name"))
+                if cover is not None:
+                    h.update(repr(cover).encode())
+            key = (h.digest(), objtype, coord.x, coord.y, coord.s)
+            blocks[name] = key
+            if old.get(name) == key:
+                continue
+
+            # unload old block at this place unless it was done already (another block may have been loaded there)
+            slot = self.Slot(key)
+            if (slot in old_slots) and (slot not in cleared):
+                self.ClearSlot(slot)
+            cleared.add(slot)
+            if objtype == OBJTYPE_BLOCK:
+                self.fabric.fabric[coord.x][coord.y].LoadFromXml(block, blif_file)
+            else:
+                self.fabric.fabric[coord.x][coord.y].LoadFromXml(coord.s, block)
+            self.TouchTile(coord.x, coord.y)
+            changed += 1
+
+        # unload removed & moved blocks
+        removed = 0
+        for name, key in old.items():
+            if blocks.get(name) != key:
+                removed += name not in blocks
+                slot = self.Slot(key)
+                if slot not in cleared:
+                    self.ClearSlot(slot)
+                    cleared.add(slot)
+        self.state["blocks"] = blocks
+        return {"blocks" : len(blocks), "eco_blocks" : changed, "eco_removed_blocks" : removed}
+
+    # Re-route nets whose .route lines changed, returns counters
+    def UpdateRoute(self, route_file):
+        print('Processing changed nets...')
+        old = self.state["nets"]
+        nets = dict()
+        changed = []
+        for name, lines in route_file.Nets():
+            # net number in header line changes when nets are added or removed
+            digest = hashlib.sha1("".join(lines[1:]).encode()).digest()
+            prev = old.get(name)
+            if (prev is not None) and (prev[0] == digest):
+                nets[name] = prev
+            else:
+                changed.append((name, digest, lines))
+
+        # unset muxes of changed & removed nets before any new ones are set
+        removed = 0
+        for name, prev in old.items():
+            if nets.get(name) is not prev:
+                removed += name not in nets
+                for hop in [Route_chan(*t) for t in prev[1]] + [Route_sink(*t) for t in prev[2]]:
+                    self.fabric.SetHop(hop, clear = True)
+                    self.TouchHop(hop)
+
+        for name, digest, lines in changed:
+            chans = []
+            sinks = []
+            for hop in route_file.Hops(lines):
+                if type(hop) == Route_chan:
+                    chans.append(tuple(hop))
+                elif type(hop) == Route_sink:
+                    sinks.append(tuple(hop))
+                else:
+                    continue
+                self.fabric.SetHop(hop)
+                self.TouchHop(hop)
+            nets[name] = (digest, chans, sinks)
+        self.state["nets"] = nets
+        return {"nets" : len(nets), "eco_nets" : len(changed), "eco_removed_nets" : removed}
+
+    # Config chains with touched lines rebuilt, returns chains & lists of lines which differ from previous run
+    def UpdateChains(self):
+        f = self.fabric
+        old = self.state["chains"]
+        if old is None:
+            chains = f.ConfigChains()
+            changed = [list(range(len(c))) for c in chains]
+        else:
+            chains = tuple(list(c) for c in old)
+            changed = []
+            for bitlines, dirty, build, offset in zip(chains, self.dirty, (f.BlockBitline, f.VrnodeBitline, f.HrnodeBitline), (1, 0, 0)):
+                lines = []
+                for i in sorted(dirty):
+                    bitline = build(i + offset)
+                    if bitline != bitlines[i]:
+                        bitlines[i] = bitline
+                        lines.append(i)
+                changed.append(lines)
+        self.state["chains"] = chains
+        return chains, changed
+
+
+################################# API ##################################
+
+# Suffixes of files written for output name
+OUTPUT_SUFFIXES = ["", ".bit", ".ubit", "_lb_bit.h", "_vn_bit.h", "_hn_bit.h"]
+# Config chains in container order
+CHAIN_NAMES = ("lblock", "vnode", "hnode")
+# Sources which define outputs for given inputs, cached results of other versions are not used
+CODE_FILES = ["bitgen.py", "bitfile.py"]
+
+
+class Bitgen(object):
+    # Attributes:
+    #
+    # p
+    # jobs
+    # template (empty fabric config, copied for every design)
+    # profiler
+    # cache (Result_cache of outputs or None)
+    # rr_graph (VPR rr graph file name or loaded Rr_graph to decode routes with, None to decode them from .route strings)
+    # compress (pack bitstream container & C headers against default words)
+    # default_words (per-cycle words of unconfigured fabric chains, built on first use)
+
+    def __init__(self, params, jobs = 1, profiler = None, cache = None, rr_graph = None, compress = False):
+        # params may be loaded Params or cfg file name
+        if isinstance(params, str):
+            params = Params(params)
+        self.p = params
+        self.jobs = jobs
+        self.profiler = profiler if profiler is not None else Phase_profiler()
+        self.cache = cache
+        self.rr_graph = rr_graph
+        self.compress = compress
+        self.default_words = None
+        with self.profiler.Phase("fabric_template"):
+            self.template = Fabric_config(self.p, self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y)
+
+    # Rr graph loaded on first use, it is the same for every design
+    def RrGraph(self):
+        if isinstance(self.rr_graph, str):
+            with self.profiler.Phase("rr_graph"):
+                self.rr_graph = Rr_graph(self.rr_graph)
+        return self.rr_graph
+
+    # Words to pack chains against, or None if bitstream is not packed
+    def DefaultWords(self):
+        if self.compress and (self.default_words is None):
+            with self.profiler.Phase("default_words"):
+                fabric = Fpga_fabric(self.p, self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y, self.template.Copy())
+                self.default_words = [ColumnWords(TransposeChains(bitlines, length), bitlines)
+                    for bitlines, length in zip(fabric.ConfigChains(), fabric.ChainLengths())]
+        return self.default_words
+
+    # Load VPR output files for design & return fabric model
+    def Load(self, base_name):
+        prof = self.profiler
+        with prof.Phase("blif_parse"):
+            blif_file = Blif_parser(base_name + '.eblif', self.p.FPGA_LUT_WIDTH)
+        with prof.Phase("place_parse"):
+            place_file = Place_parser(base_name + '.place')
+        with prof.Phase("fabric_init"):
+            fpga_fabric = Fpga_fabric(self.p, self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y, self.template.Copy())
+        with prof.Phase("net_blocks"):
+            # XML parsing, placement lookup & LUT extraction
+            prof.AddCounters(fpga_fabric.LoadNet(Net_parser(base_name + '.net'), place_file, blif_file, self.jobs))
+        with prof.Phase("route"):
+            prof.AddCounters(fpga_fabric.LoadRoute(Route_parser(self.p, base_name + '.route', rr_graph = self.RrGraph())))
+        return fpga_fabric
+
+    # Cache key of outputs: input files, resolved params, bitgen sources & output name (it is written to headers)
+    def CacheKey(self, base_name, out_name):
+        code_dir = os.path.dirname(os.path.abspath(__file__))
+        files = [base_name + ext for ext in (".eblif", ".net", ".place", ".route")]
+        files += [os.path.join(code_dir, fname) for fname in CODE_FILES]
+        if self.rr_graph is not None:
+            files.append(self.rr_graph if isinstance(self.rr_graph, str) else self.rr_graph.fname)
+        return self.cache.Key(files, (ParamsHash(self.p), out_name, self.compress))
+
+    # Generate config for design from VPR output files with given base name.
+    # Returns fabric model or None if outputs were restored from cache.
+    def Run(self, base_name, out_name):
+        prof = self.profiler
+        prof.info.update({"design" : base_name, "fabric" : [self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y], "jobs" : self.jobs})
+        if self.cache is not None:
+            outputs = {"out" + suffix : out_name + suffix for suffix in OUTPUT_SUFFIXES}
+            with prof.Phase("cache_lookup"):
+                key = self.CacheKey(base_name, out_name)
+                hit = self.cache.Restore(key, outputs)
+            prof.info["cache_hit"] = hit
+            if hit:
+                print('Bitgen outputs restored from cache', self.cache.path)
+                return None
+        fpga_fabric = self.Load(base_name)
+
+        # Write fabric bitstream
+        print('Writing config to output files...')
+        with prof.Phase("print_txt"):
+            with open(out_name, 'w') as out_file:
+                fpga_fabric.Print(out_file)
+        with prof.Phase("write_bitstream"):
+            fpga_fabric.WriteBitstream(out_name, defaults = self.DefaultWords())
+        if self.cache is not None:
+            with prof.Phase("cache_store"):
+                self.cache.Store(key, outputs)
+
+        print('Bitgen completed!')
+        return fpga_fabric
+
+    run = Run
+
+    # Incremental Run: fabric config of the previous run is loaded from state file & only blocks and nets which changed since are updated.
+    # Returns fabric & lists of changed lines of every config chain.
+    def RunEco(self, base_name, out_name, state_fname):
+        prof = self.profiler
+        prof.info.update({"design" : base_name, "fabric" : [self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y], "eco_state" : state_fname})
+        with prof.Phase("eco_load_state"):
+            state = LoadEcoState(state_fname, self.p)
+            if state is None:
+                print("No ECO state, building whole fabric")
+                state = NewEcoState(self.template.Copy())
+            config = self.template.Copy()
+            config.SetState(state["config"])
+        with prof.Phase("blif_parse"):
+            blif_file = Blif_parser(base_name + '.eblif', self.p.FPGA_LUT_WIDTH)
+        with prof.Phase("place_parse"):
+            place_file = Place_parser(base_name + '.place')
+
+        fpga_fabric = Fpga_fabric(self.p, self.p.FPGA_FABRIC_SIZE_X, self.p.FPGA_FABRIC_SIZE_Y, config)
+        eco = Eco_update(fpga_fabric, state)
+        with prof.Phase("eco_blocks"):
+            counters = eco.UpdateBlocks(Net_parser(base_name + '.net'), place_file, blif_file)
+        with prof.Phase("eco_route"):
+            counters.update(eco.UpdateRoute(Route_parser(self.p, base_name + '.route', rr_graph = self.RrGraph())))
+        with prof.Phase("eco_chains"):
+            chains, changed = eco.UpdateChains()
+        prof.AddCounters(counters)
+        prof.info["eco_changed_chains"] = dict(zip(CHAIN_NAMES, changed))
+
+        print("ECO: {} of {} blocks & {} of {} nets changed, {} blocks & {} nets removed".format(
+            counters["eco_blocks"], counters["blocks"], counters["eco_nets"], counters["nets"], counters["eco_removed_blocks"], counters["eco_removed_nets"]))
+        for chain, lines in zip(CHAIN_NAMES, changed):
+            print("Changed", chain, "config chains:", " ".join(str(i) for i in lines) if lines else "none")
+
+        print('Writing config to output files...')
+        with prof.Phase("print_txt"):
+            with open(out_name, 'w') as out_file:
+                fpga_fabric.Print(out_file)
+        with prof.Phase("write_bitstream"):
+            fpga_fabric.WriteBitstream(out_name, chains, self.DefaultWords())
+        with prof.Phase("eco_save_state"):
+            state["config"] = config.GetState()
+            SaveEcoState(state_fname, state)
+
+        print('Bitgen completed!')
+        return fpga_fabric, changed
+
+    # Write delta of output container against base one (loaded Bitfile_parser, it must not map the output file).
+    # Returns reload sequence as list of (chain, length, ranges of differing cycles).
+    def Delta(self, base, out_name):
+        with self.profiler.Phase("delta"):
+            target = Bitfile_parser(out_name + ".ubit", use_mmap = False)
+            reload = WriteDelta(out_name + ".udelta", base, target)
+        full = sum(c[1] for c in target.chains)
+        cycles = sum(length for chain, length, ranges in reload)
+        self.profiler.info["delta_reload_cycles"] = cycles
+        print("Delta: {} of {} config chains changed, reload {} of {} shift cycles".format(len(reload), target.Chains(), cycles, full))
+        for chain, length, ranges in reload:
+            print("Reload", CHAIN_NAMES[chain], "chain:", length, "cycles, differing cycles",
+                " ".join(str(first) if count == 1 else "{}-{}".format(first, first + count - 1) for first, count in ranges))
+        return reload
+
+
+################################# MAIN #################################
+
+def main():
+    # Parse parameters
+    parser = argparse.ArgumentParser(description="Generate FPGA config from VPR output files")
+    parser.add_argument("arch_params_file", type=str, help="FPGA parameters cfg file")
+    parser.add_argument("vtr_files_basename", type=str, help="Base name of .eblif, .net, .place & .route files")
+    parser.add_argument("output_file", type=str, help="Output config file")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes decoding logic blocks")
+    parser.add_argument("--profile", type=str, default="", help="Write per-phase time, memory & counters to this JSON file")
+    parser.add_argument("--no_tracemalloc", action="store_true", help="Do not trace Python allocations in profile mode (faster, only max RSS is reported)")
+    parser.add_argument("--cprofile", type=str, default="", help="Write cProfile stats to this file")
+    parser.add_argument("--cache", type=str, default="", help="Reuse outputs from this cache directory if inputs did not change")
+    parser.add_argument("--cache_size", type=float, default=1024, help="Cache size limit in MB, least recently used results are evicted")
+    parser.add_argument("--rr_graph", type=str, default="", help="Decode routes with VPR rr graph XML written by --write_rr_graph")
+    parser.add_argument("--state", type=str, default="", help="Keep fabric state in this file & update only blocks and nets changed since the run which saved it (ECO mode)")
+    parser.add_argument("--compress", action="store_true", help="Pack .ubit & C headers against default words of unconfigured fabric")
+    parser.add_argument("--delta_from", type=str, default="", help="Also write .udelta of output against this previous .ubit (partial reconfiguration)")
+    args = parser.parse_args()
+
+    profiler = Phase_profiler(bool(args.profile), not args.no_tracemalloc)
+    cprofiler = None
+    if args.cprofile:
+        import cProfile
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+
+    profiler.Start()
+    with profiler.Phase("params"):
+        p = Params(args.arch_params_file)
+    # read before it may be overwritten by output
+    base = Bitfile_parser(args.delta_from, use_mmap = False) if args.delta_from else None
+    if args.state:
+        bitgen = Bitgen(p, args.jobs, profiler, rr_graph = args.rr_graph or None, compress = args.compress)
+        bitgen.RunEco(args.vtr_files_basename, args.output_file, args.state)
+    else:
+        cache = Result_cache(args.cache, args.cache_size) if args.cache else None
+        bitgen = Bitgen(p, args.jobs, profiler, cache, args.rr_graph or None, args.compress)
+        bitgen.Run(args.vtr_files_basename, args.output_file)
+    if base is not None:
+        bitgen.Delta(base, args.output_file)
+    profiler.Stop()
+
+    if cprofiler is not None:
+        cprofiler.disable()
+        cprofiler.dump_stats(args.cprofile)
+    if args.profile:
+        profiler.WriteJson(args.profile)
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+#
+# Scaling benchmarks for bitgen parsers & whole pipeline
+#
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from bitgen import Place_parser, Lut_engine, Route_parser, Fpga_fabric, DIR_RIGHT
+from bench_design import GenerateDesign, ParseSize
+from params import Params
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+BENCHES = ["place", "lut", "route", "fabric", "pipeline"]
+# pipeline is slow (design generation), run only when asked for
+DEFAULT_BENCHES = ["place", "lut", "route", "fabric"]
+DEFAULT_FABRICS = ["12x13", "32x32", "64x64", "128x128"]
+
+# Per phase metrics compared against baseline & noise floor below which changes are ignored
+REGRESSION_METRICS = {"wall_s" : 0.05, "peak_traced_mb" : 1.0}
+
+
+# Write synthetic .place file with n blocks spread over square fabric, returns list of names
+def WritePlaceFile(fname, n):
+    side = int(n ** 0.5) + 3
+    names = []
+    with open(fname, "w") as f:
+        print("Netlist_File: bench.net Netlist_ID: SHA256:0", file=f)
+        print("Array size:", side, "x", side, "logic blocks\n", file=f)
+        print("#block name\tx\ty\tsubblk\tblock number", file=f)
+        print("#----------\t--\t--\t------\t------------", file=f)
+        for i in range(n):
+            name = "blk_" + str(i)
+            print(name, 1 + i % (side-2), 1 + (i // (side-2)) % (side-2), 0, "#" + str(i), sep="\t", file=f)
+            names.append(name)
+    return names
+
+
+# Old rewind & scan lookup, kept for comparison
+def LegacyCoordByName(f, name):
+    f.seek(0, 0)
+    for l in f:
+        s = l.split()
+        if (len(s) > 1) and (name == s[0]):
+            return (int(s[1]), int(s[2]), int(s[3]))
+    return None
+
+
+def BenchPlace(sizes, legacy_max):
+    print("Placement lookup (.place)")
+    print("  blocks     parse, s   lookup, s  lookup/blk, us   legacy, s")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fname = os.path.join(tmp, "bench_" + str(n) + ".place")
+            names = WritePlaceFile(fname, n)
+
+            t0 = time.perf_counter()
+            place = Place_parser(fname)
+            t1 = time.perf_counter()
+            for name in names:
+                c = place.CoordByName(name)
+                place.NamesByCoord(c.x, c.y)
+            t2 = time.perf_counter()
+
+            legacy = "-"
+            if n <= legacy_max:
+                with open(fname, "r") as f:
+                    t3 = time.perf_counter()
+                    for name in names:
+                        LegacyCoordByName(f, name)
+                    legacy = "{:.3f}".format(time.perf_counter() - t3)
+
+            print("{:8d} {:11.3f} {:11.3f} {:15.3f} {:>11s}".format(n, t1-t0, t2-t1, (t2-t1) / n * 1e6, legacy))
+
+
+# Random .names cover with k inputs
+def RandomCover(rnd, k):
+    rows = []
+    for i in range(rnd.randint(1, 1 << (k-1))):
+        rows.append(["".join(rnd.choice("01-") for j in range(k)), "1"])
+    return rows
+
+
+def BenchLut(sizes, widths):
+    print("LUT truth tables (.names covers)")
+    print("   width     luts  compute, s   per LUT, us")
+    rnd = random.Random(1)
+    for width in widths:
+        for n in sizes:
+            covers = [RandomCover(rnd, rnd.randint(1, width)) for i in range(n)]
+            rotations = []
+            for i in range(n):
+                pins = list(range(width))
+                rnd.shuffle(pins)
+                rotations.append(" ".join(str(j) for j in pins))
+            engine = Lut_engine(width)
+            t0 = time.perf_counter()
+            for cover, rotation_map in zip(covers, rotations):
+                engine.CoverToLut(cover, rotation_map)
+            t1 = time.perf_counter()
+            print("{:8d} {:8d} {:11.3f} {:13.3f}".format(width, n, t1-t0, (t1-t0) / n * 1e6))
+
+
+# Write synthetic .route file with n track hops in straight left to right nets, returns number of lines
+def WriteRouteFile(fname, n, parser):
+    width = parser.p.FPGA_FABRIC_SIZE_X - 1
+    forward = parser.SwitchTracks()[(DIR_RIGHT, DIR_RIGHT)][1]
+    lines = 0
+    with open(fname, "w") as f:
+        print("Placement_File: bench.place Placement_ID: SHA256:0", file=f)
+        print("Array size:", width, "x", width, "logic blocks.\n\nRouting:", file=f)
+        net = 0
+        while n > 0:
+            y = net % (parser.p.FPGA_FABRIC_SIZE_Y - 1)
+            track = net % parser.p.TRACKS_PER_RNODE
+            print("\nNet", net, "(n" + str(net) + ")\n", file=f)
+            # SINK makes the next track a branch point, so the whole net is track to track hops
+            print("Node:\t0\t  SINK (0,0)  Class: 0  Switch: -1", file=f)
+            for x in range(1, min(width, n+1)):
+                print("Node:\t" + str(2 * (x * 1000 + track)) + "\t CHANX (" + str(x) + "," + str(y) + ")  Track: " + str(track * 2) + "  Switch: 0", file=f)
+                track = forward[track]
+                n -= 1
+                lines += 1
+            net += 1
+            lines += 4
+    return lines
+
+
+def BenchRoute(sizes, cfg):
+    print("Route parsing (.route)")
+    print("    hops    lines     read, s    mmap, s  lines/s, k")
+    p = Params(cfg)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fname = os.path.join(tmp, "bench_" + str(n) + ".route")
+            lines = WriteRouteFile(fname, n, Route_parser(p, fname))
+
+            times = []
+            for use_mmap in (False, True):
+                t0 = time.perf_counter()
+                for hop in Route_parser(p, fname, use_mmap).Hops():
+                    pass
+                times.append(time.perf_counter() - t0)
+            print("{:8d} {:8d} {:11.3f} {:10.3f} {:11.1f}".format(n, lines, times[0], times[1], lines / times[0] / 1e3))
+
+
+def BenchFabric(sizes, cfg):
+    print("Fabric model construction")
+    print("  blocks     fabric   build, s   touch all, s")
+    p = Params(cfg)
+    for n in sizes:
+        side = int(n ** 0.5) + 2
+        t0 = time.perf_counter()
+        fabric = Fpga_fabric(p, side, side)
+        t1 = time.perf_counter()
+        for x in range(1, side-1):
+            for y in range(1, side-1):
+                fabric.fabric[x][y].SetInput(0, 0)
+        t2 = time.perf_counter()
+        print("{:8d} {:>10s} {:10.4f} {:14.3f}".format(n, str(side) + "x" + str(side), t1-t0, t2-t1))
+
+
+# Run bitgen.py on generated designs of every fabric size in own process (so max RSS is per design), returns results
+def BenchPipeline(fabrics, util, cfg, work_dir, jobs, repeat):
+    print("Bitgen pipeline phases on synthetic designs (util " + str(util) + ")")
+    bitgen_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitgen.py")
+    results = dict()
+    for fabric in fabrics:
+        sx, sy = ParseSize(fabric)
+        design_dir = os.path.join(work_dir, "{}x{}_u{}".format(sx, sy, util))
+        t0 = time.perf_counter()
+        design_cfg, basename = GenerateDesign(cfg, design_dir, sx, sy, util)
+        gen_time = time.perf_counter() - t0
+
+        # best of repeated runs per phase
+        phases = dict()
+        for i in range(repeat):
+            profile = basename + "_profile.json"
+            cmd = [sys.executable, bitgen_py, design_cfg, basename, basename + "_config.txt", "--jobs", str(jobs), "--profile", profile]
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+            with open(profile, "r") as f:
+                run = json.load(f)
+            for r in run["phases"]:
+                best = phases.setdefault(r["name"], dict())
+                for metric in ("wall_s", "peak_traced_mb", "max_rss_mb"):
+                    if r.get(metric) is not None:
+                        best[metric] = min(best.get(metric, r[metric]), r[metric])
+        results[fabric] = {"phases" : phases, "counters" : run["counters"], "max_rss_mb" : run["info"]["max_rss_mb"]}
+
+        print("  {} fabric, {} cells, {} route hops (generated in {:.1f} s)".format(fabric, run["counters"].get("cells", 0), run["counters"].get("chan_hops", 0), gen_time))
+        print("      phase               wall, s   peak, MB")
+        for name, r in phases.items():
+            print("      {:16s} {:10.3f} {:10.1f}".format(name, r["wall_s"], r.get("peak_traced_mb", 0)))
+        print("      {:16s} {:10.3f} {:10s} (max RSS {:.1f} MB)".format("total", sum(r["wall_s"] for r in phases.values()), "", results[fabric]["max_rss_mb"] or 0))
+    return results
+
+
+# Compare pipeline results with baseline ones, returns list of regression descriptions
+def PipelineRegressions(results, baseline, threshold):
+    regressions = []
+    for fabric, res in results.items():
+        if fabric not in baseline:
+            continue
+        for name, r in res["phases"].items():
+            base = baseline[fabric]["phases"].get(name)
+            if base is None:
+                continue
+            for metric, floor in REGRESSION_METRICS.items():
+                if (metric not in r) or (metric not in base):
+                    continue
+                if (r[metric] > base[metric] * (1 + threshold)) and (r[metric] - base[metric] > floor):
+                    regressions.append("{} {} {}: {:.3f} -> {:.3f}".format(fabric, name, metric, base[metric], r[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitgen parsers scaling benchmarks")
+    parser.add_argument("benches", type=str, nargs="*", default=DEFAULT_BENCHES, help="Benchmarks to run: " + ", ".join(BENCHES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of placed blocks to benchmark")
+    parser.add_argument("--lut_widths", type=int, nargs="+", default=[4, 6], help="LUT widths for truth table benchmark")
+    parser.add_argument("--cfg", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "../arch/params.cfg"), help="FPGA params config for route & fabric benchmarks")
+    parser.add_argument("--legacy_max", type=int, default=3000, help="Largest size to also run old O(N^2) lookup for")
+    parser.add_argument("--fabrics", type=str, nargs="+", default=DEFAULT_FABRICS, help="Fabric sizes (XxY) for pipeline benchmark")
+    parser.add_argument("--util", type=float, default=0.5, help="Logic block utilization of pipeline benchmark designs")
+    parser.add_argument("--work_dir", type=str, default="bench_work", help="Directory keeping generated pipeline designs between runs")
+    parser.add_argument("--jobs", type=int, default=1, help="Bitgen processes for pipeline benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="Take best of this many pipeline runs")
+    parser.add_argument("--save", type=str, default="", help="Write pipeline results to this JSON file")
+    parser.add_argument("--baseline", type=str, default="", help="Fail if pipeline phase is slower / bigger than in this saved JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression against baseline")
+    args = parser.parse_args()
+    # not checked by choices, argparse would check the whole default list against them
+    unknown = [b for b in args.benches if b not in BENCHES]
+    if unknown:
+        parser.error("unknown benchmarks " + ", ".join(unknown) + ", choose from " + ", ".join(BENCHES))
+
+    if "place" in args.benches:
+        BenchPlace(args.sizes, args.legacy_max)
+    if "lut" in args.benches:
+        BenchLut(args.sizes, args.lut_widths)
+    if "route" in args.benches:
+        BenchRoute(args.sizes, args.cfg)
+    if "fabric" in args.benches:
+        BenchFabric(args.sizes, args.cfg)
+    if "pipeline" in args.benches:
+        results = BenchPipeline(args.fabrics, args.util, args.cfg, args.work_dir, args.jobs, args.repeat)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(results, f, indent=2)
+                print(file=f)
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                regressions = PipelineRegressions(results, json.load(f), args.threshold)
+            for r in regressions:
+                print("REGRESSION:", r)
+            if regressions:
+                sys.exit(1)
+            print("No regressions against", args.baseline)
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../bitfile.py
\ No newline at end of file
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+#
+# Cycle based functional simulator of configured fabric
+#
+# Config muxes are static, so every routing track, block input & crossbar input is resolved
+# once to the cell output or IO input driving it & fabric becomes netlist of LUTs & registers.
+# Signal value is an int holding one bit per stimulus vector, so any number of independent
+# vectors (64 by default) is evaluated by a single pass of bitwise operations.
+#
+# Connectivity follows fpga_fabric.vhd, fpga_struct_block.vhd & fpga_logic_block.vhd,
+# coords of routing tracks below are coords of fabric.vhd too (up/down nodes x from 0,
+# left/right nodes x from 1), not the ones of bitgen node grids.
+#
+
+import argparse
+import random
+import sys
+import time
+from params import Params
+from bitgen import Coord, DIR_UP, DIR_DOWN, DIR_LEFT, DIR_RIGHT
+
+# Signal of constant zero, fabric IO inputs follow, then cell outputs
+GND = 0
+
+# Block side as numbered by block outputs & block input muxes
+BLOCK_SIDE = {DIR_UP : 0, DIR_RIGHT : 1, DIR_DOWN : 2, DIR_LEFT : 3}
+
+
+# LUT table with input k tied to v, inputs above k move one down
+def Cofactor(lut, width, k, v):
+    r = 0
+    j = 0
+    for i in range(1 << width):
+        if ((i >> k) & 1) == v:
+            r |= ((lut >> i) & 1) << j
+            j += 1
+    return r
+
+
+# LUT output for every vector, first n of input signal values (LSB first) are used
+def LutEval(lut, ins, n, ones):
+    if n == 0:
+        return ones if lut else 0
+    half = 1 << (n-1)
+    lo = lut & ((1 << half) - 1)
+    hi = lut >> half
+    s = ins[n-1]
+    a = LutEval(lo, ins, n-1, ones) if lo else 0
+    b = LutEval(hi, ins, n-1, ones) if hi else 0
+    return (a & ~s) | (b & s)
+
+
+# Strongly connected components of graph {node: [successors]}, every one after components it reaches
+def StronglyConnected(graph):
+    index = dict()
+    low = dict()
+    stack = []
+    on_stack = set()
+    r = []
+    for root in graph:
+        if root in index:
+            continue
+        # Tarjan's algorithm with explicit stack, dependency chains are too long for recursion
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        n = stack.pop()
+                        on_stack.discard(n)
+                        component.append(n)
+                        if n == node:
+                            break
+                    r.append(component)
+    return r
+
+
+# Per-vector bits (first is vector 0) to signal value & back
+def Pack(bits):
+    return sum(1 << i for i, b in enumerate(bits) if b)
+
+def Unpack(value, vectors):
+    return [(value >> i) & 1 for i in range(vectors)]
+
+
+# Connectivity of configured fabric: every routing track, block input & crossbar input is
+# resolved to the cell output or IO input driving it. Mux inputs are given as refs, a ref
+# is either signal (int) or routing track (direction, x, y, track).
+class Fabric_routes(object):
+    # Attributes:
+    #
+    # p
+    # fabric
+    # config
+    # size_x
+    # size_y
+    # cell_base (signal of first cell output)
+    # tracks (resolved routing tracks, track -> (signal, routing muxes from driver to the track))
+    # users (track -> tracks with mux selecting it, they are resolved through it)
+
+    def __init__(self, fabric):
+        self.p = fabric.p
+        self.fabric = fabric
+        self.config = fabric.config
+        self.size_x = fabric.SizeX()
+        self.size_y = fabric.SizeY()
+        self.cell_base = 1 + self.p.FABRIC_IO
+        self.tracks = dict()
+        self.users = dict()
+
+    # First fabric IO index of pad (XYtoIOr of fpga_pkg.vhd)
+    def IoIndex(self, x, y):
+        p = self.p
+        if (x == 0):
+            return p.LEFT_IO_START + (y-1) * p.PINS_PER_PAD
+        elif (y == self.size_y-1):
+            return p.UP_IO_START + (x-1) * p.PINS_PER_PAD
+        elif (x == self.size_x-1):
+            return p.RIGHT_IO_START + (y-1) * p.PINS_PER_PAD
+        elif (y == 0):
+            return p.DOWN_IO_START + (x-1) * p.PINS_PER_PAD
+        raise ValueError("Incorrect IO coords", x, y)
+
+    # (x, y) & first fabric IO index of every pad
+    def Pads(self):
+        for x in range(self.size_x):
+            for y in range(self.size_y):
+                if self.fabric.IsIoBlock(x, y):
+                    yield x, y, self.IoIndex(x, y)
+
+    # Pad input as track mux inputs pair (IoInFrm of fabric.vhd, hardcoded for 8 pins per pad there)
+    def IoIn(self, x, y, t):
+        return [1 + self.IoIndex(x, y) + t // 2, GND]
+
+    def CellSignal(self, x, y, c):
+        return self.cell_base + self.config.Tile(x, y) * self.p.CELLS_PER_BLOCK + c
+
+    # Cells with zero LUT are unused, their LUT & register never leave zero
+    def IsUsed(self, sig):
+        return (sig >= self.cell_base) and (self.config.cell_lut[sig - self.cell_base] != 0)
+
+    # Cell (x, y, cell number) of signal
+    def CellCoord(self, sig):
+        tile, c = divmod(sig - self.cell_base, self.p.CELLS_PER_BLOCK)
+        return tile // self.size_y, tile % self.size_y, c
+
+    def BlockOutputs(self, direction, x, y):
+        p = self.p
+        return [self.CellSignal(x, y, BLOCK_SIDE[direction] + i * p.BLOCK_SIDES) for i in range(p.BLOCK_OUT_PERSIDE)]
+
+    # Routing mux inputs of track (LSB first), concatenations of fabric.vhd
+    def TrackInputs(self, direction, x, y, t):
+        T = self.p.TRACKS_PER_RNODE
+        last_x = self.size_x-2
+        last_y = self.size_y-2
+        if direction == DIR_UP:
+            fwd = (DIR_UP, x, y-1, t) if y != 1 else GND
+            a = (DIR_LEFT, x+1, y-1, (t+1) % T) if x != last_x else GND
+            b = (DIR_RIGHT, x, y-1, -t % T) if x != 0 else GND
+            d = self.IoIn(x+1, y, t) if x == last_x else self.BlockOutputs(DIR_LEFT, x+1, y)
+            e = self.IoIn(x, y, t) if x == 0 else self.BlockOutputs(DIR_RIGHT, x, y)
+        elif direction == DIR_DOWN:
+            fwd = (DIR_DOWN, x, y+1, t) if y != last_y else GND
+            a = (DIR_RIGHT, x, y, (t+1) % T) if x != 0 else GND
+            b = (DIR_LEFT, x+1, y, (T-2-t) % T) if x != last_x else GND
+            d = self.IoIn(x+1, y, t) if x == last_x else self.BlockOutputs(DIR_LEFT, x+1, y)
+            e = self.IoIn(x, y, t) if x == 0 else self.BlockOutputs(DIR_RIGHT, x, y)
+        elif direction == DIR_LEFT:
+            fwd = (DIR_LEFT, x+1, y, t) if x != last_x else GND
+            a = (DIR_DOWN, x, y+1, -t % T) if y != last_y else GND
+            b = (DIR_UP, x, y, (t-1) % T) if y != 0 else GND
+            d = self.IoIn(x, y, t) if y == 0 else self.BlockOutputs(DIR_UP, x, y)
+            e = self.IoIn(x, y+1, t) if y == last_y else self.BlockOutputs(DIR_DOWN, x, y+1)
+        else:
+            fwd = (DIR_RIGHT, x-1, y, t) if x != 1 else GND
+            a = (DIR_UP, x-1, y, (T-2-t) % T) if y != 0 else GND
+            b = (DIR_DOWN, x-1, y+1, (t-1) % T) if y != last_y else GND
+            d = self.IoIn(x, y, t) if y == 0 else self.BlockOutputs(DIR_UP, x, y)
+            e = self.IoIn(x, y+1, t) if y == last_y else self.BlockOutputs(DIR_DOWN, x, y+1)
+        return e + d + [fwd, b, a]
+
+    # Index of track in rnode_tracks of its direction
+    def TrackIndex(self, direction, x, y, t):
+        cfg = self.config
+        if (direction == DIR_UP) or (direction == DIR_DOWN):
+            node = x * cfg.rnode_size_y[direction] + y-1
+        else:
+            node = (x-1) * cfg.rnode_size_y[direction] + y
+        return node * self.p.TRACKS_PER_RNODE + t
+
+    # Track of rnode_tracks index, inverse of TrackIndex
+    def IndexTrack(self, direction, i):
+        node, t = divmod(i, self.p.TRACKS_PER_RNODE)
+        x, y = divmod(node, self.config.rnode_size_y[direction])
+        if (direction == DIR_UP) or (direction == DIR_DOWN):
+            return (direction, x, y+1, t)
+        return (direction, x+1, y, t)
+
+    # Signal driving ref & number of routing muxes on the way, chains of muxes are followed without recursion
+    def Resolve(self, ref):
+        path = []
+        visited = set()
+        hops = 0
+        while isinstance(ref, tuple):
+            if ref in self.tracks:
+                ref, hops = self.tracks[ref]
+                break
+            if ref in visited:
+                # loop of tracks without driver
+                ref = GND
+                break
+            path.append(ref)
+            visited.add(ref)
+            state = self.config.rnode_tracks[ref[0]][self.TrackIndex(*ref)]
+            if (state < 0) or (state >= self.p.RNODE_INPUTS):
+                # unused (all-ones state) or ground input
+                ref = GND
+            else:
+                src = self.TrackInputs(*ref)[state]
+                if isinstance(src, tuple):
+                    self.users.setdefault(src, []).append(ref)
+                ref = src
+        for t in reversed(path):
+            hops += 1
+            self.tracks[t] = (ref, hops)
+        return ref, hops
+
+    # Forget resolved tracks selecting given ones directly or through other tracks, returns them all
+    def Invalidate(self, tracks):
+        r = set()
+        work = list(tracks)
+        while work:
+            t = work.pop()
+            if t in r:
+                continue
+            r.add(t)
+            self.tracks.pop(t, None)
+            work += self.users.pop(t, ())
+        return r
+
+    # Tracks of channel between two nodes of given directions (LSB first, as in routing vectors of struct_block)
+    def Channel(self, low, high, x, y):
+        T = self.p.TRACKS_PER_RNODE
+        return [(low, x, y, t) for t in range(T)] + [(high, x, y, t) for t in range(T)]
+
+    # Track selected by 2-bit block input or IO mux (BlkInputReduction of fpga_pkg.vhd)
+    def Reduction(self, channel, i, state):
+        p = self.p
+        step = i // (p.BLOCK_IN_PERSIDE // p.BLOCK_IN_MUXES_COEF)
+        half = p.BLOCK_INPUTS_MUXES // 2
+        state &= p.BLOCK_INPUTS_MUXES-1
+        if state < half:
+            return channel[state * p.BLOCK_IN_MUXES_COEF + step]
+        return channel[(state - half) * p.BLOCK_IN_MUXES_COEF + p.TRACKS_PER_RNODE + step]
+
+    def BlockInputTrack(self, x, y, k):
+        p = self.p
+        side = k % p.BLOCK_SIDES
+        if side == BLOCK_SIDE[DIR_UP]:
+            channel = self.Channel(DIR_LEFT, DIR_RIGHT, x, y)
+        elif side == BLOCK_SIDE[DIR_RIGHT]:
+            channel = self.Channel(DIR_UP, DIR_DOWN, x, y)
+        elif side == BLOCK_SIDE[DIR_DOWN]:
+            channel = self.Channel(DIR_LEFT, DIR_RIGHT, x, y-1)
+        else:
+            channel = self.Channel(DIR_UP, DIR_DOWN, x-1, y)
+        state = self.config.block_inputs[self.config.Tile(x, y) * p.BLOCK_INPUTS + k] // p.BLOCK_IN_MUXES_COEF
+        return self.Reduction(channel, k // p.BLOCK_SIDES, state)
+
+    # Ref of cell crossbar input: cell of the block, track of block input or ground (own output & unused states)
+    def CellInput(self, x, y, c, j):
+        p = self.p
+        index = self.config.Tile(x, y) * p.CELLS_PER_BLOCK + c
+        state = self.config.cell_inputs[index * p.CELL_INPUTS + j]
+        if (state < 0) or (state == c):
+            return GND
+        if state < p.CELLS_PER_BLOCK:
+            return self.CellSignal(x, y, state)
+        state -= p.CELLS_PER_BLOCK
+        if state < p.LBCROSS_INPUTS:
+            return self.BlockInputTrack(x, y, j * p.LBCROSS_INPUTS + state)
+        return GND
+
+    # Tracks of pad output pins (IO mux of fpga_io_mux.vhd)
+    def PadOutputs(self, x, y):
+        if (x == 0):
+            channel = self.Channel(DIR_UP, DIR_DOWN, 0, y)
+        elif (x == self.size_x-1):
+            channel = self.Channel(DIR_UP, DIR_DOWN, x-1, y)
+        elif (y == 0):
+            channel = self.Channel(DIR_LEFT, DIR_RIGHT, x, 0)
+        else:
+            channel = self.Channel(DIR_LEFT, DIR_RIGHT, x, y-1)
+        states = list(reversed(list(self.fabric.fabric[x][y].GetIOMuxes())))
+        return [self.Reduction(channel, pin, state) for pin, state in enumerate(states)]
+
+
+class Fabric_sim(Fabric_routes):
+    # Attributes:
+    #
+    # vectors (bit N of every signal value belongs to stimulus vector N)
+    # ones (value with all vectors set)
+    # cells ([signal, registered, reduced LUT, input signals] of every used cell)
+    # groups (evaluation order, (cells, loop): cells of combinational loop are evaluated till settled)
+    # outputs (fabric IO output -> signal)
+    # names (IO pin name -> fabric IO index)
+    # values (signal -> value)
+    # next_state (registered cell signal -> LUT output sampled by next clock)
+    # dirty (inputs changed since last evaluation)
+
+    def __init__(self, fabric, vectors = 64):
+        Fabric_routes.__init__(self, fabric)
+        self.vectors = vectors
+        self.ones = (1 << vectors) - 1
+        self.Compile()
+        self.values = [0] * (self.cell_base + len(self.config.cell_lut))
+        self.Reset()
+
+    # Signal driving ref, unused cells are ground
+    def Signal(self, ref):
+        sig = self.Resolve(ref)[0]
+        if (sig >= self.cell_base) and not self.IsUsed(sig):
+            return GND
+        return sig
+
+    ############################# Netlist ##############################
+
+    # Resolve all muxes & order cells so every combinational input is evaluated before use
+    def Compile(self):
+        p = self.p
+        W = p.FPGA_LUT_WIDTH
+        cells = dict()
+        for x in range(1, self.size_x-1):
+            for y in range(1, self.size_y-1):
+                for c in range(p.CELLS_PER_BLOCK):
+                    sig = self.CellSignal(x, y, c)
+                    if not self.IsUsed(sig):
+                        continue
+                    index = sig - self.cell_base
+                    lut = self.config.cell_lut[index]
+                    ins = [self.Signal(self.CellInput(x, y, c, j)) for j in range(W)]
+                    # drop grounded inputs & inputs LUT does not depend on
+                    for k in reversed(range(W)):
+                        width = len(ins)
+                        low = Cofactor(lut, width, k, 0)
+                        if (ins[k] == GND) or (low == Cofactor(lut, width, k, 1)):
+                            lut = low
+                            del ins[k]
+                    cells[sig] = [sig, self.config.cell_mux[index] != 0, lut, ins]
+
+        # order of combinational dependencies, registers break them
+        deps = {s : [i for i in cell[3] if (i in cells) and not cells[i][1]] for s, cell in cells.items()}
+        self.cells = list(cells.values())
+        self.groups = []
+        for component in StronglyConnected(deps):
+            loop = (len(component) > 1) or (component[0] in deps[component[0]])
+            self.groups.append(([cells[s] for s in sorted(component)], loop))
+
+        self.outputs = [GND] * p.FABRIC_IO
+        self.names = dict()
+        for x, y, first in self.Pads():
+            self.outputs[first:first + p.PINS_PER_PAD] = [self.Signal(t) for t in self.PadOutputs(x, y)]
+            tile = self.config.Tile(x, y)
+            for pin in range(p.PINS_PER_PAD):
+                name = self.config.GetLabel(("io_name", tile, pin), '')
+                if name:
+                    self.names[name] = first + pin
+
+    # Number of evaluated LUTs & registers
+    def Stats(self):
+        loops = [len(cells) for cells, loop in self.groups if loop]
+        return {"luts" : len(self.cells), "registers" : sum(1 for c in self.cells if c[1]),
+                "loops" : len(loops), "loop_cells" : sum(loops), "tracks" : len(self.tracks)}
+
+    ############################ Simulation ############################
+
+    # Fabric IO index of pin given as index, (x, y, pin) of pad or name of .net IO block
+    def Pin(self, pin):
+        if isinstance(pin, int):
+            if (pin < 0) or (pin >= self.p.FABRIC_IO):
+                raise ValueError("Wrong fabric IO index", pin)
+            return pin
+        if isinstance(pin, str):
+            if pin not in self.names:
+                raise ValueError("Unknown IO pin name", pin)
+            return self.names[pin]
+        x, y, n = pin
+        if (not self.fabric.IsIoBlock(x, y)) or (n < 0) or (n >= self.p.PINS_PER_PAD):
+            raise ValueError("No IO pin", n, "at", Coord(x, y))
+        return self.IoIndex(x, y) + n
+
+    # Drive fabric input, bit N of value is the pin in vector N
+    def Set(self, pin, value):
+        self.values[1 + self.Pin(pin)] = value & self.ones
+        self.dirty = True
+
+    # Sample fabric output, bit N of result is the pin in vector N
+    def Get(self, pin):
+        if self.dirty:
+            self.Eval()
+        return self.values[self.outputs[self.Pin(pin)]]
+
+    # Registers to zero (glb_rst), inputs are kept
+    def Reset(self):
+        for cell in self.cells:
+            if cell[1]:
+                self.values[cell[0]] = 0
+        self.next_state = dict()
+        self.Eval()
+
+    def EvalCell(self, cell):
+        values = self.values
+        v = LutEval(cell[2], [values[i] for i in cell[3]], len(cell[3]), self.ones)
+        if cell[1]:
+            self.next_state[cell[0]] = v
+            return False
+        changed = (values[cell[0]] != v)
+        values[cell[0]] = v
+        return changed
+
+    # Settle combinational logic
+    def Eval(self):
+        for cells, loop in self.groups:
+            if not loop:
+                self.EvalCell(cells[0])
+                continue
+            # loop is evaluated again while it changes, oscillating one keeps last pass
+            for i in range(len(cells) + 1):
+                changed = False
+                for cell in cells:
+                    changed |= self.EvalCell(cell)
+                if not changed:
+                    break
+        self.dirty = False
+
+    # Rising edges of fabric clock
+    def Clock(self, cycles = 1):
+        for i in range(cycles):
+            if self.dirty:
+                self.Eval()
+            for sig, v in self.next_state.items():
+                self.values[sig] = v
+            self.Eval()
+
+
+# Simulator of fabric from .bit or .ubit image
+def SimulateImage(p, fname, vectors = 64):
+    from bitdis import Disassemble
+    return Fabric_sim(Disassemble(p, fname), vectors)
+
+
+################################# MAIN #################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate configured FPGA fabric with random stimulus")
+    parser.add_argument("arch_params_file", type=str, help="FPGA parameters cfg file")
+    parser.add_argument("image", type=str, help="Bitstream, .bit or .ubit")
+    parser.add_argument("--inputs", type=str, default="", help="Comma separated fabric IO indexes driven by random values (all by default)")
+    parser.add_argument("--outputs", type=str, default="", help="Comma separated fabric IO indexes to print (all changing by default)")
+    parser.add_argument("--vectors", type=int, default=64, help="Independent stimulus vectors per pass")
+    parser.add_argument("--cycles", type=int, default=16, help="Clock cycles")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of stimulus")
+    args = parser.parse_args()
+
+    p = Params(args.arch_params_file)
+    start = time.perf_counter()
+    sim = SimulateImage(p, args.image, args.vectors)
+    print("Compiled", args.image, "in {:.3f} s:".format(time.perf_counter() - start), sim.Stats(), file = sys.stderr)
+
+    inputs = [int(i) for i in args.inputs.split(",")] if args.inputs else range(p.FABRIC_IO)
+    outputs = [int(i) for i in args.outputs.split(",")] if args.outputs else range(p.FABRIC_IO)
+    rnd = random.Random(args.seed)
+    ones = [0] * p.FABRIC_IO
+    start = time.perf_counter()
+    for cycle in range(args.cycles):
+        for i in inputs:
+            sim.Set(i, rnd.getrandbits(args.vectors))
+        for o in outputs:
+            ones[o] += bin(sim.Get(o)).count("1")
+        sim.Clock()
+    elapsed = time.perf_counter() - start
+    print("Simulated", args.cycles, "cycles x", args.vectors, "vectors in {:.3f} s".format(elapsed), file = sys.stderr)
+
+    # share of ones of every output over all vectors & cycles
+    total = args.cycles * args.vectors
+    for o in outputs:
+        if args.outputs or (0 < ones[o] < total):
+            print("IO {}: {:.3f}".format(o, ones[o] / max(total, 1)))
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
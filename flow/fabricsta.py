@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+#
+# Static timing analysis of configured fabric
+#
+# Timing graph is built from fabric config (of bitgen or decoded from bitstream), so the actual
+# routing is timed with technology delays of params.cfg instead of VPR estimations. Delays are the
+# ones of arch.xml made by params.py (ps): pad input & output, block output, routing mux with its
+# segment per hop, block input or IO mux, crossbar & LUT input, cell output, register setup & clock to Q.
+#
+# Graph nodes are fabric IO inputs, used cells & fabric IO outputs. Arrival of a node is time of
+# its LUT output (pad output for fabric IO outputs), it is kept separately for paths launched by
+# fabric IO inputs & by registers. Fabric has the single clock, so Fmax comes from register to register
+# paths, IO paths are reported unconstrained. Arcs inside combinational loops are cut.
+#
+# Incremental update: configs are compared, only arcs of nodes reading changed routing, logic
+# blocks or pads are rebuilt & new arrivals propagate by levels till they stop changing.
+#
+
+import argparse
+import heapq
+import sys
+import time
+from params import Params, LutInputDelays
+from bitgen import Coord
+from fabricsim import GND, Fabric_routes, Cofactor, StronglyConnected
+
+# Launch of paths: fabric IO inputs & registers
+LAUNCH_IN = 0
+LAUNCH_REG = 1
+
+
+class Fabric_timing(Fabric_routes):
+    # Attributes:
+    #
+    # out_base (node of first fabric IO output)
+    # lut_delays (delay of every LUT input)
+    # route_delay (routing mux & its segment)
+    # launch (launch -> arrival at output of launching IO input or register)
+    # snapshot (copy of config timing graph is built from)
+    # registered (registered cell signals)
+    # arcs (node -> [driver signal, delay, routing hops or None for crossbar of the block])
+    # fanout (signal -> nodes with arcs built from it, unused cells & ground are kept too)
+    # readers (track -> nodes with arcs through it)
+    # inputs (node -> tracks & signals its arcs are built from)
+    # loops (node -> combinational loop, list of nodes)
+    # level (node -> longest chain of combinational cells before it)
+    # arrival (node -> [arrival of paths from IO inputs, of paths from registers], None if no path)
+    # pred (node -> drivers of arrivals)
+    # clock (name of fabric clock in reports)
+    # retimed (nodes timed by last update)
+
+    def __init__(self, fabric, clock = "clk"):
+        Fabric_routes.__init__(self, fabric)
+        self.clock = clock
+        self.out_base = self.cell_base + len(self.config.cell_lut)
+        tc = self.p.tech_config
+        self.lut_delays = LutInputDelays(self.p)
+        self.route_delay = tc.TECH_RNODE_DELAY + tc.TECH_RSEGM_DELAY
+        self.launch = {LAUNCH_IN : 0, LAUNCH_REG : tc.TECH_REG_CLK2Q + tc.TECH_LBOUT_DELAY}
+        self.Build()
+
+    ############################### Graph ##############################
+
+    # Build graph of whole fabric & time it
+    def Build(self):
+        self.snapshot = self.config.Copy()
+        self.tracks = dict()
+        self.users = dict()
+        self.registered = set()
+        self.arcs = dict()
+        self.fanout = dict()
+        self.readers = dict()
+        self.inputs = dict()
+        for x in range(1, self.size_x-1):
+            for y in range(1, self.size_y-1):
+                for c in range(self.p.CELLS_PER_BLOCK):
+                    self.BuildNode(self.CellSignal(x, y, c))
+        for x, y, first in self.Pads():
+            for pin in range(self.p.PINS_PER_PAD):
+                self.BuildNode(self.out_base + first + pin)
+        self.Levels()
+        self.arrival = dict()
+        self.pred = dict()
+        for node in sorted(self.arcs, key = self.level.get):
+            self.Time(node)
+        self.retimed = len(self.arcs)
+
+    def IsOutput(self, node):
+        return node >= self.out_base
+
+    # Pad (x, y, pin) of fabric IO
+    def Pad(self, io):
+        for x, y, first in self.Pads():
+            if first <= io < first + self.p.PINS_PER_PAD:
+                return x, y, io - first
+        raise ValueError("No pad of fabric IO", io)
+
+    # Arcs of node from config, unused cells & pins get no node
+    def BuildNode(self, node):
+        p = self.p
+        tc = p.tech_config
+        if self.IsOutput(node):
+            x, y, pin = self.Pad(node - self.out_base)
+            if self.config.GetLabel(("io_mode", self.config.Tile(x, y), pin), '') != 'outpad':
+                return
+            self.arcs[node] = []
+            self.inputs[node] = ([], [])
+            self.Arc(node, self.PadOutputs(x, y)[pin], tc.TECH_IOOUT_DELAY)
+            return
+        if not self.IsUsed(node):
+            return
+        self.arcs[node] = []
+        self.inputs[node] = ([], [])
+        x, y, c = self.CellCoord(node)
+        index = node - self.cell_base
+        if self.config.cell_mux[index] != 0:
+            self.registered.add(node)
+        W = p.FPGA_LUT_WIDTH
+        lut = self.config.cell_lut[index]
+        for j in range(W):
+            # inputs LUT does not depend on are not timed
+            if Cofactor(lut, W, j, 0) != Cofactor(lut, W, j, 1):
+                self.Arc(node, self.CellInput(x, y, c, j), tc.TECH_LBCROSS_DELAY + self.lut_delays[j])
+
+    # Arc from driver of ref (signal or track of block input or IO mux) with delay after that mux
+    def Arc(self, node, ref, delay):
+        tc = self.p.tech_config
+        hops = None
+        if isinstance(ref, tuple):
+            self.readers.setdefault(ref, set()).add(node)
+            self.inputs[node][0].append(ref)
+            sig, hops = self.Resolve(ref)
+            delay += hops * self.route_delay + tc.TECH_BINPUT_DELAY
+            if sig >= self.cell_base:
+                delay += tc.TECH_BOUTPUT_DELAY
+        else:
+            sig = ref
+        self.fanout.setdefault(sig, set()).add(node)
+        self.inputs[node][1].append(sig)
+        if sig == GND:
+            return
+        if sig < self.cell_base:
+            delay += tc.TECH_IOIN_DELAY
+        elif not self.IsUsed(sig):
+            return
+        self.arcs[node].append((sig, delay, hops))
+
+    # Forget arcs of node
+    def DropNode(self, node):
+        tracks, signals = self.inputs.pop(node, ((), ()))
+        for t in tracks:
+            self.readers[t].discard(node)
+        for sig in signals:
+            self.fanout[sig].discard(node)
+        self.arcs.pop(node, None)
+        self.arrival.pop(node, None)
+        self.pred.pop(node, None)
+        self.registered.discard(node)
+
+    # Driver of node is combinational cell, paths through it go on
+    def IsComb(self, sig):
+        return (self.cell_base <= sig < self.out_base) and (sig not in self.registered)
+
+    # Combinational loops & levels, arcs inside loops are cut
+    def Levels(self):
+        deps = {n : [d for d, delay, hops in arcs if self.IsComb(d)] for n, arcs in self.arcs.items()}
+        self.loops = dict()
+        self.level = dict()
+        for component in StronglyConnected(deps):
+            if (len(component) > 1) or (component[0] in deps[component[0]]):
+                for n in component:
+                    self.loops[n] = component
+            for n in component:
+                self.level[n] = self.Level(n)
+
+    def Level(self, node):
+        loop = self.loops.get(node, ())
+        return 1 + max([self.level.get(d, 0) for d, delay, hops in self.arcs[node] if self.IsComb(d) and (d not in loop)], default = 0)
+
+    ############################### Timing #############################
+
+    # Arrival of paths of launch at output of driver of arc
+    def Launch(self, sig, launch):
+        if sig < self.cell_base:
+            return self.launch[LAUNCH_IN] if launch == LAUNCH_IN else None
+        if sig in self.registered:
+            return self.launch[LAUNCH_REG] if launch == LAUNCH_REG else None
+        a = self.arrival[sig][launch]
+        return None if a is None else a + self.p.tech_config.TECH_LBOUT_DELAY
+
+    # Arrivals of node from its drivers, returns whether they changed
+    def Time(self, node):
+        loop = self.loops.get(node, ())
+        arrival = [None, None]
+        pred = [None, None]
+        for sig, delay, hops in self.arcs[node]:
+            if sig in loop:
+                continue
+            for launch in (LAUNCH_IN, LAUNCH_REG):
+                a = self.Launch(sig, launch)
+                if (a is not None) and ((arrival[launch] is None) or (a + delay > arrival[launch])):
+                    arrival[launch] = a + delay
+                    pred[launch] = sig
+        changed = (self.arrival.get(node) != arrival)
+        self.arrival[node] = arrival
+        self.pred[node] = pred
+        return changed
+
+    ############################## Reports #############################
+
+    # Worst endpoint of every path group: group -> (delay, endpoint, launch), register endpoints include setup
+    def Worst(self):
+        setup = self.p.tech_config.TECH_REG_SETUP
+        r = dict()
+        endpoints = [(n, "reg", setup) for n in self.registered] + [(n, "out", 0) for n in self.arcs if self.IsOutput(n)]
+        for n, kind, margin in endpoints:
+            for launch, start in ((LAUNCH_IN, "in"), (LAUNCH_REG, "reg")):
+                a = self.arrival[n][launch]
+                group = start + "2" + kind
+                if (a is not None) and ((group not in r) or (a + margin > r[group][0])):
+                    r[group] = (a + margin, n, launch)
+        return r
+
+    # Fmax (MHz) of fabric clock from worst register to register path, fabric clock skew is taken as uncertainty
+    def Clocks(self):
+        worst = self.Worst()
+        if "reg2reg" not in worst:
+            return {self.clock : None}
+        period = worst["reg2reg"][0] + self.p.tech_config.TECH_FABRIC_CLKSKEW
+        return {self.clock : 1e6 / period}
+
+    # Path to node from its launch point: [(node, arrival at its LUT output, pad output or launch)]
+    def Path(self, node, launch):
+        r = []
+        while True:
+            r.append((node, self.arrival[node][launch]))
+            sig = self.pred[node][launch]
+            if not self.IsComb(sig):
+                r.append((sig, self.Launch(sig, launch)))
+                break
+            node = sig
+        return list(reversed(r))
+
+    def Describe(self, node):
+        if self.IsOutput(node) or (node < self.cell_base):
+            io = node - self.out_base if self.IsOutput(node) else node - 1
+            x, y, pin = self.Pad(io)
+            name = self.config.GetLabel(("io_name", self.config.Tile(x, y), pin), '')
+            return "IO {} {} {} pin {} {}".format(io, "out" if self.IsOutput(node) else "in", Coord(x, y), pin, name).rstrip()
+        x, y, c = self.CellCoord(node)
+        name = self.config.GetLabel(("cell_name", node - self.cell_base), '')
+        return "cell {} {}{} {}".format(Coord(x, y), c, " reg" if node in self.registered else "", name).rstrip()
+
+    def Stats(self):
+        loops = {id(loop) : len(loop) for loop in self.loops.values()}
+        return {"nodes" : len(self.arcs), "arcs" : sum(len(a) for a in self.arcs.values()), "registers" : len(self.registered),
+                "levels" : max(self.level.values(), default = 0), "loops" : len(loops), "loop_cells" : sum(loops.values()),
+                "tracks" : len(self.tracks)}
+
+    def Print(self, f = sys.stdout):
+        worst = self.Worst()
+        for group in ("in2reg", "reg2reg", "in2out", "reg2out"):
+            if group in worst:
+                print("{}: {} ps".format(group, worst[group][0]), file = f)
+        for clock, fmax in self.Clocks().items():
+            print("Fmax {}: {}".format(clock, "{:.2f} MHz".format(fmax) if fmax else "no register paths"), file = f)
+        if not worst:
+            return
+        delay, node, launch = max(worst.values(), key = lambda w: w[0])
+        print("\nCritical path ({} ps):".format(delay), file = f)
+        for n, a in self.Path(node, launch):
+            print("  {:>8} {}".format(a, self.Describe(n)), file = f)
+
+    ############################ Incremental ###########################
+
+    # Time ECO of fabric (new fabric of same size or the one changed in place), returns number of timed nodes
+    def Update(self, fabric = None):
+        p = self.p
+        if fabric is not None:
+            if (fabric.SizeX(), fabric.SizeY()) != (self.size_x, self.size_y):
+                raise ValueError("Fabric size mismatch:", Coord(fabric.SizeX(), fabric.SizeY()))
+            self.fabric = fabric
+            self.config = fabric.config
+        old, new = self.snapshot, self.config
+
+        # changed routing tracks & everything resolved through them
+        changed = []
+        for direction, tracks in new.rnode_tracks.items():
+            was = old.rnode_tracks[direction]
+            if tracks != was:
+                changed += [self.IndexTrack(direction, i) for i, (u, v) in enumerate(zip(was, tracks)) if u != v]
+        dirty = set()
+        for t in self.Invalidate(changed):
+            dirty |= self.readers.get(t, set())
+
+        # changed logic blocks & their readers if cells changed kind, changed pads
+        cpb = p.CELLS_PER_BLOCK
+        for x in range(1, self.size_x-1):
+            for y in range(1, self.size_y-1):
+                tile = new.Tile(x, y)
+                cells = slice(tile * cpb, (tile+1) * cpb)
+                cross = slice(cells.start * p.CELL_INPUTS, cells.stop * p.CELL_INPUTS)
+                binputs = slice(tile * p.BLOCK_INPUTS, (tile+1) * p.BLOCK_INPUTS)
+                if (old.block_inputs[binputs] == new.block_inputs[binputs]) and (old.cell_inputs[cross] == new.cell_inputs[cross]) and \
+                    (old.cell_lut[cells] == new.cell_lut[cells]) and (old.cell_mux[cells] == new.cell_mux[cells]):
+                    continue
+                for i in range(cells.start, cells.stop):
+                    sig = self.cell_base + i
+                    dirty.add(sig)
+                    if ((old.cell_lut[i] != 0) != (new.cell_lut[i] != 0)) or ((old.cell_mux[i] != 0) != (new.cell_mux[i] != 0)):
+                        dirty |= self.fanout.get(sig, set())
+        for x, y, first in self.Pads():
+            tile = new.Tile(x, y)
+            for pin in range(p.PINS_PER_PAD):
+                key = ("io_mode", tile, pin)
+                if (old.io_tracks[tile * p.PINS_PER_PAD + pin] != new.io_tracks[tile * p.PINS_PER_PAD + pin]) or \
+                    (old.GetLabel(key, '') != new.GetLabel(key, '')):
+                    dirty.add(self.out_base + first + pin)
+
+        for n in dirty:
+            self.DropNode(n)
+        for n in dirty:
+            self.BuildNode(n)
+            self.level.pop(n, None)
+        in_loops = any(n in self.loops for n in dirty)
+        dirty = {n for n in dirty if n in self.arcs}
+        if in_loops or not self.FixLevels(dirty):
+            # loops are found again, nodes getting other cut arcs are timed too
+            loops = self.loops
+            self.Levels()
+            for n in set(loops) | set(self.loops):
+                if (n in self.arcs) and (set(loops.get(n, ())) != set(self.loops.get(n, ()))):
+                    dirty.add(n)
+        self.snapshot = self.config.Copy()
+
+        # arrivals by levels from rebuilt nodes till they are the same
+        heap = [(self.level[n], n) for n in dirty]
+        heapq.heapify(heap)
+        queued = set(dirty)
+        # nodes of combinational loops share level & may be popped more than once
+        retimed = set()
+        while heap:
+            level, n = heapq.heappop(heap)
+            queued.discard(n)
+            retimed.add(n)
+            if self.Time(n) and self.IsComb(n):
+                for f in self.fanout.get(n, ()):
+                    if (f in self.arcs) and (f not in queued):
+                        queued.add(f)
+                        heapq.heappush(heap, (self.level[f], f))
+        self.retimed = len(retimed)
+        return self.retimed
+
+    # Levels of rebuilt nodes & nodes after them, False if they make new combinational loop
+    def FixLevels(self, nodes):
+        work = list(nodes)
+        limit = len(self.arcs)
+        while work:
+            n = work.pop()
+            # drivers rebuilt & not leveled yet count as zero, node is leveled again after them
+            level = self.Level(n)
+            if level > limit:
+                return False
+            if self.level.get(n) == level:
+                continue
+            self.level[n] = level
+            if self.IsComb(n):
+                work += [f for f in self.fanout.get(n, ()) if f in self.arcs]
+        return True
+
+
+# Timing of fabric from .bit or .ubit image
+def TimeImage(p, fname, clock = "clk"):
+    from bitdis import Disassemble
+    return Fabric_timing(Disassemble(p, fname), clock)
+
+
+################################# MAIN #################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Static timing analysis of configured FPGA fabric")
+    parser.add_argument("arch_params_file", type=str, help="FPGA parameters cfg file")
+    parser.add_argument("image", type=str, help="Bitstream, .bit or .ubit")
+    parser.add_argument("--eco", type=str, nargs="*", default=[], help="Bitstreams after ECO, timed incrementally one by one")
+    parser.add_argument("--clock", type=str, default="clk", help="Name of fabric clock in report")
+    args = parser.parse_args()
+
+    p = Params(args.arch_params_file)
+    start = time.perf_counter()
+    sta = TimeImage(p, args.image, args.clock)
+    print("Timed", args.image, "in {:.3f} s:".format(time.perf_counter() - start), sta.Stats(), file = sys.stderr)
+    sta.Print()
+
+    from bitdis import Disassemble
+    for fname in args.eco:
+        fabric = Disassemble(p, fname)
+        start = time.perf_counter()
+        retimed = sta.Update(fabric)
+        print("\nTimed", fname, "in {:.3f} s,".format(time.perf_counter() - start), retimed, "of", len(sta.arcs), "nodes retimed", file = sys.stderr)
+        sta.Print()
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,16 @@ from subprocess import call
 import os
 import argparse
 import random
+import tempfile
+import time
 from params import Params
 from utils import *
+from bitgen import Bitgen, CODE_FILES, OUTPUT_SUFFIXES
+from result_cache import Result_cache
+from stages import Stage_graph
+from vpr_sweep import SeedSweep, Promote
+from metrics import Metrics_db, Collect
+from bitfile import ParamsHash
 
 
 # Run program & return exitcode
@@ -75,6 +83,24 @@ def WriteYosysScript(fd):
     print(" write_blif -undef + unconn " + blif, file=fd)
     print(" stat", file=fd)
 
+# RTL source paths, params package generated for the run is used
+def RtlSources(names):
+    return [rtl_params_file if s == RTL_PATH + "/fpga_params_pkg.vhd" else s for s in PrependPaths(names, RTL_PATH)]
+
+# Cocotb dir of run: files of flow cocotb dir are linked, Makefile includes the flow one with paths of the run
+def PrepareCocotbDir(path):
+    src = AbsPath("./cocotbsim")
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(src):
+        dst = os.path.join(path, name)
+        if (name != "Makefile") and not os.path.lexists(dst):
+            os.symlink(os.path.realpath(os.path.join(src, name)), dst)
+    with open(path + "/Makefile", "w") as f:
+        print("BASEDIR ?= " + AbsPath(".."), file=f)
+        print("FPGA_PARAMS_PKG ?= " + rtl_params_file, file=f)
+        print("export FPGA_PARAMS_CFG ?= " + arch_params_file, file=f)
+        print("include " + src + "/Makefile", file=f)
+
 # Parse environment
 YOSYS_PATH  = AbsPath(LoadEnv("YOSYS_PATH"))
 YOSYS       = LoadEnv("YOSYS_BIN", YOSYS_PATH + "/yosys" if YOSYS_PATH else "yosys")
@@ -93,10 +119,20 @@ ARCH_DIR    = AbsPath(LoadEnv("ARCH_DIR", "../arch"))
 RTL_PATH    = AbsPath(LoadEnv("FPGA_RTL_PATH", "../rtl"))
 SIM_PATH    = AbsPath(LoadEnv("FPGA_SIM_PATH", "./sim"))
 TECHMAP_DIR = AbsPath(LoadEnv("TECHMAP_DIR", ARCH_DIR + "/yosys"))
+# empty BITGEN_CACHE_DIR disables bitgen outputs cache
+BITGEN_CACHE_DIR = LoadEnv("BITGEN_CACHE_DIR", WORK_DIR + "/bitgen_cache")
+BITGEN_CACHE_MB = float(LoadEnv("BITGEN_CACHE_MB", "1024"))
+# pack .ubit & C headers of sparse designs
+BITGEN_COMPRESS = LoadEnv("BITGEN_COMPRESS", "0") == "1"
+# VPR writes rr graph (multi-MB XML) & bitgen decodes routes with it
+BITGEN_RR_GRAPH = LoadEnv("BITGEN_RR_GRAPH", "0") == "1"
+# history of run metrics, empty METRICS_DB disables it
+METRICS_DB = LoadEnv("METRICS_DB", "./metrics.db")
 
 SIM_PATH    = AbsPath("./sim")
 COCOTB_PATH = AbsPath("./cocotbsim")
 COCOTB_BITSTREAM = COCOTB_PATH + "/firmware.bit"
+COCOTB_BITFILE = COCOTB_PATH + "/firmware.ubit"
 
 # Parse arguments
 parser = argparse.ArgumentParser(description="FPGA synthesys flow with Yosys(GHDL), VPR & bitgen.py")
@@ -110,6 +146,12 @@ parser.add_argument("--synth", action="store_const", const = True, default = Fal
 parser.add_argument("--pnr", action="store_const", const = True, default = False, help="Run place & route with VPR")
 parser.add_argument("--bitgen", action="store_const", const = True, default = False, help="Run bitgen")
 parser.add_argument("--gui", action="store_const", const = True, default = False, help="Invoke VPR GUI")
+parser.add_argument("--force", action="store_const", const = True, default = False, help="Run selected stages even if their inputs did not change")
+parser.add_argument("--seeds", type=int, default=1, help="Run VPR with this number of random seeds & take the best result")
+parser.add_argument("--jobs", type=int, default=1, help="Number of VPR runs at once for --seeds")
+parser.add_argument("--target_cpd", type=float, help="Cancel VPR runs left by --seeds once critical path (ns) is met")
+parser.add_argument("--run_dir", type=str, help="Keep all files of the run (work, sim, cocotb & generated params) in this directory")
+parser.add_argument("--unique_run", action="store_const", const = True, default = False, help="Make new run directory under --run_dir (./runs by default)")
 args = parser.parse_args()
 # rtl_src = args.verilog
 verilog = []
@@ -126,23 +168,44 @@ for s in args.rtl_src:
     else:
         print("RTL file ", s, " is of unknown type!")
         exit(1)
-if vhdl:
-    if not args.top:
-        print("Top unit required for VHDL designs!")
-        exit(1)
-    vhdl2verilog = WORK_DIR + "/" + args.top + "_vhd2v.v"
-    verilog.append(vhdl2verilog)
+if vhdl and not args.top:
+    print("Top unit required for VHDL designs!")
+    exit(1)
 if args.top:
     proj_name = args.top
 else:
     proj_name = os.path.basename(os.path.splitext(verilog[0])[0])
-basename = AbsPath(WORK_DIR + "/" + proj_name)
-blif = basename + ".eblif"
-verilog_netlist = basename + "_netlist.v"
 arch_params_file = AbsPath(ARCH_DIR + "/params.cfg")
 vtr_arch_file = AbsPath(ARCH_DIR + "/vtr/arch.xml")
 rtl_params_file = AbsPath(RTL_PATH + "/fpga_params_pkg.vhd")
+
+# Run directory: every file written by the run is under it, so concurrent flows share nothing
+run_dir = None
+if args.run_dir or args.unique_run:
+    run_dir = AbsPath(args.run_dir if args.run_dir else "./runs")
+    if args.unique_run:
+        os.makedirs(run_dir, exist_ok=True)
+        run_dir = tempfile.mkdtemp(prefix=proj_name + time.strftime("_%Y%m%d_%H%M%S_"), dir=run_dir)
+    print("Run directory:", run_dir)
+    WORK_DIR = run_dir + "/work"
+    SIM_PATH = run_dir + "/sim"
+    COCOTB_PATH = run_dir + "/cocotbsim"
+    COCOTB_BITSTREAM = COCOTB_PATH + "/firmware.bit"
+    COCOTB_BITFILE = COCOTB_PATH + "/firmware.ubit"
+    BITGEN_CACHE_DIR = LoadEnv("BITGEN_CACHE_DIR", WORK_DIR + "/bitgen_cache")
+    # files generated from params are shared by all runs otherwise
+    vtr_arch_file = run_dir + "/arch.xml"
+    rtl_params_file = run_dir + "/fpga_params_pkg.vhd"
+    PrepareCocotbDir(COCOTB_PATH)
+
+if vhdl:
+    vhdl2verilog = WORK_DIR + "/" + args.top + "_vhd2v.v"
+    verilog.append(vhdl2verilog)
+basename = AbsPath(WORK_DIR + "/" + proj_name)
+blif = basename + ".eblif"
+verilog_netlist = basename + "_netlist.v"
 fpga_txt = AbsPath(SIM_PATH + "/" + proj_name + ".txt")
+rr_graph = basename + "_rr.xml"
 
 if (args.synth or args.pnr or args.bitgen) == False:
     # by default run everything
@@ -153,29 +216,42 @@ if (args.synth or args.pnr or args.bitgen) == False:
 if not os.path.exists(WORK_DIR):
     os.makedirs(WORK_DIR)
 
+# Stages below are run in order of their files, the ones with inputs, tools & settings same as on
+# their last run are skipped
+flow = Stage_graph(WORK_DIR + "/stages.json", args.force)
+
 # Prepare parameter config files
-RunTool([PARAMS_PY, "--cfg", arch_params_file, "--vhd", rtl_params_file, "--vtr", vtr_arch_file])
+flow.Add("params", [arch_params_file, PARAMS_PY], [rtl_params_file, vtr_arch_file],
+    lambda: RunTool([PARAMS_PY, "--cfg", arch_params_file, "--vhd", rtl_params_file, "--vtr", vtr_arch_file]))
 p = Params(arch_params_file)
 RTL_TECH_PATH = RTL_PATH + "/" + TechDir(p)
 
 # Synthesys
+if vhdl:
+    # RunTool([GHDL, "-a", "-fsynopsys", "--std=08"] + vhdl)
+    # RunTool([GHDL, "--synth", "--out=verilog", "-fsynopsys", "--std=08", args.top], out=verilog[-1])
+    # print("/opt/opencad/bin/yosys -m ghdl -p 'ghdl -fsynopsys --std=08 --work=fpgalib " + srcs + " -e " + vhdl_top +"; hierarchy -check -top " + vhdl_top + "; write_verilog " + OpenlaneDesignsPath(name) + vhdl_top + "_fromvhdl.v'", file=fd)
+    ghdl_args = [YOSYS_WITH_GHDL, "-m", "ghdl", "-p", "ghdl -fsynopsys --std=08 " + " ".join(vhdl) + " -e " + args.top + " ; hierarchy -check -top " + args.top + "; write_verilog " + verilog[-1]]
+    flow.Add("vhdl2verilog", vhdl, [verilog[-1]], lambda: RunTool(ghdl_args), tools=[[YOSYS_WITH_GHDL, "-V"]], settings=ghdl_args, enabled=args.synth)
+syn_script_name = WORK_DIR + "/synth.ys"
 if args.synth:
-    if vhdl:
-        # RunTool([GHDL, "-a", "-fsynopsys", "--std=08"] + vhdl)
-        # RunTool([GHDL, "--synth", "--out=verilog", "-fsynopsys", "--std=08", args.top], out=verilog[-1])
-        # print("/opt/opencad/bin/yosys -m ghdl -p 'ghdl -fsynopsys --std=08 --work=fpgalib " + srcs + " -e " + vhdl_top +"; hierarchy -check -top " + vhdl_top + "; write_verilog " + OpenlaneDesignsPath(name) + vhdl_top + "_fromvhdl.v'", file=fd)
-        RunTool([YOSYS_WITH_GHDL, "-m", "ghdl", "-p", "ghdl -fsynopsys --std=08 " + " ".join(vhdl) + " -e " + args.top + " ; hierarchy -check -top " + args.top + "; write_verilog " + verilog[-1]])
-    syn_script_name = WORK_DIR + "/synth.ys"
     with open(syn_script_name, 'w') as syn_script:
         WriteYosysScript(syn_script)
+
+def Synthesize():
     print("Launching Yosys synthesis tool...")
     RunTool([YOSYS, "-v3", "-l", WORK_DIR + "/yosys.log"] + verilog + [syn_script_name])
 
+techmap_files = [TECHMAP_DIR + "/tech_cells.v", TECHMAP_DIR + "/brams.txt", TECHMAP_DIR + "/bram_map.v"]
+flow.Add("synth", verilog + [syn_script_name] + techmap_files, [blif, verilog_netlist, WORK_DIR + "/yosys.log"], Synthesize,
+    tools=[[YOSYS, "-V"]], enabled=args.synth)
+
 # Produce pinout
 fix_pins = []
 pad_file = basename + ".pad"
 if args.pinout:
-    RunTool([PINOUT2VTR, AbsPath(args.pinout), pad_file, "--params", arch_params_file])
+    pinout_args = [PINOUT2VTR, AbsPath(args.pinout), pad_file, "--params", arch_params_file]
+    flow.Add("pinout", [AbsPath(args.pinout), PINOUT2VTR, arch_params_file], [pad_file], lambda: RunTool(pinout_args))
     fix_pins = ["--fix_pins", AbsPath(pad_file)]
 
 # Generate testbench
@@ -192,42 +268,91 @@ if args.tb:
     vsim_script_netlist = SIM_PATH + "/" + proj_name + "_netlist_vsim.tcl"
     vsim_script_loader = SIM_PATH + "/" + proj_name + "_loader_vsim.tcl"
     vsim_script_sdf = SIM_PATH + "/" + proj_name + "_sdf_vsim.tcl"
-    print("Launching testbench wrapper generator...")
-    RunTool([TB_WRAPPER, arch_params_file, proj_name, verilog_netlist, pad_file, tb_wrapper_file, tb_loader_wrapper_file])
+
+    def Testbench():
+        print("Launching testbench wrapper generator...")
+        RunTool([TB_WRAPPER, arch_params_file, proj_name, verilog_netlist, pad_file, tb_wrapper_file, tb_loader_wrapper_file])
+
+    flow.Add("testbench", [verilog_netlist, pad_file, arch_params_file, TB_WRAPPER], [tb_wrapper_file, tb_loader_wrapper_file], Testbench)
     if args.sim:
-        common_src = PrependPaths(p.src.SRC_LIST_COMMON, RTL_PATH)
+        common_src = RtlSources(p.src.SRC_LIST_COMMON)
         WriteVsimScript(open(vsim_script_fpga, "w"), PrependPaths(p.src.SRC_LIST_TECH_FPGA + p.tech_config.TECH_MODELS_LIST, RTL_TECH_PATH) +
-            PrependPaths(p.src.SRC_LIST_FPGA+p.src.SRC_LIST_FPGATB, RTL_PATH) + [tb_wrapper_file] + [args.tb])
+            RtlSources(p.src.SRC_LIST_FPGA+p.src.SRC_LIST_FPGATB) + [tb_wrapper_file] + [args.tb])
         WriteVsimScript(open(vsim_script_behav, "w"), verilog + [args.tb])
         WriteVsimScript(open(vsim_script_netlist, "w"), [YOSYS_PATH + "/techlibs/common/simlib.v", YOSYS_PATH + "/techlibs/common/simcells.v"] + [verilog_netlist] + [args.tb])
         WriteVsimScript(open(vsim_script_loader, "w"), common_src + PrependPaths(p.src.SRC_LIST_TECH_FPGA + p.tech_config.TECH_MODELS_LIST, RTL_TECH_PATH) +
-            PrependPaths(p.src.SRC_LIST_FPGALOADER+p.src.SRC_LIST_FPGATB, RTL_PATH) + [tb_loader_wrapper_file] + [args.tb])
+            RtlSources(p.src.SRC_LIST_FPGALOADER+p.src.SRC_LIST_FPGATB) + [tb_loader_wrapper_file] + [args.tb])
         # WriteVsimScript(open(vsim_script_sdf, "w"), FPGASDF_SRC_LIST + [tb_loader_wrapper_file] + [args.tb], "-sdfnoerror")
     fix_pins = ["--fix_pins", AbsPath(pad_file)]
 
 # Place & route
-if args.pnr:
-    vpr_args = [VPR, vtr_arch_file, basename, "--circuit_file", blif, "--route_chan_width", str(p.TOTAL_TRACKS), "--max_router_iterations", "10000",
-        "--constant_net_method", "route", "--echo_file", "on", "--gen_post_synthesis_netlist", "on", "--initial_pres_fac", "0.1", "--pres_fac_mult", "1.1",
-        "--first_iter_pres_fac", "0.00", "--min_incremental_reroute_fanout", "400", "--astar_fac", "1.8", "--max_criticality", "0.5", 
-        "--routing_failure_predictor", "off", "--bb_factor", "30", "--seed", str(random.randrange(100000)), "--congested_routing_iteration_threshold", "0.25", 
-        "--criticality_exp", "0.0", "--place_algorithm", "path_timing_driven", "--timing_tradeoff", "0.1", "--router_init_wirelength_abort_threshold", "0.95"]
-    if fix_pins:
-        vpr_args += fix_pins
-
-    if args.sdc:
-        vpr_args += ["--sdc_file", AbsPath(args.sdc)]
-    if args.gui:
-        vpr_args += ["--disp", "on"]
-    print("Launching VPR...")
-    RunTool(vpr_args)
-    CheckVPR(WORK_DIR + "/vpr_stdout.log")
+vpr_args = [VPR, vtr_arch_file, basename, "--circuit_file", blif, "--route_chan_width", str(p.TOTAL_TRACKS), "--max_router_iterations", "10000",
+    "--constant_net_method", "route", "--echo_file", "on", "--gen_post_synthesis_netlist", "on", "--initial_pres_fac", "0.1", "--pres_fac_mult", "1.1",
+    "--first_iter_pres_fac", "0.00", "--min_incremental_reroute_fanout", "400", "--astar_fac", "1.8", "--max_criticality", "0.5", 
+    "--routing_failure_predictor", "off", "--bb_factor", "30", "--congested_routing_iteration_threshold", "0.25", 
+    "--criticality_exp", "0.0", "--place_algorithm", "path_timing_driven", "--timing_tradeoff", "0.1", "--router_init_wirelength_abort_threshold", "0.95"]
+pnr_inputs = [blif, vtr_arch_file]
+if fix_pins:
+    vpr_args += fix_pins
+    pnr_inputs.append(pad_file)
+
+if args.sdc:
+    vpr_args += ["--sdc_file", AbsPath(args.sdc)]
+    pnr_inputs.append(AbsPath(args.sdc))
+if args.gui:
+    vpr_args += ["--disp", "on"]
+# bitgen decodes routes with rr graph written by VPR (--write_rr_graph) if BITGEN_RR_GRAPH is set
+rr_graph_args = ["--write_rr_graph", rr_graph] if BITGEN_RR_GRAPH else []
+
+def PlaceRoute():
+    if (args.seeds <= 1) or args.gui:
+        print("Launching VPR...")
+        # seed is not a setting of stage, result of any one is as good
+        RunTool(vpr_args + rr_graph_args + ["--seed", str(random.randrange(100000))])
+        CheckVPR(WORK_DIR + "/vpr_stdout.log")
+        return
+    # every run writes its files to own dir, the best ones are copied to work dir
+    outputs = {"--net_file" : basename + ".net", "--place_file" : basename + ".place", "--route_file" : basename + ".route"}
+    if BITGEN_RR_GRAPH:
+        outputs["--write_rr_graph"] = rr_graph
+    print("Launching VPR with", args.seeds, "seeds,", args.jobs, "at once...")
+    runs = SeedSweep(vpr_args, outputs, random.sample(range(100000), args.seeds), args.jobs, WORK_DIR + "/seeds", args.target_cpd)
+    if not runs[0].routed:
+        print("VPR failed with every seed, terminating flow")
+        exit(-1)
+    print("Best VPR result is taken,", runs[0].Describe())
+    Promote(runs[0], outputs, WORK_DIR)
+
+pnr_results = [basename + ext for ext in (".net", ".place", ".route")] + ([rr_graph] if BITGEN_RR_GRAPH else [])
+flow.Add("pnr", pnr_inputs, pnr_results + [WORK_DIR + "/vpr_stdout.log"], PlaceRoute, tools=[[VPR, "--version"]],
+    settings=vpr_args + rr_graph_args + [args.seeds, args.target_cpd],
+    enabled=args.pnr, always=args.gui)
 
 # Bitgen
-if args.bitgen:
+def Bitstream():
     os.system("mkdir -p " + SIM_PATH + " " + COCOTB_PATH)
-    RunTool([BITGEN, arch_params_file, basename, fpga_txt])
+    if "BITGEN_PY" in os.environ:
+        RunTool([BITGEN, arch_params_file, basename, fpga_txt] + (["--compress"] if BITGEN_COMPRESS else []) + (["--rr_graph", rr_graph] if BITGEN_RR_GRAPH else []))
+    else:
+        # run in-process with already loaded params, outputs are restored from cache if VPR results did not change
+        cache = Result_cache(AbsPath(BITGEN_CACHE_DIR), BITGEN_CACHE_MB) if BITGEN_CACHE_DIR else None
+        Bitgen(p, cache = cache, rr_graph = rr_graph if BITGEN_RR_GRAPH else None, compress = BITGEN_COMPRESS).Run(basename, fpga_txt)
     os.system("cp " + fpga_txt + ".bit " + COCOTB_BITSTREAM)
+    os.system("cp " + fpga_txt + ".ubit " + COCOTB_BITFILE)
+
+bitgen_code = [BITGEN] if "BITGEN_PY" in os.environ else [os.path.join(os.path.dirname(AbsPath(__file__)), f) for f in CODE_FILES]
+flow.Add("bitgen", [blif] + pnr_results + [arch_params_file] + bitgen_code, [fpga_txt + s for s in OUTPUT_SUFFIXES] + [COCOTB_BITSTREAM, COCOTB_BITFILE],
+    Bitstream, settings=[BITGEN_COMPRESS], enabled=args.bitgen)
+
+ran = flow.Run()
+
+# Append metrics of the run to history, only from stages run this time: logs of skipped stages
+# are left by earlier run, so their metrics are not recorded again
+if METRICS_DB and ran:
+    db = Metrics_db(AbsPath(METRICS_DB))
+    run_id = db.Add(Collect(WORK_DIR, proj_name, ParamsHash(p).hex(), stages=ran))
+    db.Close()
+    print("Metrics recorded as run", run_id, "to", AbsPath(METRICS_DB))
 
 # Simulate
 if args.sim:
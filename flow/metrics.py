@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+#
+# Metrics of flow runs & their history
+#
+# Yosys & VPR logs of work directory are parsed to record of the run: cell, LUT & FF counts,
+# routing, critical path, wirelength & runtimes of tools and flow stages. Records are appended
+# to SQLite database keyed by design, FPGA params hash, VPR seed & git revision of the flow, so
+# runs can be listed & compared. Comparison flags QoR or runtime getting worse over a threshold.
+#
+
+import argparse
+import collections
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+from bitfile import ParamsHash
+from params import Params
+from vpr_sweep import ParseVprLog
+
+FLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Metrics of record: (field, SQL type, kind, direction, stage)
+# kind is "qor" or "runtime", direction is +1 if bigger value is worse, -1 if smaller one is,
+# 0 if metric is not compared, stage is the flow stage writing log metric is parsed from
+METRICS = [
+    ("cells",         "INTEGER", "qor",      1, "synth"),
+    ("luts",          "INTEGER", "qor",      1, "synth"),
+    ("ffs",           "INTEGER", "qor",      1, "synth"),
+    ("brams",         "INTEGER", "qor",      1, "synth"),
+    ("routed",        "INTEGER", "qor",     -1, "pnr"),
+    ("channel_width", "INTEGER", "qor",      1, "pnr"),
+    ("channel_util",  "REAL",    "qor",      1, "pnr"),
+    ("cpd",           "REAL",    "qor",      1, "pnr"),
+    ("fmax",          "REAL",    "qor",     -1, "pnr"),
+    ("wirelength",    "INTEGER", "qor",      1, "pnr"),
+    ("synth_cpu",     "REAL",    "runtime",  1, "synth"),
+    ("synth_mem",     "REAL",    "runtime",  1, "synth"),
+    ("pack_time",     "REAL",    "runtime",  1, "pnr"),
+    ("place_time",    "REAL",    "runtime",  1, "pnr"),
+    ("route_time",    "REAL",    "runtime",  1, "pnr"),
+    ("vpr_time",      "REAL",    "runtime",  1, "pnr"),
+    ("vpr_mem",       "REAL",    "runtime",  1, "pnr"),
+]
+METRIC_NAMES = [m[0] for m in METRICS]
+KEY_FIELDS = ["design", "params_hash", "seed", "git_rev", "time"]
+# Stages metrics come from, runs without them have runtimes of stages only
+METRIC_STAGES = ("synth", "pnr")
+
+# Record of run, stages is {stage name : runtime (s)} of stages run, metrics not found in logs are None
+Run_metrics = collections.namedtuple("Run_metrics", ["id"] + KEY_FIELDS + METRIC_NAMES + ["stages"])
+
+# Runtime changes smaller than this (s) are noise, never regressions
+RUNTIME_MIN_DELTA = 1.0
+
+# Yosys stat: "Number of cells: N" & "  $lut   N" (old format), "  N cells" & "  N   $lut" (new one)
+YOSYS_STAT_START = ("Printing statistics.", "=== design hierarchy ===")
+YOSYS_CELLS_RE = re.compile(r"^\s+(?:Number of cells:\s+(\d+)|(\d+)\s+cells)\s*$")
+YOSYS_CELL_TYPE_RE = re.compile(r"^\s+(?:(\$?[\w$.\\]+)\s+(\d+)|(\d+)\s+(\$?[\w$.\\]+))\s*$")
+# BRAM cells of arch techmap (bram_map.v) & memory_bram rules (brams.txt)
+BRAM_CELLS = ("fpga_memory", "$__FPGA_RAM1K")
+YOSYS_END_RE = re.compile(r"End of script\..*CPU: user ([0-9.]+)s system ([0-9.]+)s(?:, MEM: ([0-9.]+) MB peak)?")
+# VPR
+VPR_SEED_RE = re.compile(r"--seed\s+(\d+)")
+VPR_CHANNEL_RE = re.compile(r"successfully routed with a channel width factor of (\d+)")
+VPR_UTIL_RE = re.compile(r"Maximum routing channel utilization:\s+([0-9.eE+-]+)")
+VPR_FMAX_RE = re.compile(r"Fmax: ([0-9.eE+-]+) MHz")
+VPR_STEP_RE = re.compile(r"(Packing|Placement|Routing) took ([0-9.]+) seconds")
+VPR_TOTAL_RE = re.compile(r"The entire flow of VPR took ([0-9.]+) seconds(?: \(max_rss ([0-9.]+) MiB\))?")
+VPR_STEP_FIELDS = {"Packing" : "pack_time", "Placement" : "place_time", "Routing" : "route_time"}
+
+
+def IsFlipFlop(cell_type):
+    name = cell_type.lower()
+    return ("dff" in name) or ("latch" in name)
+
+
+# Cells, LUTs, FFs & BRAMs of the last stat in Yosys log, CPU time (s) & peak memory (MB) of script
+def ParseYosysLog(fname):
+    r = {"cells" : None, "luts" : None, "ffs" : None, "brams" : None, "synth_cpu" : None, "synth_mem" : None}
+    if not os.path.isfile(fname):
+        return r
+    stat = None
+    with open(fname, errors="replace") as log:
+        for line in log:
+            if any(s in line for s in YOSYS_STAT_START):
+                stat = {"cells" : None, "luts" : 0, "ffs" : 0, "brams" : 0}
+                continue
+            m = YOSYS_END_RE.search(line)
+            if m:
+                r["synth_cpu"] = float(m.group(1)) + float(m.group(2))
+                r["synth_mem"] = float(m.group(3)) if m.group(3) else None
+                continue
+            if stat is None:
+                continue
+            m = YOSYS_CELLS_RE.match(line)
+            if m:
+                stat["cells"] = int(m.group(1) or m.group(2))
+                continue
+            m = YOSYS_CELL_TYPE_RE.match(line)
+            # cell types are listed after count of cells
+            if m and (stat["cells"] is not None):
+                cell_type, n = (m.group(1), m.group(2)) if m.group(1) else (m.group(4), m.group(3))
+                if cell_type == "$lut":
+                    stat["luts"] += int(n)
+                elif IsFlipFlop(cell_type):
+                    stat["ffs"] += int(n)
+                elif cell_type in BRAM_CELLS:
+                    stat["brams"] += int(n)
+    if (stat is not None) and (stat["cells"] is not None):
+        r.update(stat)
+    return r
+
+
+# Seed, routing, channel width & utilization, critical path (ns), Fmax (MHz), wirelength,
+# runtimes of steps (s) & peak memory (MiB) of VPR run from its log
+def ParseVprMetrics(fname):
+    r = ParseVprLog(fname)
+    r.update({"seed" : None, "channel_width" : None, "channel_util" : None, "fmax" : None, "pack_time" : None, "place_time" : None,
+        "route_time" : None, "vpr_time" : None, "vpr_mem" : None})
+    if not os.path.isfile(fname):
+        return r
+    with open(fname, errors="replace") as log:
+        for line in log:
+            m = VPR_SEED_RE.search(line)
+            if m and (r["seed"] is None):
+                r["seed"] = int(m.group(1))
+            m = VPR_CHANNEL_RE.search(line)
+            if m:
+                r["channel_width"] = int(m.group(1))
+            m = VPR_UTIL_RE.search(line)
+            if m:
+                r["channel_util"] = float(m.group(1))
+            m = VPR_FMAX_RE.search(line)
+            if m:
+                r["fmax"] = float(m.group(1))
+            m = VPR_STEP_RE.search(line)
+            if m:
+                r[VPR_STEP_FIELDS[m.group(1)]] = float(m.group(2))
+            m = VPR_TOTAL_RE.search(line)
+            if m:
+                r["vpr_time"] = float(m.group(1))
+                r["vpr_mem"] = float(m.group(2)) if m.group(2) else None
+    if (r["fmax"] is None) and r["cpd"]:
+        r["fmax"] = 1000.0 / r["cpd"]
+    return r
+
+
+# Runtimes of flow stages from stamps of stage graph, only given stages if any
+def StageRuntimes(stamp_file, stages = None):
+    if not os.path.isfile(stamp_file):
+        return {}
+    with open(stamp_file) as f:
+        stamps = json.load(f)
+    return {name : stamp["runtime"] for name, stamp in stamps.items() if ("runtime" in stamp) and ((stages is None) or (name in stages))}
+
+
+# Git revision of directory, "-dirty" is added if tracked files are modified, empty out of git
+def GitRevision(path = FLOW_DIR):
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+        if rev.returncode != 0:
+            return ""
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return rev.stdout.decode().strip() + ("-dirty" if status.stdout.strip() else "")
+
+
+# QoR metrics found in logs of run in work dir
+def QorMetrics(work_dir):
+    r = ParseYosysLog(os.path.join(work_dir, "yosys.log"))
+    r.update(ParseVprMetrics(os.path.join(work_dir, "vpr_stdout.log")))
+    return {name : r[name] for name, _, kind, _, _ in METRICS if (kind == "qor") and (r[name] is not None)}
+
+
+# Record of run in work dir, seed is taken from VPR log unless given.
+# stages are the ones run this time: only their runtimes are recorded & metrics of stages
+# not run are None, since their logs are left by earlier run
+def Collect(work_dir, design, params_hash, seed = None, stages = None, git_rev = None):
+    r = ParseYosysLog(os.path.join(work_dir, "yosys.log"))
+    r.update(ParseVprMetrics(os.path.join(work_dir, "vpr_stdout.log")))
+    if seed is not None:
+        r["seed"] = seed
+    r["routed"] = int(r["routed"]) if os.path.isfile(os.path.join(work_dir, "vpr_stdout.log")) else None
+    for name, _, _, _, stage in METRICS:
+        if (stages is not None) and (stage not in stages):
+            r[name] = None
+    return Run_metrics(id=None, design=design, params_hash=params_hash, seed=r["seed"], git_rev=GitRevision() if git_rev is None else git_rev,
+        time=time.time(), stages=StageRuntimes(os.path.join(work_dir, "stages.json"), stages), **{name : r[name] for name in METRIC_NAMES})
+
+
+class Metrics_db(object):
+    # Attributes:
+    #
+    # path
+    # conn (sqlite3 connection)
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # parallel flows append to the same database
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            # schema is checked & updated under write lock, flows may open new database at once
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, design TEXT NOT NULL, "
+                "params_hash TEXT, seed INTEGER, git_rev TEXT, time REAL NOT NULL)")
+            # metrics added after database was made become new columns
+            columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(runs)")]
+            for name, sql_type, _, _, _ in METRICS:
+                if name not in columns:
+                    self.conn.execute("ALTER TABLE runs ADD COLUMN {} {}".format(name, sql_type))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS runs_key ON runs (design, params_hash, git_rev)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS stage_runtimes (run_id INTEGER NOT NULL REFERENCES runs (id), "
+                "stage TEXT NOT NULL, runtime REAL, PRIMARY KEY (run_id, stage))")
+
+    def Close(self):
+        self.conn.close()
+
+    # Append record, returns its id
+    def Add(self, record):
+        fields = KEY_FIELDS + METRIC_NAMES
+        with self.conn:
+            cur = self.conn.execute("INSERT INTO runs ({}) VALUES ({})".format(", ".join(fields), ", ".join("?" * len(fields))),
+                [getattr(record, f) for f in fields])
+            run_id = cur.lastrowid
+            self.conn.executemany("INSERT INTO stage_runtimes (run_id, stage, runtime) VALUES (?, ?, ?)",
+                [(run_id, stage, runtime) for stage, runtime in sorted(record.stages.items())])
+        return run_id
+
+    def Record(self, row):
+        stages = {s["stage"] : s["runtime"] for s in self.conn.execute("SELECT stage, runtime FROM stage_runtimes WHERE run_id = ?", (row["id"],))}
+        return Run_metrics(stages=stages, **{f : row[f] for f in ["id"] + KEY_FIELDS + METRIC_NAMES})
+
+    def Get(self, run_id):
+        row = self.conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise ValueError("No run", run_id, "in", self.path)
+        return self.Record(row)
+
+    # Records matching given fields (git_rev matches by prefix), the latest first.
+    # with_metrics leaves out runs which did not run any of METRIC_STAGES.
+    def Query(self, design = None, params_hash = None, git_rev = None, before = None, limit = None, with_metrics = False):
+        conditions = [("design = ?", [design]), ("params_hash = ?", [params_hash]), ("id < ?", [before]),
+            ("substr(git_rev, 1, ?) = ?", [len(git_rev or ""), git_rev])]
+        where = [sql for sql, values in conditions if values[-1] is not None]
+        values = [v for _, vals in conditions if vals[-1] is not None for v in vals]
+        if with_metrics:
+            where.append("id IN (SELECT run_id FROM stage_runtimes WHERE stage IN ({}))".format(", ".join("?" * len(METRIC_STAGES))))
+            values += METRIC_STAGES
+        sql = "SELECT * FROM runs" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT " + str(int(limit))
+        return [self.Record(row) for row in self.conn.execute(sql, values)]
+
+    def Designs(self):
+        return [row["design"] for row in self.conn.execute("SELECT DISTINCT design FROM runs ORDER BY design")]
+
+    # Run to compare record with: the latest earlier one of same design & params with metrics, at git_rev if given
+    def Baseline(self, record, git_rev = None):
+        runs = self.Query(record.design, record.params_hash, git_rev, before=record.id, limit=1, with_metrics=True)
+        return runs[0] if runs else None
+
+
+# Metric changes of new run against base one: [(name, kind, base value, new value, relative change, regression)]
+# Relative change is positive when the metric got worse. qor_threshold & runtime_threshold are
+# relative changes allowed before it is a regression.
+def Compare(base, new, qor_threshold, runtime_threshold):
+    r = []
+    metrics = [(name, kind, direction, getattr(base, name), getattr(new, name)) for name, _, kind, direction, _ in METRICS]
+    metrics += [("stage_" + s, "runtime", 1, base.stages[s], new.stages[s]) for s in sorted(base.stages) if s in new.stages]
+    for name, kind, direction, a, b in metrics:
+        if (a is None) or (b is None) or (direction == 0):
+            continue
+        delta = (b - a) * direction
+        change = delta / abs(a) if a else (0.0 if delta == 0 else (1.0 if delta > 0 else -1.0))
+        if kind == "qor":
+            regression = (change > qor_threshold) or ((name == "routed") and (delta > 0))
+        else:
+            regression = (change > runtime_threshold) and (delta > RUNTIME_MIN_DELTA)
+        r.append((name, kind, a, b, change, regression))
+    return r
+
+
+def FormatValue(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.4g}".format(value)
+    return str(value)
+
+
+def PrintRuns(runs):
+    columns = [("id", 6), ("time", 16), ("design", 16), ("seed", 6), ("git_rev", 13), ("luts", 7), ("ffs", 7), ("cpd", 8), ("wirelength", 10), ("vpr_time", 8)]
+    print(" ".join("{:<{}}".format(c, w) for c, w in columns))
+    for run in runs:
+        values = [FormatValue(getattr(run, c)) for c, _ in columns]
+        values[1] = time.strftime("%Y-%m-%d %H:%M", time.localtime(run.time))
+        values[4] = (run.git_rev or "-")[:7] + ("-dirty" if (run.git_rev or "").endswith("-dirty") else "")
+        print(" ".join("{:<{}}".format(v, w) for v, (_, w) in zip(values, columns)))
+
+
+# Print comparison of run pair, returns True if there are regressions
+def PrintComparison(base, new, args):
+    changes = Compare(base, new, args.qor_threshold, args.runtime_threshold)
+    print("{}: run {} ({}, seed {}) against run {} ({}, seed {})".format(new.design, new.id, (new.git_rev or "-")[:12], new.seed,
+        base.id, (base.git_rev or "-")[:12], base.seed))
+    if base.params_hash != new.params_hash:
+        print("  FPGA params differ")
+    regressions = [c for c in changes if c[5]]
+    for name, kind, a, b, change, regression in changes:
+        if regression or args.verbose:
+            print("  {:<8} {:<20} {:>12} -> {:<12} {:+.1%}".format("REGRESS" if regression else "", name, FormatValue(a), FormatValue(b), change))
+    if not regressions:
+        print("  no regressions")
+    return bool(regressions)
+
+
+################################# MAIN #################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Record metrics of flow runs to history database, list & compare them")
+    parser.add_argument("--db", type=str, default=os.environ.get("METRICS_DB", os.path.join(FLOW_DIR, "metrics.db")), help="History database")
+    commands = parser.add_subparsers(dest="command")
+    record = commands.add_parser("record", help="Parse logs of work directory & append run to history")
+    record.add_argument("work_dir", type=str, help="Flow work directory with yosys.log & vpr_stdout.log")
+    record.add_argument("--design", type=str, required=True, help="Design name")
+    record.add_argument("--cfg", type=str, default=os.path.join(FLOW_DIR, "..", "arch", "params.cfg"), help="FPGA parameters cfg file of the run")
+    record.add_argument("--seed", type=int, help="VPR seed (found in VPR log by default)")
+    record.add_argument("--print", action="store_const", const = True, default = False, help="Print record without storing it")
+    history = commands.add_parser("list", help="List runs, the latest first")
+    history.add_argument("--design", type=str, help="Only runs of this design")
+    history.add_argument("--git_rev", type=str, help="Only runs of this git revision (prefix)")
+    history.add_argument("--limit", type=int, default=20, help="Number of runs listed")
+    compare = commands.add_parser("compare", help="Compare runs, exit code is 1 if there are regressions")
+    compare.add_argument("runs", type=int, nargs="*", help="Base & new run ids, or new run id (latest run with metrics of every design by default)")
+    compare.add_argument("--design", type=str, help="Only latest run of this design")
+    compare.add_argument("--base_rev", type=str, help="Compare with latest run of this git revision (prefix) instead of previous run")
+    compare.add_argument("--qor_threshold", type=float, default=0.02, help="Allowed relative QoR regression")
+    compare.add_argument("--runtime_threshold", type=float, default=0.2, help="Allowed relative runtime regression")
+    compare.add_argument("--verbose", action="store_const", const = True, default = False, help="Print all metrics, not only regressions")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        r = Collect(args.work_dir, args.design, ParamsHash(Params(args.cfg)).hex(), args.seed)
+        if args.print:
+            for field, value in r._asdict().items():
+                print("{:<16} {}".format(field, value))
+            return
+        db = Metrics_db(args.db)
+        print("Run", db.Add(r), "of", args.design, "recorded to", args.db)
+    elif args.command == "list":
+        PrintRuns(Metrics_db(args.db).Query(args.design, git_rev=args.git_rev, limit=args.limit))
+    elif args.command == "compare":
+        db = Metrics_db(args.db)
+        if len(args.runs) > 2:
+            parser.error("compare takes at most 2 run ids")
+        if len(args.runs) == 2:
+            pairs = [(db.Get(args.runs[0]), db.Get(args.runs[1]))]
+        else:
+            if args.runs:
+                news = [db.Get(args.runs[0])]
+            else:
+                news = [runs[0] for runs in (db.Query(d, limit=1, with_metrics=True) for d in ([args.design] if args.design else db.Designs())) if runs]
+            pairs = []
+            for new in news:
+                base = db.Baseline(new, args.base_rev)
+                if base is None:
+                    print("{}: no run to compare run {} with".format(new.design, new.id))
+                else:
+                    pairs.append((base, new))
+        regressions = [PrintComparison(base, new, args) for base, new in pairs]
+        sys.exit(1 if any(regressions) else 0)
+    else:
+        parser.print_help()
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,18 @@ class Params(object):
                 exec("self.fpga_config_calc[\"" + key.upper() + "\"] = int(eval(val))")
 
 
+# LUT delay from every input (ps), same as in delay matrix of VTR arch
+def LutInputDelays(p):
+    r = []
+    for i in range(p.FPGA_LUT_WIDTH):
+        lut_delay = p.tech_config.TECH_LUT_DELAY
+        if i >=2:   # !only for SKY130!
+            lut_delay *= 2
+        # r.append((i+2)*p.tech_config.TECH_LUT_DELAY)
+        r.append((i+2)*lut_delay)
+    return r
+
+
 # Called only if executed directly
 def main():
     # Parse command-line arguments
@@ -105,12 +117,8 @@ def main():
 
     # Calc delays
         lut_delay_matrix = ""
-        for i in range(p.FPGA_LUT_WIDTH):
-            lut_delay = p.tech_config.TECH_LUT_DELAY
-            if i >=2:   # !only for SKY130!
-                lut_delay *= 2
-            # lut_delay_matrix += "                {PS}e-12\n".format(PS=(i+2)*p.tech_config.TECH_LUT_DELAY)
-            lut_delay_matrix += "                {PS}e-12\n".format(PS=(i+2)*lut_delay)
+        for delay in LutInputDelays(p):
+            lut_delay_matrix += "                {PS}e-12\n".format(PS=delay)
 
     # Generate VTR config file (XML) !!!! TODO : generate XML with large memory !!!!
     print(VTR_PARAMS_FMT.format(cfg=args.cfg, **p.fpga_config_calc, **p.tech_config_dict, MEMORY_NAME = "mem_"+str(p.MEMORY_SIZE)+"x"+str(p.MEMORY_WIDTH),
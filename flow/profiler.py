@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# Per-phase wall/CPU time, memory & counters recorder
+#
+
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, max RSS is not reported there
+    resource = None
+
+
+# Max resident set size of this process in MB
+def MaxRssMb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+class Phase(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            if tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+                # before Python 3.9 peak is reported since start of tracing
+                tracemalloc.reset_peak()
+            self.wall = time.perf_counter()
+            self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.enabled:
+            r = dict()
+            r["name"] = self.name
+            r["wall_s"] = time.perf_counter() - self.wall
+            r["cpu_s"] = time.process_time() - self.cpu
+            if tracemalloc.is_tracing():
+                r["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            r["max_rss_mb"] = MaxRssMb()
+            self.profiler.phases.append(r)
+        return False
+
+
+class Phase_profiler(object):
+    # Does nothing unless enabled, so it can always be passed around
+    # Attributes:
+    # enabled
+    # trace_memory
+    # phases (list of per phase results in execution order)
+    # counters
+    # info (free form run description)
+
+    def __init__(self, enabled = False, trace_memory = True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.counters = dict()
+        self.info = dict()
+
+    def Start(self):
+        if self.enabled:
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.start_wall = time.perf_counter()
+            self.start_cpu = time.process_time()
+
+    def Stop(self):
+        if self.enabled:
+            self.info["wall_s"] = time.perf_counter() - self.start_wall
+            self.info["cpu_s"] = time.process_time() - self.start_cpu
+            self.info["max_rss_mb"] = MaxRssMb()
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    # Context manager measuring one phase
+    def Phase(self, name):
+        return Phase(self, name)
+
+    def Count(self, name, n = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def AddCounters(self, counters):
+        for name, n in counters.items():
+            self.Count(name, n)
+
+    def Result(self):
+        return {"info" : self.info, "phases" : self.phases, "counters" : self.counters}
+
+    def WriteJson(self, fname):
+        with open(fname, "w") as f:
+            json.dump(self.Result(), f, indent=2)
+            print(file=f)
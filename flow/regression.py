@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+#
+# Regression over test designs
+#
+# Every directory of tests dir with RTL source, .pin file, optional .sdc & cocotb test named as
+# the directory is a design. Each one is put through generate.py flow (synthesis, P&R, bitgen)
+# in its own run directory & simulated by its cocotb test there, designs are run in parallel by
+# bounded pool of workers. Results, runtimes of stages & QoR numbers go to JSON & JUnit reports.
+#
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from metrics import QorMetrics, StageRuntimes
+
+FLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+RTL_EXTENSIONS = (".vhd", ".vhdl", ".v", ".sv")
+# Lines of failed step log put to report
+LOG_TAIL = 40
+
+
+class Test_design(object):
+    # Attributes:
+    #
+    # name (directory name, also top unit & cocotb test module)
+    # path
+    # rtl (sources)
+    # pinout
+    # sdc (or None)
+    # test (cocotb test module file or None)
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path)
+        files = sorted(os.listdir(self.path))
+        self.rtl = [os.path.join(self.path, f) for f in files if os.path.splitext(f)[1] in RTL_EXTENSIONS]
+        self.pinout = self.File(".pin")
+        self.sdc = self.File(".sdc")
+        self.test = self.File(".py")
+
+    def File(self, ext):
+        fname = os.path.join(self.path, self.name + ext)
+        return fname if os.path.isfile(fname) else None
+
+    def IsComplete(self):
+        return bool(self.rtl) and (self.pinout is not None)
+
+
+# Designs of tests dir, only given names if any
+def Discover(tests_dir, names = ()):
+    r = []
+    for name in sorted(os.listdir(tests_dir)):
+        path = os.path.join(tests_dir, name)
+        if (not os.path.isdir(path)) or (names and (name not in names)):
+            continue
+        design = Test_design(path)
+        if design.IsComplete():
+            r.append(design)
+        else:
+            print("Skipping", path, "without RTL sources or pinout", file=sys.stderr)
+    for name in names:
+        if name not in [d.name for d in r]:
+            raise ValueError("No test design", name, "in", tests_dir)
+    return r
+
+
+# Run command with output to log file, returns exit code (None on timeout) & runtime
+def RunStep(cmd, cwd, log, timeout = None):
+    start = time.time()
+    with open(log, "w") as f:
+        try:
+            rc = subprocess.call(cmd, cwd=cwd, stdout=f, stderr=subprocess.STDOUT, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            rc = None
+    return rc, time.time() - start
+
+
+def LogTail(log, lines = LOG_TAIL):
+    if not os.path.isfile(log):
+        return ""
+    with open(log, errors="replace") as f:
+        return "".join(f.readlines()[-lines:])
+
+
+# Numbers of failed & all cocotb tests from its results.xml, None if there are no results
+def CocotbResults(fname):
+    if not os.path.isfile(fname):
+        return None
+    root = ET.parse(fname).getroot()
+    cases = list(root.iter("testcase"))
+    failed = [c for c in cases if (c.find("failure") is not None) or (c.find("error") is not None)]
+    return len(failed), len(cases)
+
+
+# Put design through flow & simulation, returns result record
+def RunDesign(design, run_dir, args):
+    r = {"design" : design.name, "run_dir" : run_dir, "status" : "pass", "failed_step" : None, "runtime" : {}, "stages" : {}, "qor" : {}}
+    os.makedirs(run_dir, exist_ok=True)
+    cmd = [sys.executable, os.path.join(FLOW_DIR, "generate.py")] + design.rtl + ["--pinout", design.pinout, "--run_dir", run_dir]
+    if any(f.endswith((".vhd", ".vhdl")) for f in design.rtl):
+        cmd += ["--top", design.name]
+    if design.sdc:
+        cmd += ["--sdc", design.sdc]
+    cmd += shlex.split(args.flow_args)
+    steps = [("flow", cmd, FLOW_DIR)]
+    if (not args.no_sim) and design.test:
+        # cocotb dir of run links files of flow one, test module of design may be not among them
+        cocotb_dir = os.path.join(run_dir, "cocotbsim")
+        os.makedirs(cocotb_dir, exist_ok=True)
+        test_link = os.path.join(cocotb_dir, os.path.basename(design.test))
+        if not os.path.lexists(test_link):
+            os.symlink(design.test, test_link)
+        steps.append(("sim", [args.make, "MODULE=" + design.name], os.path.join(run_dir, "cocotbsim")))
+
+    for step, cmd, cwd in steps:
+        log = os.path.join(run_dir, step + ".log")
+        rc, runtime = RunStep(cmd, cwd, log, args.timeout)
+        r["runtime"][step] = runtime
+        message = "timeout" if rc is None else "exit code " + str(rc)
+        if step == "flow":
+            r["stages"] = StageRuntimes(os.path.join(run_dir, "work", "stages.json"))
+            r["qor"] = QorMetrics(os.path.join(run_dir, "work"))
+        if step == "sim":
+            # make may succeed with failed tests
+            results = CocotbResults(os.path.join(cwd, "results.xml"))
+            if results is not None:
+                r["qor"]["tests_failed"], r["qor"]["tests"] = results
+            if rc == 0:
+                if results is None:
+                    rc, message = -1, "no cocotb results"
+                elif results[0] != 0:
+                    rc, message = -1, "{} of {} cocotb tests failed".format(*results)
+        if rc != 0:
+            r["status"] = "fail"
+            r["failed_step"] = step
+            r["message"] = message
+            r["log"] = LogTail(log)
+            break
+    return r
+
+
+def WriteJson(results, fname):
+    failed = [r["design"] for r in results if r["status"] != "pass"]
+    report = {"designs" : results, "passed" : len(results) - len(failed), "failed" : failed}
+    with open(fname, "w") as f:
+        json.dump(report, f, indent=1)
+
+
+def WriteJunit(results, fname):
+    suite = ET.Element("testsuite", name="regression", tests=str(len(results)),
+        failures=str(sum(1 for r in results if r["status"] != "pass")), time="{:.3f}".format(sum(sum(r["runtime"].values()) for r in results)))
+    for r in results:
+        case = ET.SubElement(suite, "testcase", classname="regression", name=r["design"], time="{:.3f}".format(sum(r["runtime"].values())))
+        props = ET.SubElement(case, "properties")
+        for key, val in list(r["qor"].items()) + [("runtime_" + k, "{:.3f}".format(v)) for k, v in list(r["runtime"].items()) + list(r["stages"].items())]:
+            ET.SubElement(props, "property", name=key, value=str(val))
+        if r["status"] != "pass":
+            failure = ET.SubElement(case, "failure", message="{} failed: {}".format(r["failed_step"], r["message"]))
+            failure.text = r["log"]
+        ET.SubElement(case, "system-out").text = "run dir: " + r["run_dir"]
+    root = ET.Element("testsuites")
+    root.append(suite)
+    ET.ElementTree(root).write(fname, encoding="utf-8", xml_declaration=True)
+
+
+################################# MAIN #################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Run test designs through FPGA flow & cocotb simulation in parallel")
+    parser.add_argument("designs", type=str, nargs="*", help="Names of test designs to run (all by default)")
+    parser.add_argument("--tests_dir", type=str, default=os.path.join(FLOW_DIR, "..", "tests"), help="Directory of test designs")
+    parser.add_argument("--runs_dir", type=str, default="./regression", help="New directory of regression run is made here")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Designs run at once")
+    parser.add_argument("--timeout", type=float, help="Limit of every flow & simulation step (s)")
+    parser.add_argument("--flow_args", type=str, default="", help="Extra arguments of generate.py, like \"--seeds 4\"")
+    parser.add_argument("--no_sim", action="store_const", const = True, default = False, help="Do not run cocotb tests")
+    parser.add_argument("--make", type=str, default="make", help="Make command to run cocotb tests")
+    parser.add_argument("--report", type=str, default="", help="Base name of .json & .xml reports (in regression run directory by default)")
+    args = parser.parse_args()
+
+    designs = Discover(args.tests_dir, args.designs)
+    os.makedirs(args.runs_dir, exist_ok=True)
+    top = tempfile.mkdtemp(prefix=time.strftime("%Y%m%d_%H%M%S_"), dir=os.path.abspath(args.runs_dir))
+    print("Regression of", len(designs), "designs in", top)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(args.jobs or 1, 1)) as pool:
+        futures = [pool.submit(RunDesign, d, os.path.join(top, d.name), args) for d in designs]
+        results = []
+        for design, future in zip(designs, futures):
+            r = future.result()
+            results.append(r)
+            qor = ", ".join("{} {}".format(k, v) for k, v in r["qor"].items())
+            print("{:<16} {:<4} {:7.1f} s  {}".format(design.name, r["status"].upper(), sum(r["runtime"].values()), qor))
+
+    report = args.report if args.report else os.path.join(top, "report")
+    WriteJson(results, report + ".json")
+    WriteJunit(results, report + ".xml")
+    failed = sum(1 for r in results if r["status"] != "pass")
+    print("{} passed, {} failed in {:.1f} s, reports {}.json & .xml".format(len(results) - failed, failed, time.time() - start, report))
+    sys.exit(1 if failed else 0)
+
+
+# Do not call main when importing this module
+if __name__ == "__main__":
+    main()
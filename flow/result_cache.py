@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+# Content-addressed on-disk cache of tool outputs with LRU size eviction
+#
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+HASH_CHUNK = 1 << 20
+
+
+# Hash of contents of files (in given order) & extra strings or bytes
+def FilesHash(files, extra = ()):
+    h = hashlib.sha256()
+    for fname in files:
+        h.update(str(os.path.getsize(fname)).encode() + b"\0")
+        with open(fname, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+    for e in extra:
+        h.update(b"\0" + (e if isinstance(e, bytes) else str(e).encode()))
+    return h.hexdigest()
+
+
+class Result_cache(object):
+    # Every entry is a directory named by key of inputs holding output files,
+    # its modification time is the time of last use
+    # Attributes:
+    # path
+    # max_bytes
+
+    def __init__(self, path, max_mb = 1024):
+        self.path = path
+        self.max_bytes = int(max_mb * (1 << 20))
+        os.makedirs(path, exist_ok=True)
+
+    # Key from contents of input files (in given order) & extra strings or bytes
+    def Key(self, files, extra = ()):
+        return FilesHash(files, extra)
+
+    # Copy outputs ({name in entry : destination file}) of cached entry, returns False if there is no complete one
+    def Restore(self, key, outputs):
+        entry = os.path.join(self.path, key)
+        if not all(os.path.isfile(os.path.join(entry, name)) for name in outputs):
+            return False
+        for name, fname in outputs.items():
+            shutil.copyfile(os.path.join(entry, name), fname)
+        os.utime(entry)
+        return True
+
+    # Save outputs ({name in entry : produced file}) under key & evict least recently used entries over size limit
+    def Store(self, key, outputs):
+        entry = os.path.join(self.path, key)
+        # entry appears at once, so concurrent runs never see partial one
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=self.path)
+        try:
+            for name, fname in outputs.items():
+                shutil.copyfile(fname, os.path.join(tmp, name))
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp)
+        self.Evict(keep = key)
+
+    # Entries as list of (last use time, size in bytes, key), oldest first
+    def Entries(self):
+        r = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            r.append((os.path.getmtime(entry), size, key))
+        return sorted(r)
+
+    def Evict(self, keep = None):
+        entries = self.Entries()
+        total = sum(size for t, size, key in entries)
+        for t, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
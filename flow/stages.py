@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+#
+# Flow as graph of stages with up-to-date checks
+#
+# Every stage declares its input & output files. Producer of a file is run before its consumers.
+# Stage is skipped if content of its inputs, versions of tools it runs & its settings are the same
+# as on its last successful run & its outputs are still the ones that run left. Since contents
+# are compared (not times), stage which rewrites its outputs unchanged does not rerun stages after it.
+#
+
+import json
+import os
+import subprocess
+import time
+from result_cache import FilesHash
+
+# tool command -> version string, tools are asked once per process
+tool_versions = dict()
+
+
+# Version output of tool command (like [yosys, "-V"]), empty if tool can not be run
+def ToolVersion(cmd):
+    key = tuple(cmd)
+    if key not in tool_versions:
+        try:
+            r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+            tool_versions[key] = r.stdout.decode(errors="replace").strip()
+        except (OSError, subprocess.SubprocessError):
+            tool_versions[key] = ""
+    return tool_versions[key]
+
+
+# Hash of file or None if there is no such one
+def FileHash(fname):
+    if not os.path.isfile(fname):
+        return None
+    return FilesHash([fname])
+
+
+class Stage(object):
+    # Attributes:
+    #
+    # name
+    # inputs (files)
+    # outputs (files)
+    # action (function running the stage)
+    # tools (version commands of tools stage runs)
+    # settings (strings of command lines & options outputs depend on)
+    # enabled (disabled stage is never run, its outputs are used as they are)
+    # always (run even if up to date, like interactive tools)
+
+    def __init__(self, name, inputs, outputs, action, tools = (), settings = (), enabled = True, always = False):
+        self.name = name
+        self.inputs = [os.path.abspath(f) for f in inputs]
+        self.outputs = [os.path.abspath(f) for f in outputs]
+        self.action = action
+        self.tools = list(tools)
+        self.settings = [str(s) for s in settings]
+        self.enabled = enabled
+        self.always = always
+
+
+class Stage_graph(object):
+    # Attributes:
+    #
+    # stages (in order of adding)
+    # stamp_file (json with stamps of last successful runs)
+    # stamps (stage name -> {"key" : hash of inputs, tools & settings, "outputs" : {file : hash}, "runtime" : s})
+    # force (run enabled stages even if up to date)
+
+    def __init__(self, stamp_file, force = False):
+        self.stages = []
+        self.stamp_file = stamp_file
+        self.force = force
+        self.stamps = dict()
+        if os.path.isfile(stamp_file):
+            try:
+                with open(stamp_file) as f:
+                    self.stamps = json.load(f)
+            except ValueError:
+                # broken stamps make every stage run again
+                self.stamps = dict()
+
+    def Add(self, *args, **kwargs):
+        stage = Stage(*args, **kwargs)
+        if any(s.name == stage.name for s in self.stages):
+            raise ValueError("Duplicate stage", stage.name)
+        self.stages.append(stage)
+        return stage
+
+    # Stages with producers of their inputs first, otherwise in order of adding
+    def Order(self):
+        producer = dict()
+        for s in self.stages:
+            for f in s.outputs:
+                if f in producer:
+                    raise ValueError("File", f, "is output of stages", producer[f].name, "and", s.name)
+                producer[f] = s
+        r = []
+        state = dict()
+        for root in self.stages:
+            if root.name in state:
+                continue
+            state[root.name] = "visiting"
+            work = [(root, iter(root.inputs))]
+            while work:
+                stage, inputs = work[-1]
+                for f in inputs:
+                    dep = producer.get(f)
+                    if (dep is None) or (dep is stage) or (state.get(dep.name) == "done"):
+                        continue
+                    if state.get(dep.name) == "visiting":
+                        raise ValueError("Stages loop through", dep.name, "and", stage.name)
+                    state[dep.name] = "visiting"
+                    work.append((dep, iter(dep.inputs)))
+                    break
+                else:
+                    work.pop()
+                    state[stage.name] = "done"
+                    r.append(stage)
+        return r
+
+    # Key of stage inputs, missing inputs are part of it too
+    def Key(self, stage):
+        present = [f for f in stage.inputs if os.path.isfile(f)]
+        missing = ["missing " + f for f in stage.inputs if not os.path.isfile(f)]
+        versions = [ToolVersion(cmd) for cmd in stage.tools]
+        return FilesHash(present, stage.inputs + missing + versions + stage.settings)
+
+    def UpToDate(self, stage, key):
+        stamp = self.stamps.get(stage.name)
+        if (stamp is None) or (stamp["key"] != key):
+            return False
+        for f in stage.outputs:
+            h = FileHash(f)
+            if (h is None) or (stamp["outputs"].get(f) != h):
+                return False
+        return True
+
+    def Save(self):
+        tmp = self.stamp_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.stamps, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.stamp_file)
+
+    # Run stages which are out of date, returns names of stages run
+    def Run(self):
+        ran = []
+        for stage in self.Order():
+            if not stage.enabled:
+                continue
+            key = self.Key(stage)
+            if (not self.force) and (not stage.always) and self.UpToDate(stage, key):
+                print("Stage", stage.name, "is up to date, skipped")
+                continue
+            # stamp is dropped first, so interrupted stage is run again
+            self.stamps.pop(stage.name, None)
+            self.Save()
+            start = time.time()
+            stage.action()
+            runtime = time.time() - start
+            self.stamps[stage.name] = {"key" : key, "outputs" : {f : FileHash(f) for f in stage.outputs}, "runtime" : runtime}
+            self.Save()
+            ran.append(stage.name)
+        return ran
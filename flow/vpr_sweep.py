@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# Parallel VPR place & route with different seeds & selection of the best result
+#
+# Every seed is run in its own directory, so runs never share files. Results are ranked by
+# routing success, critical path delay & wirelength, files of the best run are copied to work
+# directory as if VPR was run there once.
+#
+
+import math
+import os
+import re
+import shutil
+import subprocess
+import time
+
+# Markers of failed routing in vpr_stdout.log (as checked by CheckVPR of generate.py)
+ROUTE_FAILED = ("Route failed", "Routing failed")
+ROUTE_DONE = "successfully routed"
+CPD_RE = re.compile(r"Final critical path(?: delay)?(?: \(least slack\))?: ([0-9.eE+-]+) ns")
+WIRELENGTH_RE = re.compile(r"Total wirelength: ([0-9]+)")
+POLL_PERIOD = 0.2
+
+
+# Routing success, final critical path delay (ns) & total wirelength of VPR run from its log,
+# numbers not found in log are None
+def ParseVprLog(fname):
+    r = {"routed" : False, "cpd" : None, "wirelength" : None}
+    if not os.path.isfile(fname):
+        return r
+    failed = False
+    with open(fname, errors="replace") as log:
+        for line in log:
+            if any(m in line for m in ROUTE_FAILED):
+                failed = True
+            elif ROUTE_DONE in line:
+                r["routed"] = True
+            m = CPD_RE.search(line)
+            if m:
+                r["cpd"] = float(m.group(1))
+            m = WIRELENGTH_RE.search(line)
+            if m:
+                r["wirelength"] = int(m.group(1))
+    r["routed"] = r["routed"] and not failed
+    return r
+
+
+class Vpr_run(object):
+    # Attributes:
+    #
+    # seed
+    # wdir (directory of run)
+    # proc (running VPR process or None)
+    # start (time process was started)
+    # rc (exit code, None if not finished or cancelled)
+    # routed
+    # cpd (final critical path delay, ns)
+    # wirelength
+    # runtime (s)
+
+    def __init__(self, seed, wdir):
+        self.seed = seed
+        self.wdir = wdir
+        self.proc = None
+        self.rc = None
+        self.routed = False
+        self.cpd = None
+        self.wirelength = None
+        self.runtime = None
+
+    def Start(self, args):
+        if os.path.isdir(self.wdir):
+            shutil.rmtree(self.wdir)
+        os.makedirs(self.wdir)
+        self.start = time.time()
+        # everything VPR prints is in vpr_stdout.log, parallel outputs would be mixed on console
+        self.proc = subprocess.Popen(args + ["--seed", str(self.seed)], cwd=self.wdir, stdout=subprocess.DEVNULL)
+
+    # Returns True once process has finished
+    def Poll(self):
+        if self.proc.poll() is None:
+            return False
+        self.rc = self.proc.returncode
+        self.runtime = time.time() - self.start
+        self.proc = None
+        log = ParseVprLog(os.path.join(self.wdir, "vpr_stdout.log"))
+        self.routed = (self.rc == 0) and log["routed"]
+        self.cpd = log["cpd"]
+        self.wirelength = log["wirelength"]
+        return True
+
+    def Cancel(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+
+    # Sort key, the best run is the first
+    def Rank(self):
+        return (not self.routed, self.cpd if self.cpd is not None else math.inf,
+            self.wirelength if self.wirelength is not None else math.inf, self.seed)
+
+    def Describe(self):
+        if self.rc is None:
+            return "seed {}: cancelled".format(self.seed)
+        return "seed {}: {}, critical path {} ns, wirelength {}, {:.1f} s".format(self.seed,
+            "routed" if self.routed else "failed (exit code {})".format(self.rc), self.cpd, self.wirelength, self.runtime)
+
+
+# Run VPR with every seed, at most jobs at once, & return runs sorted from the best one.
+# outputs ({VPR option : file}) are files VPR is told to write, every run writes them to its own directory.
+# Once a routed run meets target_cpd (ns), the ones left are cancelled.
+def SeedSweep(vpr_args, outputs, seeds, jobs, sweep_dir, target_cpd = None):
+    runs = [Vpr_run(seed, os.path.join(sweep_dir, "seed_" + str(seed))) for seed in seeds]
+    pending = list(runs)
+    running = []
+    done = False
+    try:
+        while (pending and not done) or running:
+            while pending and (not done) and (len(running) < max(jobs, 1)):
+                run = pending.pop(0)
+                args = list(vpr_args)
+                for option, fname in outputs.items():
+                    args += [option, os.path.join(run.wdir, os.path.basename(fname))]
+                run.Start(args)
+                running.append(run)
+            time.sleep(POLL_PERIOD)
+            for run in [r for r in running if r.Poll()]:
+                running.remove(run)
+                print("VPR", run.Describe())
+                if (target_cpd is not None) and run.routed and (run.cpd is not None) and (run.cpd <= target_cpd):
+                    done = True
+            if done:
+                for run in running:
+                    run.Cancel()
+                running = []
+    finally:
+        for run in running:
+            run.Cancel()
+    return sorted(runs, key=Vpr_run.Rank)
+
+
+# Copy files of run to work dir, outputs ({VPR option : file}) get their names back
+def Promote(run, outputs, work_dir):
+    names = {os.path.basename(fname) : fname for fname in outputs.values()}
+    for name in os.listdir(run.wdir):
+        src = os.path.join(run.wdir, name)
+        if os.path.isfile(src):
+            shutil.copyfile(src, names.get(name, os.path.join(work_dir, name)))
@@ -1,3 +1,4 @@
+import os
 import cocotb
 from cocotb.triggers import RisingEdge
 from cocotb.clock import Clock
@@ -5,6 +6,7 @@ from cocotbext.wishbone.driver import WishboneMaster
 from cocotbext.wishbone.driver import WBOp
 
 from params import Params
+from bitfile import Bitfile_parser, IsBitfile, Delta_parser
 
 USER_WB_BASEADDR    = 0x30F00000
 
@@ -14,6 +16,9 @@ HRNODE_CFG_ADDR     = 0x30300000
 CLK_CFG_ADDR        = 0x30E00000
 RST_CFG_ADDR        = 0x30A00000
 
+# Params config of fabric, flow run directories set it in their cocotb Makefile
+PARAMS_CFG          = os.environ.get("FPGA_PARAMS_CFG", "../../arch/params.cfg")
+
 CONFIG_DELAY_TICKS  = 1
 FREQ_KHZ            = 3000
 
@@ -113,24 +118,32 @@ class WishboneCfgLoader:
         hrnode_fw = []
         
         # Read params config file
-        p = Params("../../arch/params.cfg")
+        p = Params(PARAMS_CFG)
         C_BD = p.BLOCK_CFGCHAIN_LEN
         C_VD = p.VRNODE_CFGCHAIN_LEN
         C_HD = p.HRNODE_CFGCHAIN_LEN        
         
-        with open(BITSTREAM) as f:
-            for line in f:
-                
-                buf_line = line.replace("\n","").split(" ")
-                
-                if i < C_BD:
-                    block_fw.append(int(listToString(reversed(buf_line[0])),2))
-                if i < C_VD:
-                    vrnode_fw.append(int(listToString(reversed(buf_line[1])),2))
-                if i < C_HD:
-                    hrnode_fw.append(int(listToString(reversed(buf_line[2])),2))  
-                
-                i += 1
+        if IsBitfile(BITSTREAM):
+            # binary container - words are ready to be written, packed chains are unpacked by parser
+            bitfile = Bitfile_parser(BITSTREAM)
+            bitfile.CheckParams(p)
+            block_fw = bitfile.Words(0)
+            vrnode_fw = bitfile.Words(1)
+            hrnode_fw = bitfile.Words(2)
+        else:
+            with open(BITSTREAM) as f:
+                for line in f:
+                    
+                    buf_line = line.replace("\n","").split(" ")
+                    
+                    if i < C_BD:
+                        block_fw.append(int(listToString(reversed(buf_line[0])),2))
+                    if i < C_VD:
+                        vrnode_fw.append(int(listToString(reversed(buf_line[1])),2))
+                    if i < C_HD:
+                        hrnode_fw.append(int(listToString(reversed(buf_line[2])),2))  
+                    
+                    i += 1
                 
         for regs in block_fw:
             await self.load_lb_bit(regs)
@@ -140,4 +153,17 @@ class WishboneCfgLoader:
 
         for regs in hrnode_fw:
             await self.load_hr_bit(regs)            
+
+    # Partial reconfiguration: fabric holds BASE bitfile, only chains changed by DELTA are shifted in again
+    # (chains are shift registers, so changed one is reloaded as a whole)
+    async def load_delta(self, DELTA, BASE):
+        p = Params(PARAMS_CFG)
+        delta = Delta_parser(DELTA)
+        delta.CheckParams(p)
+        base = Bitfile_parser(BASE)
+        
+        load_bit = (self.load_lb_bit, self.load_vr_bit, self.load_hr_bit)
+        for chain in delta.Changed():
+            for regs in delta.Words(base, chain):
+                await load_bit[chain](regs)
                   
@@ -60,7 +60,7 @@ async def run_test(dut):
     await loader.fabric_reset() 
     
     # Load FPGA firmware
-    await loader.load_fw("firmware.bit")
+    await loader.load_fw("firmware.ubit")
 
     # Launch FPGA fabric
     await loader.fabric_set()        